@@ -0,0 +1,106 @@
+"""
+Performance benchmarks.
+
+    python bench.py                      # deterministic fake model, runs anywhere
+    python bench.py --gguf model.gguf    # real llama.cpp model (repeat --gguf for a second swap target)
+    python bench.py --compare bench_results/bench_fake_....json
+    python bench.py ui                   # replay token streams through the chat textbox (starts Xvfb if needed)
+
+Results are saved as JSON under bench_results/ for regression comparison.
+"""
+import os
+import sys
+import json
+import argparse
+
+from src import benchmark
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load time, time-to-first-token, prefill and decode throughput.")
+    parser.add_argument("--gguf", action="append", default=[], help="GGUF file to benchmark instead of the fake model")
+    parser.add_argument("--scenario", action="append", choices=benchmark.SCENARIOS, help="run only these scenarios")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per scenario (default 5)")
+    parser.add_argument("--max-tokens", type=int, default=64, help="tokens generated per reply (default 64)")
+    parser.add_argument("--out", default=os.path.join(BASE_DIR, "bench_results"), help="directory for the JSON results")
+    parser.add_argument("--compare", help="earlier results file to compare p50s against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative p50 change reported by --compare")
+    # Fake model knobs
+    parser.add_argument("--fake-load-s", type=float, default=0.3)
+    parser.add_argument("--fake-prefill-tps", type=float, default=1500.0)
+    parser.add_argument("--fake-decode-tps", type=float, default=40.0)
+    return parser.parse_args(argv)
+
+
+def parse_ui_args(argv=None):
+    from src import ui_bench
+    parser = argparse.ArgumentParser(prog="bench.py ui", description="Per-token render cost, event-loop lag and dropped frames of the chat textbox.")
+    parser.add_argument("--stream", action="append", choices=ui_bench.STREAMS, help="synthetic streams to replay (default all)")
+    parser.add_argument("--replay", action="append", default=[], help="recorded stream: .json token list, .jsonl or plain text")
+    parser.add_argument("--rate", action="append", type=float, help="tokens/s, 0 for as fast as possible (default 150)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stream and rate (default 3)")
+    parser.add_argument("--long-tokens", type=int, default=ui_bench.LONG_TOKENS, help="size of the long stream")
+    parser.add_argument("--no-xvfb", action="store_true", help="never start Xvfb, fail without a display")
+    parser.add_argument("--out", default=os.path.join(BASE_DIR, "bench_results"), help="directory for the JSON results")
+    parser.add_argument("--compare", help="earlier results file to compare p50s against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative p50 change reported by --compare")
+    return parser.parse_args(argv)
+
+
+def report(results, args, metrics=benchmark.TABLE_METRICS):
+    benchmark.print_table(results, metrics)
+    path = benchmark.save_results(results, args.out)
+    print(f"[BENCH] Results saved to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        changes = benchmark.compare(baseline, results, threshold=args.threshold)
+        for line in changes or ["No p50 changed by more than {:.0%}.".format(args.threshold)]:
+            print(line)
+        if any(line.startswith("REGRESSION") for line in changes):
+            return 1
+    return 0
+
+
+def main_ui(argv=None):
+    from src import ui_bench
+    args = parse_ui_args(argv)
+    kinds = args.stream or ([] if args.replay else ui_bench.STREAMS)
+    streams = {k: v for k, v in ui_bench.default_streams(args.long_tokens).items() if k in kinds}
+    for path in args.replay:
+        streams[os.path.basename(path)] = ui_bench.load_stream(path)
+
+    results = ui_bench.run_ui_benchmark(
+        streams, rates=tuple(args.rate or (150,)), repeat=args.repeat, base_dir=BASE_DIR, use_xvfb=not args.no_xvfb,
+    )
+    return report(results, args, metrics=("token_render_us", "frame_p95_ms", "lag_p95_ms", "dropped_frames"))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["ui"]:
+        return main_ui(argv[1:])
+    args = parse_args(argv)
+    from src.backend import AIBackend
+
+    backend = AIBackend()
+    if args.gguf:
+        mode = "gguf"
+        benchmark.gguf_backend(backend, args.gguf)
+    else:
+        mode = "fake"
+        benchmark.fake_backend(backend, load_s=args.fake_load_s, prefill_tps=args.fake_prefill_tps, decode_tps=args.fake_decode_tps)
+
+    results = benchmark.run_benchmark(
+        backend, mode, scenarios=args.scenario or benchmark.SCENARIOS,
+        repeat=args.repeat, reply_tokens=args.max_tokens, base_dir=BASE_DIR,
+    )
+    backend.unload_model()
+    return report(results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,21 @@
 ﻿import customtkinter as ctk
 import threading
+import multiprocessing
 import os
 import sys
 import subprocess
-from src.backend import AIBackend
+from src.worker import InferenceClient
+from src.history import HistoryCompactor
+from src.memory_index import MemoryIndex
+from src.log_catalog import LogCatalog
+from src.extraction import DocumentExtractor
+from src.repo_ingest import RepoIngester
+from src.markdown_stream import MarkdownStream, TEXT, CODE_START
+from src.transcript import Transcript, USER, ASSISTANT, SYSTEM
+from src.scheduler import GenerationScheduler, GenerationRequest, INTERACTIVE, BACKGROUND
+from src.journal import SessionJournal, JOURNAL_EXT, ZSTD_JOURNAL_EXT, HAS_ZSTD, is_journal, read_log_text, records_to_text
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import filedialog
-import requests
-from bs4 import BeautifulSoup
-from pypdf import PdfReader
-from docx import Document
 import datetime
 from tkinter import messagebox
 
@@ -33,6 +40,35 @@ AI_BUBBLE = "#1A1C1E"
 # FONTS
 MAIN_FONT = "Terminal"
 
+# Fold old turns into the running summary once the app has been idle this long
+IDLE_COMPACT_MS = 3000
+# Journal writes mark the log catalog dirty; it is written to disk at most this often
+CATALOG_SAVE_MS = 2000
+
+LOG_FOLDERS = ["diary_logs", "personal_logs", "coder_logs", "random_logs", "context_logs"]
+# Chunks pulled from the active memory logs per message
+MEMORY_TOP_K = 4
+# Active logs up to this many characters in total go into the prompt whole, as a system prefix
+# every tab shares (and reuses from the KV prefix cache); larger ones are searched per message
+PINNED_MEMORY_CHARS = 6000
+# Token budget for a repository digest; the map-reduce summarizer handles anything past n_ctx
+REPO_DIGEST_TOKENS = 24000
+# Sidebar rows rendered at once; the widgets are reused across pages
+MEMORY_PAGE_SIZE = 30
+# Session journals are zstd-compressed when zstandard is installed and this is on
+COMPRESS_JOURNALS = False
+# Messages kept in each chat widget; older ones are paged back in when scrolled to the top
+TRANSCRIPT_WINDOW = 60
+TRANSCRIPT_PAGE = 20
+# Tab title -> chat role, for per-tab controls like STOP
+TAB_ROLES = {"Random Chat": "RANDOM", "Personal Chat": "PERSONAL", "Context": "CONTEXT", "Diary": "DIARY", "Coder": "CODER"}
+# Wall-clock limit for one chat reply (search, queueing and decoding included); None = no limit
+CHAT_TIMEOUT_S = 600
+# Speculative decoding choices in the model box -> backend "speculative" setting (opt-in)
+SPECULATIVE_MODES = {"Speculation: Off": None, "Speculation: Prompt Lookup": "lookup", "Speculation: Draft Model": "draft"}
+# Streamed tokens are drawn in batches at roughly 40 fps instead of one Tk event per token
+RENDER_INTERVAL_MS = 25
+
 class RoaApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -43,9 +79,13 @@ class RoaApp(ctk.CTk):
         else:
             self.base_dir = os.path.dirname(os.path.abspath(__file__))
 
-        self.backend = AIBackend()
+        # Models run in a separate process; this client mirrors the AIBackend interface
+        self.backend = InferenceClient()
         self.configure(fg_color=BG_COLOR)
-        self.is_generating = False
+        # One in-flight request per tab; tabs no longer block each other
+        self.scheduler = GenerationScheduler()
+        # Latest finished reply per tab, for the COPY buttons
+        self.last_responses = {}
         self.chat_history = {
             "RANDOM": [],
             "PERSONAL": [],
@@ -53,7 +93,18 @@ class RoaApp(ctk.CTk):
             "DIARY": [],
             "CODER": []
         }
-        self.current_ai_response = ""
+        # Older turns are summarized in the background instead of being dropped
+        self.compactor = HistoryCompactor(self.backend)
+        # Retrieval over saved logs: only relevant chunks go into the prompt
+        self.memory_index = MemoryIndex(os.path.join(self.base_dir, "memory_index"), embedder=self.backend.embed_texts)
+        # Parallel PDF extraction, cached by file content
+        self.extractor = DocumentExtractor(os.path.join(self.base_dir, "context_cache"))
+        # One append-only journal per role and day; a single writer thread keeps records in order
+        self.journals = {}
+        self._journals_lock = threading.Lock()
+        self.journal_writer = ThreadPoolExecutor(max_workers=1)
+        # GitHub archives, downloaded once per commit
+        self.repo_ingester = RepoIngester(os.path.join(self.base_dir, "repo_cache"))
 
         # Window Setup
         self.title("Roa.ai // AI Workbench")
@@ -86,10 +137,24 @@ class RoaApp(ctk.CTk):
             fg_color="#222426",
             button_color="#222426",
             button_hover_color="#303336",
-            dynamic_resizing=False
+            dynamic_resizing=False,
+            command=self.on_model_selected
         )
         self.model_menu.pack(padx=15, pady=5, fill="x")
 
+        # Drafted tokens are verified in one batch; pays off most on code review and refactors
+        self.spec_menu = ctk.CTkOptionMenu(
+            self.model_box,
+            values=list(SPECULATIVE_MODES.keys()),
+            font=(MAIN_FONT, 11),
+            dropdown_font=(MAIN_FONT, 11),
+            fg_color="#222426",
+            button_color="#222426",
+            button_hover_color="#303336",
+            dynamic_resizing=False
+        )
+        self.spec_menu.pack(padx=15, pady=5, fill="x")
+
         self.load_model_btn = ctk.CTkButton(
             self.model_box, 
             text="LOAD MODEL", 
@@ -99,7 +164,19 @@ class RoaApp(ctk.CTk):
             hover_color="#4FBBC8",
             command=lambda: self.start_model_load_thread(self.model_menu.get())
         )
-        self.load_model_btn.pack(padx=15, pady=(5, 15), fill="x")
+        self.load_model_btn.pack(padx=15, pady=5, fill="x")
+
+        self.calibrate_btn = ctk.CTkButton(
+            self.model_box,
+            text="CALIBRATE",
+            font=(MAIN_FONT, 11),
+            fg_color="#222426",
+            hover_color="#303336",
+            border_width=1,
+            border_color="#2A2D30",
+            command=lambda: self.start_calibration_thread(self.model_menu.get())
+        )
+        self.calibrate_btn.pack(padx=15, pady=(0, 15), fill="x")
 
         # Status and Controls Section
         self.status_box = ctk.CTkFrame(self.sidebar, fg_color=BOX_BG, corner_radius=10, border_width=1, border_color="#2A2D30")
@@ -119,6 +196,10 @@ class RoaApp(ctk.CTk):
         self.vpn_status_lbl = ctk.CTkLabel(self.status_box, text="Connection: EXPOSED", text_color="#EF4444", font=ctk.CTkFont(family=MAIN_FONT, size=11, weight="bold"))
         self.vpn_status_lbl.pack(padx=15, pady=(0, 5))
 
+        self.kv_persist_var = ctk.BooleanVar(value=False)
+        self.kv_persist_switch = ctk.CTkSwitch(self.status_box, text="Persist KV State", font=(MAIN_FONT, 12), variable=self.kv_persist_var, progress_color=ACCENT_COLOR)
+        self.kv_persist_switch.pack(padx=15, pady=5)
+
         self.stop_btn = ctk.CTkButton(self.status_box, text="STOP GENERATION", font=(MAIN_FONT, 12, "bold"), fg_color="#EF4444", hover_color="#DC2626", command=self.stop_generation)
         self.stop_btn.pack(padx=15, pady=(5, 15), fill="x")
         self.stop_btn.configure(state="disabled")
@@ -130,9 +211,31 @@ class RoaApp(ctk.CTk):
 
         self.mem_lbl = ctk.CTkLabel(self.memory_box, text="Load Memory", font=ctk.CTkFont(family=MAIN_FONT, size=14, weight="bold"))
         self.mem_lbl.pack(padx=15, pady=(10, 5), anchor="w")
+
+        self.mem_filter = ctk.CTkEntry(self.memory_box, placeholder_text="Filter logs...", font=(MAIN_FONT, 11), height=28, fg_color="#0D0F11", border_color="#2A2D30", corner_radius=6)
+        self.mem_filter.pack(padx=15, pady=(0, 5), fill="x")
+        self.mem_filter.bind("<KeyRelease>", self.on_memory_filter)
         
         self.memory_frame = ctk.CTkScrollableFrame(self.memory_box, fg_color="transparent")
         self.memory_frame.pack(padx=15, pady=5, fill="both", expand=True)
+
+        self.mem_pager = ctk.CTkFrame(self.memory_box, fg_color="transparent")
+        self.mem_pager.pack(padx=15, pady=0, fill="x")
+        ctk.CTkButton(self.mem_pager, text="<", font=(MAIN_FONT, 11), width=28, height=24, fg_color="#222426", command=lambda: self.change_memory_page(-1)).pack(side="left", padx=2)
+        ctk.CTkButton(self.mem_pager, text=">", font=(MAIN_FONT, 11), width=28, height=24, fg_color="#222426", command=lambda: self.change_memory_page(1)).pack(side="right", padx=2)
+        self.mem_page_lbl = ctk.CTkLabel(self.mem_pager, text="", text_color="gray", font=ctk.CTkFont(family=MAIN_FONT, size=10))
+        self.mem_page_lbl.pack(side="left", expand=True)
+
+        # Virtualized memory list state
+        self.log_catalog = LogCatalog(self.base_dir, LOG_FOLDERS)
+        self.memory_page = 0
+        self.memory_buttons = []
+        self.memory_shown = 0
+        self.memory_empty_lbl = ctk.CTkLabel(self.memory_frame, text="No logs indexed", text_color="gray", font=(MAIN_FONT, 12))
+        self._memory_filter_job = None
+        self._catalog_save_job = None
+        # Logs whose KV snapshot is being resumed on a worker thread
+        self._resuming = set()
         
         self.active_mem_lbl = ctk.CTkLabel(self.memory_box, text="Active Context: 0", text_color="gray", font=ctk.CTkFont(family=MAIN_FONT, size=11))
         self.active_mem_lbl.pack(padx=15, pady=0)
@@ -176,17 +279,24 @@ class RoaApp(ctk.CTk):
         self.after(500, lambda: self.start_model_load_thread("Dark Champion"))
         # Initial memory scan
         self.after(1000, self.refresh_memory_list)
+        self.after(1500, lambda: threading.Thread(target=self.sync_memory_index, daemon=True).start())
+        self.after(RENDER_INTERVAL_MS, self.flush_render_queue)
 
         # Clean exit handler
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def on_closing(self):
         """Handle resource cleanup on window close."""
-        self.is_generating = False
+        self.scheduler.stop()
         self.status_lbl.configure(text="Status: SHUTTING DOWN...", text_color="orange")
         # Run cleanup in a way that doesn't block the UI too much but ensures it happens
         try:
-            self.backend.unload_model()
+            self.backend.close()
+            self.extractor.shutdown()
+            # Let queued journal records reach the disk
+            self.journal_writer.shutdown(wait=True)
+            if self.log_catalog.dirty:
+                self.log_catalog.save()
         except:
             pass
         self.destroy()
@@ -196,60 +306,151 @@ class RoaApp(ctk.CTk):
         # Navigation no longer triggers automatic model loading
         pass
 
+    def sync_memory_index(self):
+        try:
+            self.memory_index.sync([os.path.join(self.base_dir, f) for f in LOG_FOLDERS])
+        except Exception as e:
+            print(f"[MEMORY] Index sync failed: {e}")
+
+    def split_memories(self):
+        """Returns (pinned memory text, paths to search). Activation order keeps the pinned block stable."""
+        pinned, searched, used = [], [], 0
+        for path, content in self.active_memories.items():
+            if used + len(content) <= PINNED_MEMORY_CHARS:
+                pinned.append(f"[{os.path.basename(path)}]\n{content}")
+                used += len(content)
+            else:
+                searched.append(path)
+        return "\n\n".join(pinned) or None, searched
+
+    def recall_memories(self, query, paths):
+        """Top-k chunks from the given active memory logs that are relevant to this message."""
+        for path in paths:
+            # No-op unless the file changed or the startup sync hasn't reached it yet
+            self.memory_index.update_file(path)
+        hits = self.memory_index.search(query, k=MEMORY_TOP_K, paths=paths)
+        if not hits:
+            return None
+        return "\n\n".join(f"[{os.path.basename(path)}]\n{text}" for path, text, _ in hits)
+
     def refresh_memory_list(self):
-        # Clear current frame
-        for child in self.memory_frame.winfo_children():
-            child.destroy()
-            
-        log_folders = ["diary_logs", "personal_logs", "coder_logs", "random_logs", "context_logs"]
-        files_found = False
-        
-        for folder in log_folders:
-            folder_path = os.path.join(self.base_dir, folder)
-            if os.path.exists(folder_path):
-                files = os.listdir(folder_path)
-                files.sort(reverse=True)
-                for f in files:
-                    if f.endswith(".txt"):
-                        files_found = True
-                        path = os.path.join(folder_path, f)
-                        is_active = path in self.active_memories
-                        
-                        btn = ctk.CTkButton(
-                            self.memory_frame, 
-                            text=f"{f} - {os.path.getsize(path)} bytes", 
-                            font=(MAIN_FONT, 11),
-                            anchor="w",
-                            fg_color="#222426" if not is_active else "#2E4A4D",
-                            hover_color="#303336" if not is_active else "#3A5C5F",
-                            border_width=1 if is_active else 0,
-                            border_color=ACCENT_COLOR,
-                            corner_radius=6,
-                            height=32,
-                            command=lambda p=path: self.toggle_memory(p)
-                        )
-                        btn.pack(fill="x", pady=3, padx=5)
-        
-        if not files_found:
-            ctk.CTkLabel(self.memory_frame, text="No logs indexed", text_color="gray", font=(MAIN_FONT, 12)).pack(pady=20)
+        # Only folders that changed since the last scan get re-listed
+        self.log_catalog.refresh()
+        self.render_memory_list()
+
+    def on_memory_filter(self, event=None):
+        # Debounce typing so we render once per pause, not per key
+        if self._memory_filter_job:
+            self.after_cancel(self._memory_filter_job)
+        self._memory_filter_job = self.after(200, self._apply_memory_filter)
+
+    def _apply_memory_filter(self):
+        self._memory_filter_job = None
+        self.memory_page = 0
+        self.render_memory_list()
+
+    def change_memory_page(self, step):
+        self.memory_page = max(0, self.memory_page + step)
+        self.render_memory_list()
+
+    def render_memory_list(self):
+        """Shows one page of the catalog, reconfiguring pooled buttons instead of recreating them."""
+        entries = self.log_catalog.entries(self.mem_filter.get())
+        pages = max(1, -(-len(entries) // MEMORY_PAGE_SIZE))
+        self.memory_page = min(self.memory_page, pages - 1)
+        start = self.memory_page * MEMORY_PAGE_SIZE
+        page_entries = entries[start:start + MEMORY_PAGE_SIZE]
+
+        while len(self.memory_buttons) < len(page_entries):
+            btn = ctk.CTkButton(
+                self.memory_frame, 
+                text="", 
+                font=(MAIN_FONT, 11),
+                anchor="w",
+                border_color=ACCENT_COLOR,
+                corner_radius=6,
+                height=32
+            )
+            self.memory_buttons.append(btn)
+
+        for i, (path, name, size) in enumerate(page_entries):
+            is_active = path in self.active_memories
+            self.memory_buttons[i].configure(
+                text=f"{name} - {size} bytes",
+                fg_color="#222426" if not is_active else "#2E4A4D",
+                hover_color="#303336" if not is_active else "#3A5C5F",
+                border_width=1 if is_active else 0,
+                command=lambda p=path: self.toggle_memory(p)
+            )
+
+        # Rows are always a prefix of the pool, so packing in order keeps them sorted
+        for i in range(self.memory_shown, len(page_entries)):
+            self.memory_buttons[i].pack(fill="x", pady=3, padx=5)
+        for i in range(len(page_entries), self.memory_shown):
+            self.memory_buttons[i].pack_forget()
+        self.memory_shown = len(page_entries)
+
+        if entries:
+            self.memory_empty_lbl.pack_forget()
+        else:
+            self.memory_empty_lbl.configure(text="No logs indexed" if not self.mem_filter.get() else "No matching logs")
+            self.memory_empty_lbl.pack(pady=20)
+
+        self.mem_page_lbl.configure(text=f"{self.memory_page + 1}/{pages} ({len(entries)} logs)")
 
     def toggle_memory(self, filepath):
+        if filepath in self._resuming:
+            # Its snapshot is still being loaded
+            return
         if filepath in self.active_memories:
             del self.active_memories[filepath]
         else:
             try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    self.active_memories[filepath] = f.read()
+                if is_journal(filepath):
+                    # Structured records: role-labelled text, and a fingerprint instead of hashing the log
+                    journal = self.journal_at(filepath)
+                    content = records_to_text(journal.records())
+                    identity = journal.fingerprint()
+                else:
+                    content = identity = read_log_text(filepath)
             except Exception as e:
                 messagebox.showerror("Memory Error", f"Could not read {filepath}: {e}")
+                content = None
+
+            if content is not None:
+                if self.kv_persist_var.get() and not self.scheduler.any_active():
+                    # A matching KV snapshot resumes the session instead of re-prefilling the whole log;
+                    # decompressing and unpickling it stays off the Tk thread
+                    self._resuming.add(filepath)
+                    threading.Thread(target=self._resume_task, args=(filepath, content, identity), daemon=True).start()
+                else:
+                    self.active_memories[filepath] = content
         
+        self.update_active_memories()
+
+    def _resume_task(self, filepath, content, identity):
+        resumed = self.backend.resume_session_state(filepath, identity)
+        self.after(0, self.finish_resume, filepath, content, resumed)
+
+    def finish_resume(self, filepath, content, resumed):
+        self._resuming.discard(filepath)
+        if resumed:
+            role, history, summary = resumed
+            self.chat_history[role] = history
+            self.compactor.restore(role, summary)
+            messagebox.showinfo("Session Resumed", f"{os.path.basename(filepath)} resumed into {role.capitalize()} from its saved state.")
+        else:
+            self.active_memories[filepath] = content
+        self.update_active_memories()
+
+    def update_active_memories(self):
         self.active_mem_lbl.configure(text=f"Active: {len(self.active_memories)} files", text_color="#00FF00" if self.active_memories else "gray")
-        self.refresh_memory_list()
+        self.render_memory_list()
 
     def clear_active_memory(self):
         self.active_memories = {}
         self.active_mem_lbl.configure(text="Active: 0 files", text_color="gray")
-        self.refresh_memory_list()
+        self.render_memory_list()
 
     def setup_random_chat_tab(self):
         self.tab_random.grid_columnconfigure(0, weight=1)
@@ -312,7 +513,7 @@ class RoaApp(ctk.CTk):
         self.context_top.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
         
         ctk.CTkButton(self.context_top, text="Upload PDF/DOC", font=(MAIN_FONT, 12), height=36, fg_color="#222426", hover_color="#303336", border_width=1, border_color="#2A2D30", command=self.upload_context_file).pack(side="left", padx=(15, 5), pady=15)
-        self.github_input = ctk.CTkEntry(self.context_top, placeholder_text="GitHub Project URL...", font=(MAIN_FONT, 13), height=36, fg_color="#0D0F11", border_color="#2A2D30", corner_radius=8)
+        self.github_input = ctk.CTkEntry(self.context_top, placeholder_text="GitHub URL or local repo folder...", font=(MAIN_FONT, 13), height=36, fg_color="#0D0F11", border_color="#2A2D30", corner_radius=8)
         self.github_input.pack(side="left", fill="x", expand=True, padx=5, pady=15)
         ctk.CTkButton(self.context_top, text="Summarize", font=(MAIN_FONT, 11, "bold"), height=36, fg_color=ACCENT_COLOR, text_color="black", hover_color="#4FBBC8", command=self.summarize_context).pack(side="left", padx=5, pady=15)
         ctk.CTkButton(self.context_top, text="COPY", font=(MAIN_FONT, 11), width=80, height=36, fg_color="#222426", hover_color="#303336", border_width=1, border_color="#2A2D30", command=self.copy_to_clipboard).pack(side="left", padx=5, pady=15)
@@ -387,8 +588,16 @@ class RoaApp(ctk.CTk):
         textbox.configure(state="normal")
         textbox.delete("1.0", "end")
         textbox.configure(state="disabled")
+        for name in textbox._textbox.mark_names():
+            if name.startswith("msg"):
+                textbox._textbox.mark_unset(name)
+        textbox.transcript.clear()
+        textbox.pending_reply = None
         if role and role in self.chat_history:
             self.chat_history[role] = []
+            self.compactor.reset(role)
+            # Cached KV state would still hold the cleared conversation
+            self.backend.discard_role_state(role)
 
     def configure_textbox_tags(self, textbox):
         try:
@@ -397,25 +606,92 @@ class RoaApp(ctk.CTk):
             tk_text.tag_config("role_ai", foreground="#10B981", font=(MAIN_FONT, 12, "bold"))
             tk_text.tag_config("system", foreground="#6B7280", font=(MAIN_FONT, 11, "italic"))
             tk_text.tag_config("bold", font=(MAIN_FONT, 12, "bold"))
+            tk_text.tag_config("italic", font=(MAIN_FONT, 12, "italic"))
             # Distinction: slightly lighter background for code blocks so they are visible
             tk_text.tag_config("code_block", background="#050607", foreground="#CED4DA", font=(MAIN_FONT, 11), spacing1=10, spacing3=10, lmargin1=30, lmargin2=30, rmargin=30)
+            tk_text.tag_config("code_inline", background="#050607", foreground=ACCENT_COLOR, font=(MAIN_FONT, 11))
+            tk_text.tag_config("heading", foreground="#FFFFFF", font=(MAIN_FONT, 14, "bold"), spacing1=6)
+            tk_text.tag_config("list_bullet", foreground=ACCENT_COLOR)
         except Exception:
             pass
-        except Exception:
-            textbox.tag_config("role_user", foreground=ACCENT_COLOR)
-            textbox.tag_config("role_ai", foreground="#10B981")
-            textbox.tag_config("system", foreground="#6B7280")
-            textbox.tag_config("bold", underline=True)
-            textbox.tag_config("code_block", background="#0D0F11")
         
         # Keep track of formatting state for this specific textbox
-        textbox.is_bold = False
-        textbox.is_code = False
-        textbox.markdown_buffer = ""
-        textbox.code_blocks = [] # List of strings containing code
+        textbox.markdown = MarkdownStream()
+        textbox.code_blocks = [] # One list of text parts per code block
         textbox.current_code_idx = -1
+        # The conversation lives here; the widget only renders a window over it
+        textbox.transcript = Transcript(TRANSCRIPT_WINDOW)
+        textbox.pending_reply = None
+        page_in = lambda e, t=textbox: self.after_idle(self.page_in_older, t)
+        for seq in ("<MouseWheel>", "<Button-4>", "<Prior>", "<Control-Home>"):
+            textbox._textbox.bind(seq, page_in, add="+")
+        if hasattr(textbox, "_y_scrollbar"):
+            textbox._y_scrollbar.bind("<ButtonRelease-1>", page_in)
+
+    def mark_message(self, textbox, index, position="end-1c"):
+        """Marks where message `index` starts so it can be trimmed or paged around later."""
+        name = f"msg{index}"
+        textbox._textbox.mark_set(name, position)
+        textbox._textbox.mark_gravity(name, "left")
+
+    def render_message(self, textbox, msg, index="end"):
+        """Draws one stored message the same way it looked when it streamed in."""
+        if msg["role"] == USER:
+            textbox.insert(index, "\u25cf You\n", "role_user")
+            textbox.insert(index, f"{msg['content']}\n", "text")
+            textbox.insert(index, f"{msg['time']}\n\n", "system")
+        elif msg["role"] == ASSISTANT:
+            textbox.insert(index, f"\u25cf {msg['model'] or 'Unknown Model'}\n", "role_ai")
+            md = MarkdownStream()
+            self.render_markdown(textbox, md.feed(msg["content"]) + md.close(), index)
+            textbox.insert(index, "\n\u25b6\n", "system")
+            textbox.insert(index, f"{msg['time']}\n\n", "system")
+        else:
+            textbox.insert(index, f"{msg['content']}\n")
+
+    def trim_transcript(self, textbox):
+        """Drops the oldest rendered messages once the widget holds more than TRANSCRIPT_WINDOW. The textbox must be in the normal state."""
+        old_first, new_first = textbox.transcript.trim()
+        if new_first == old_first:
+            return
+        tk_text = textbox._textbox
+        # Code headers are embedded frames; destroy them with their text
+        headers = [name for _, name, _ in tk_text.dump("1.0", f"msg{new_first}", window=True)]
+        tk_text.delete("1.0", f"msg{new_first}")
+        for name in headers:
+            try:
+                tk_text.nametowidget(name).destroy()
+            except Exception:
+                pass
+        for i in range(old_first, new_first):
+            tk_text.mark_unset(f"msg{i}")
+
+    def page_in_older(self, textbox):
+        transcript = textbox.transcript
+        tk_text = textbox._textbox
+        if transcript.first_rendered == 0 or tk_text.yview()[0] > 0.0:
+            return
+        start, end = transcript.page_back(TRANSCRIPT_PAGE)
+        # A reply may be streaming into a code block at the bottom right now
+        streaming_code_idx = textbox.current_code_idx
 
-    def create_code_header(self, textbox, lang="Code"):
+        textbox.configure(state="normal")
+        top = f"msg{end}"
+        tk_text.mark_gravity(top, "right")
+        tk_text.mark_set("page_in", "1.0")
+        tk_text.mark_gravity("page_in", "right")
+        for i in range(start, end):
+            self.mark_message(textbox, i, "page_in")
+            self.render_message(textbox, transcript.messages[i], "page_in")
+        tk_text.mark_unset("page_in")
+        tk_text.mark_gravity(top, "left")
+        textbox.configure(state="disabled")
+
+        textbox.current_code_idx = streaming_code_idx
+        # Keep the message that was on top in view
+        tk_text.yview(top)
+
+    def create_code_header(self, textbox, lang="Code", index="end"):
         """Inserts a header frame for code blocks with a copy button."""
         # Clean language name
         display_lang = lang.strip().upper() if lang.strip() else "CODE"
@@ -428,7 +704,7 @@ class RoaApp(ctk.CTk):
         lbl.pack(side="left", padx=15)
         
         idx = len(textbox.code_blocks)
-        textbox.code_blocks.append("")
+        textbox.code_blocks.append([])
         textbox.current_code_idx = idx
         
         btn = ctk.CTkButton(
@@ -445,17 +721,15 @@ class RoaApp(ctk.CTk):
         )
         btn.pack(side="right", padx=10)
         
-        textbox._textbox.configure(state="normal")
-        # Add some space before the header
-        textbox._textbox.insert("end", "\n")
+        # Caller (render_markdown) already has the textbox in the normal state
+        textbox._textbox.insert(index, "\n")
         
-        textbox._textbox.window_create("end", window=header_frame)
-        textbox._textbox.insert("end", "\n")
-        textbox._textbox.configure(state="disabled")
+        textbox._textbox.window_create(index, window=header_frame)
+        textbox._textbox.insert(index, "\n")
 
     def copy_specific_code(self, textbox, index):
         if 0 <= index < len(textbox.code_blocks):
-            code = textbox.code_blocks[index].strip()
+            code = "".join(textbox.code_blocks[index]).strip()
             if code:
                 try:
                     import pyperclip
@@ -465,20 +739,45 @@ class RoaApp(ctk.CTk):
                     self.clipboard_clear()
                     self.clipboard_append(code)
 
+    def on_model_selected(self, model_name):
+        # Warm the pick up in the background so LOAD MODEL only has to swap
+        if model_name != self.backend.current_model_name:
+            self.backend.prefetch_model(model_name, SPECULATIVE_MODES[self.spec_menu.get()])
+
     def start_model_load_thread(self, model_name):
         self.status_lbl.configure(text="Status: LOADING...", text_color="orange")
-        threading.Thread(target=self.load_model_task, args=(model_name,), daemon=True).start()
+        speculative = SPECULATIVE_MODES[self.spec_menu.get()]
+        threading.Thread(target=self.load_model_task, args=(model_name, speculative), daemon=True).start()
 
-    def load_model_task(self, model_name):
-        res = self.backend.load_model(model_name)
+    def load_model_task(self, model_name, speculative=None):
+        res = self.backend.load_model(model_name, speculative)
         if "Success" in res:
             self.after(0, lambda: self.status_lbl.configure(text=f"Status: ONLINE", text_color="#00FF00"))
         else:
             self.after(0, lambda: self.status_lbl.configure(text=f"Status: ERROR", text_color="#EF4444"))
             self.after(0, lambda: messagebox.showerror("Model Load Error", res))
 
+    def start_calibration_thread(self, model_name):
+        if self.scheduler.any_active():
+            messagebox.showwarning("Busy", "Wait for the current generation to finish before calibrating.")
+            return
+        self.calibrate_btn.configure(state="disabled")
+        self.status_lbl.configure(text="Status: CALIBRATING...", text_color="orange")
+        threading.Thread(target=self.calibration_task, args=(model_name,), daemon=True).start()
+
+    def calibration_task(self, model_name):
+        res = self.backend.calibrate_model(model_name)
+        self.after(0, lambda: self.calibrate_btn.configure(state="normal"))
+        if "Success" in res:
+            # Reload so the new profile takes effect
+            self.after(0, lambda: messagebox.showinfo("Calibration", res))
+            self.after(0, lambda: self.start_model_load_thread(self.backend.current_model_name or model_name))
+        else:
+            self.after(0, lambda: self.status_lbl.configure(text=f"Status: ERROR", text_color="#EF4444"))
+            self.after(0, lambda: messagebox.showerror("Calibration Error", res))
+
     def send_generic_msg(self, input_widget, display_widget, role):
-        if self.is_generating: return
+        if self.scheduler.is_busy(role): return
         
         # Check if model is loaded
         if "ONLINE" not in self.status_lbl.cget("text"):
@@ -498,8 +797,6 @@ class RoaApp(ctk.CTk):
         else:
             input_widget.delete(0, "end")
 
-        self.current_textarea = display_widget
-        
         # Determine system prompt based on role
         sys_prompt = "You are a helpful assistant."
         if role == "PERSONAL":
@@ -511,277 +808,227 @@ class RoaApp(ctk.CTk):
         elif role == "CONTEXT":
             sys_prompt = "You are a context analysis assistant. Summarize provided documents accurately."
 
-        self.prepare_generation(text, role)
-        web_access = self.web_access_var.get()
-        threading.Thread(target=self.generate_task, args=(text, sys_prompt, web_access, role), daemon=True).start()
+        request = GenerationRequest(role, display_widget, text, priority=INTERACTIVE, timeout_s=CHAT_TIMEOUT_S)
+        self.prepare_generation(request)
+        self.scheduler.submit(request, self.generate_task, sys_prompt, self.web_access_var.get())
 
     def upload_context_file(self):
         filepath = filedialog.askopenfilename(filetypes=[("Documents", "*.pdf *.docx *.txt")])
         if filepath:
-            self.context_display.configure(state="normal")
-            self.context_display.insert("end", f"\n[SYSTEM]: Loaded {os.path.basename(filepath)}. Click Summarize to process.\n")
+            textbox = self.context_display
+            msg_idx = textbox.transcript.append(SYSTEM, f"\n[SYSTEM]: Loaded {os.path.basename(filepath)}. Click Summarize to process.")
+            textbox.configure(state="normal")
+            self.mark_message(textbox, msg_idx)
+            self.render_message(textbox, textbox.transcript.messages[msg_idx])
+            self.trim_transcript(textbox)
             self.context_display.see("end")
             self.context_display.configure(state="disabled")
             self.pending_context_file = filepath
 
     def summarize_context(self):
+        if self.scheduler.is_busy("CONTEXT"): return
         github_link = self.github_input.get()
-        extracted_text = ""
         
         if github_link:
-            try:
-                response = requests.get(github_link)
-                soup = BeautifulSoup(response.text, 'html.parser')
-                extracted_text = soup.get_text()[:4000] # Limit to 4k chars for summary
-                prompt = f"Summarize the content of this GitHub repository: {github_link}\n\nContent:\n{extracted_text}"
-            except Exception as e:
-                self.after(0, self.append_token, f"\n[ERROR FETCHING GITHUB]: {e}")
-                return
+            # GitHub URL or local clone path; the digest can exceed n_ctx, so it is map-reduced too
+            prompt = f"Summarize the content of this GitHub repository: {github_link}"
+            request = GenerationRequest("CONTEXT", self.context_display, prompt, priority=BACKGROUND)
+            self.prepare_generation(request)
+            self.scheduler.submit(request, self.summarize_task, lambda: self.load_repository(request, github_link))
         elif hasattr(self, 'pending_context_file') and self.pending_context_file:
-            try:
-                if self.pending_context_file.endswith(".pdf"):
-                    reader = PdfReader(self.pending_context_file)
-                    for page in reader.pages:
-                        extracted_text += page.extract_text() + "\n"
-                elif self.pending_context_file.endswith(".docx"):
-                    doc = Document(self.pending_context_file)
-                    for para in doc.paragraphs:
-                        extracted_text += para.text + "\n"
-                elif self.pending_context_file.endswith(".txt"):
-                    with open(self.pending_context_file, "r", encoding="utf-8") as f:
-                        extracted_text = f.read()
-                
-                # Sanitize text: Remove non-printable characters that can crash llama.cpp
-                extracted_text = "".join(c for c in extracted_text if c.isprintable() or c in "\n\r\t")
-                extracted_text = extracted_text[:3000] # Slightly smaller chunk to ensure buffer
-                prompt = f"Summarize the content of the uploaded file: {os.path.basename(self.pending_context_file)}\n\nContent:\n{extracted_text}"
-            except Exception as e:
-                self.after(0, self.append_token, f"\n[ERROR READING FILE]: {e}")
-                return
-        else:
-            return
-
-        self.current_textarea = self.context_display
-        self.prepare_generation(prompt, "CONTEXT")
-        sys_prompt = "You are a context analysis assistant. Summarize provided documents accurately."
-        web_access = self.web_access_var.get()
-        threading.Thread(target=self.generate_task, args=(prompt, sys_prompt, web_access, "CONTEXT"), daemon=True).start()
+            # Documents of any size go through the chunked map-reduce summarizer
+            filepath = self.pending_context_file
+            prompt = f"Summarize the content of the uploaded file: {os.path.basename(filepath)}"
+            request = GenerationRequest("CONTEXT", self.context_display, prompt, priority=BACKGROUND)
+            self.prepare_generation(request)
+            self.scheduler.submit(request, self.summarize_task, lambda: self.load_file(request, filepath))
+
+    def report_extraction_progress(self, request, done, total):
+        # One UI update per batch of pages, not per page
+        if done == total or done % 25 == 0:
+            request.push(f"[SYSTEM]: Extracted {done}/{total} pages\n")
+
+    def load_file(self, request, filepath):
+        request.push("[SYSTEM]: Extracting text...\n")
+        progress = lambda done, total: self.report_extraction_progress(request, done, total)
+        return os.path.basename(filepath), self.extractor.extract(filepath, progress=progress)
+
+    def load_repository(self, request, link):
+        request.push("[SYSTEM]: Fetching repository...\n")
+        title, digest = self.repo_ingester.ingest(link, REPO_DIGEST_TOKENS, self.backend.count_tokens)
+        request.push(f"[SYSTEM]: Ingested {title}\n")
+        return title, digest
+
+    def summarize_task(self, request, load):
+        """load() returns (title, text) and runs on this thread, so downloads and extraction never block the UI."""
+        try:
+            title, text = load()
+            # Stop button cancels between tokens and between chunks
+            stream = self.backend.summarize_document(
+                text, title, should_stop=lambda: request.stopped, priority=request.priority, **request.limits()
+            )
+            for kind, token in stream:
+                if request.stopped:
+                    break
+                if kind == "final":
+                    request.response = token
+                else:
+                    request.push(token)
+            if request.stopped:
+                request.push("\n[INTERRUPTED]")
+        except Exception as e:
+            request.push(f"\n[ERROR READING CONTEXT]: {e}")
+        finally:
+            self.after(0, self.finalize_generation, request)
 
     def get_timestamp(self, format="%H:%M %p"):
         return datetime.datetime.now().strftime(format)
 
-    def prepare_generation(self, text, role):
-        self.is_generating = True
+    def prepare_generation(self, request):
         self.stop_btn.configure(state="normal")
-        self.current_textarea.configure(state="normal")
+        textbox = request.textbox
+        textbox.configure(state="normal")
         
         # Reset formatting states
-        self.current_textarea.is_bold = False
-        self.current_textarea.is_code = False
-        self.current_textarea.markdown_buffer = ""
+        textbox.markdown.reset()
 
         timestamp = self.get_timestamp()
         model_display = self.backend.current_model_name or "Unknown Model"
+        transcript = textbox.transcript
+
+        user_idx = transcript.append(USER, request.prompt, time=timestamp)
+        self.record_message(request.role, USER, request.prompt, time=timestamp)
+        self.mark_message(textbox, user_idx)
+        self.render_message(textbox, transcript.messages[user_idx])
+
+        # The reply is filled in by finalize_generation
+        textbox.pending_reply = transcript.append(ASSISTANT, model=model_display)
+        self.mark_message(textbox, textbox.pending_reply)
+        textbox.insert("end", f"\u25cf {model_display}\n", "role_ai")
+        self.trim_transcript(textbox)
         
-        self.current_textarea.insert("end", f"\u25cf You\n", "role_user")
-        self.current_textarea.insert("end", f"{text}\n", "text")
-        self.current_textarea.insert("end", f"{timestamp}\n\n", "system")
-        
-        self.current_textarea.insert("end", f"\u25cf {model_display}\n", "role_ai")
-        
-        self.current_textarea.see("end")
-        self.current_textarea.configure(state="disabled")
+        textbox.see("end")
+        textbox.configure(state="disabled")
 
-    def generate_task(self, prompt, sys_prompt=None, web_access=False, role="RANDOM"):
-        self.current_role = role
-        self.current_user_prompt = prompt
-        self.current_ai_response = ""
+    def generate_task(self, request, sys_prompt=None, web_access=False):
+        prompt, role = request.prompt, request.role
         
-        # Inject Active Memories into the prompt if any
-        if self.active_memories:
-            memory_context = "\n--- START OF LOADED MEMORY CONTEXT ---\n"
-            for path, content in self.active_memories.items():
-                memory_context += f"FILE: {os.path.basename(path)}\nCONTENT:\n{content}\n"
-            memory_context += "--- END OF LOADED MEMORY CONTEXT ---\n"
-            
-            prompt = f"REFERENCE CONTEXT FROM PREVIOUS SESSIONS:\n{memory_context}\n\nUSER REQUEST: {prompt}"
+        # Small active logs ride whole in the shared system prefix; of larger ones
+        # only the chunks that match this message are injected
+        memory, searched = self.split_memories()
+        recall = None
+        if searched:
+            try:
+                recall = self.recall_memories(prompt, searched)
+            except Exception as e:
+                print(f"[MEMORY] Recall failed: {e}")
 
-        # History is now always enabled for these roles
-        history = self.chat_history.get(role)
+        # History is now always enabled for these roles; older turns live in the summary
+        history = self.compactor.history_for(role, self.chat_history.get(role))
+        summary = self.compactor.summary_for(role)
 
         try:
-            for token in self.backend.generate_response(prompt, system_prompt=sys_prompt, web_access=web_access, history=history):
-                if not self.is_generating:
-                    self.after(0, self.append_token, "\n[INTERRUPTED]")
+            stream = self.backend.generate_response(
+                prompt, system_prompt=sys_prompt, web_access=web_access, history=history, role=role, memory=memory, summary=summary,
+                recall=recall, should_stop=lambda: request.stopped, priority=request.priority, **request.limits()
+            )
+            for token in stream:
+                if request.stopped:
                     break
-                self.after(0, self.append_token, token)
-                self.current_ai_response += token
+                request.push(token)
+                request.response += token
+            if request.stopped:
+                request.push("\n[INTERRUPTED]")
         except Exception as e:
-            self.after(0, self.append_token, f"\n[ERROR]: {e}")
+            request.push(f"\n[ERROR]: {e}")
         finally:
-            self.after(0, self.finalize_generation)
+            self.after(0, self.finalize_generation, request)
 
-    def append_token(self, token):
-        self.current_textarea.configure(state="normal")
-        self.current_textarea.markdown_buffer += token
-        
-        # Determine current tag
-        def get_tag():
-            if self.current_textarea.is_code: return "code_block"
-            if self.current_textarea.is_bold: return "bold"
-            return None
+    def flush_render_queue(self):
+        """Draws everything each tab queued since the last frame as one append per tab."""
+        try:
+            for request in self.scheduler.active():
+                if request.tokens:
+                    self.append_token(request.textbox, request.drain())
+        except Exception as e:
+            print(f"[RENDER] Flush failed: {e}")
+        finally:
+            self.after(RENDER_INTERVAL_MS, self.flush_render_queue)
 
-        # Process markers
-        while True:
-            # Find earliest marker (backticks or triple single quotes)
-            pos_bold = self.current_textarea.markdown_buffer.find("**")
-            # Support both backticks and triple quotes as some models confuse them
-            pos_code_back = self.current_textarea.markdown_buffer.find("```")
-            pos_code_quote = self.current_textarea.markdown_buffer.find("'''")
-            
-            # Use the earliest code marker
-            pos_code = -1
-            if pos_code_back != -1 and pos_code_quote != -1:
-                pos_code = min(pos_code_back, pos_code_quote)
-            elif pos_code_back != -1: pos_code = pos_code_back
-            elif pos_code_quote != -1: pos_code = pos_code_quote
-
-            # No markers at all?
-            if pos_bold == -1 and pos_code == -1:
-                break
-            
-            # Case 1: BOLD is first
-            if (pos_bold != -1) and (pos_code == -1 or pos_bold < pos_code):
-                text_before = self.current_textarea.markdown_buffer[:pos_bold]
-                self.current_textarea.insert("end", text_before, get_tag())
-                if self.current_textarea.is_code:
-                    self.current_textarea.code_blocks[self.current_textarea.current_code_idx] += text_before
-                
-                self.current_textarea.is_bold = not self.current_textarea.is_bold
-                self.current_textarea.markdown_buffer = self.current_textarea.markdown_buffer[pos_bold + 2:]
-                
-            # Case 2: CODE is first
-            elif pos_code != -1:
-                text_before = self.current_textarea.markdown_buffer[:pos_code]
-                self.current_textarea.insert("end", text_before, get_tag())
-                if self.current_textarea.is_code:
-                    self.current_textarea.code_blocks[self.current_textarea.current_code_idx] += text_before
-                
-                # Marker found. Now consume it.
-                # Check if we are STARTING or ENDING
-                if not self.current_textarea.is_code:
-                    # Look for end of the language line
-                    remaining = self.current_textarea.markdown_buffer[pos_code + 3:]
-                    if "\n" in remaining:
-                        newline_pos = remaining.find("\n")
-                        lang = remaining[:newline_pos].strip() or "Code"
-                        self.create_code_header(self.current_textarea, lang)
-                        self.current_textarea.is_code = True
-                        self.current_textarea.markdown_buffer = remaining[newline_pos + 1:]
-                    else:
-                        # We found ``` but no newline yet. 
-                        # To prevent premature flushing, we must KEEP the marker in the buffer.
-                        # We stop processing this buffer and wait for more tokens.
-                        break
-                else:
-                    # ENDING code block
-                    self.current_textarea.is_code = False
-                    self.current_textarea.markdown_buffer = self.current_textarea.markdown_buffer[pos_code + 3:]
+    def append_token(self, textbox, token):
+        textbox.configure(state="normal")
+        self.render_markdown(textbox, textbox.markdown.feed(token))
+        textbox.see("end")
+        textbox.configure(state="disabled")
+
+    def render_markdown(self, textbox, events, index="end"):
+        """Inserts tokenizer events at index; one insert per tag run. The textbox must be in the normal state."""
+        for kind, text, tag in events:
+            if kind == TEXT:
+                textbox.insert(index, text, tag)
+                if tag == "code_block" and textbox.current_code_idx >= 0:
+                    textbox.code_blocks[textbox.current_code_idx].append(text)
+            elif kind == CODE_START:
+                self.create_code_header(textbox, text, index)
             else:
-                # Safety break to prevent infinite loop if somehow indices are mismanaged
-                break
-                self.current_textarea.insert("end", text_before, get_tag())
-                if self.current_textarea.is_code:
-                    self.current_textarea.code_blocks[self.current_textarea.current_code_idx] += text_before
-                
-                # Marker found. Now consume it.
-                # Check if we are STARTING or ENDING
-                if not self.current_textarea.is_code:
-                    # Look for end of the language line
-                    remaining = self.current_textarea.markdown_buffer[pos_code + 3:]
-                    if "\n" in remaining:
-                        newline_pos = remaining.find("\n")
-                        lang = remaining[:newline_pos].strip() or "Code"
-                        self.create_code_header(self.current_textarea, lang)
-                        self.current_textarea.is_code = True
-                        self.current_textarea.markdown_buffer = remaining[newline_pos + 1:]
-                    else:
-                        # We found ``` but no newline yet. 
-                        # To prevent premature flushing, we must KEEP the marker in the buffer.
-                        # We stop processing this buffer and wait for more tokens.
-                        break
-                else:
-                    # ENDING code block
-                    self.current_textarea.is_code = False
-                    self.current_textarea.markdown_buffer = self.current_textarea.markdown_buffer[pos_code + 3:]
-
-        # Flush SAFE content (anything before the start of a potential marker)
-        buf = self.current_textarea.markdown_buffer
-        # Find index of any potential marker start
-        idx_b = buf.find("**")
-        idx_c = buf.find("```")
-        idx_q = buf.find("'''")
-        
-        indices = [i for i in [idx_b, idx_c, idx_q] if i != -1]
-        if not indices:
-            # Check for partials at the very end
-            safe_idx = len(buf)
-            if buf.endswith("*"): safe_idx -= 1
-            if buf.endswith("`") or buf.endswith("'"):
-                # Could be part of ``` or ''', find how many
-                count = 0
-                for char in reversed(buf):
-                    if char in ["`", "'"]: count += 1
-                    else: break
-                safe_idx = len(buf) - min(count, 3) # Keep up to 3 markers
-            
-            safe_text = buf[:safe_idx]
-            if safe_text:
-                self.current_textarea.insert("end", safe_text, get_tag())
-                if self.current_textarea.is_code:
-                    self.current_textarea.code_blocks[self.current_textarea.current_code_idx] += safe_text
-                self.current_textarea.markdown_buffer = buf[safe_idx:]
-        else:
-            # We have a full marker being processed by the 'while' loop above, 
-            # so we don't flush manually here; it should be handled there.
-            pass
+                textbox.current_code_idx = -1
+
+    def finalize_generation(self, request):
+        textbox = request.textbox
+        role = request.role
+        # Tokens still waiting for the next frame belong to this reply
+        if request.tokens:
+            self.append_token(textbox, request.drain())
+        # Flush held-back markers and auto-close code blocks left open by the model
+        textbox.configure(state="normal")
+        self.render_markdown(textbox, textbox.markdown.close())
 
-        self.current_textarea.see("end")
-        self.current_textarea.configure(state="disabled")
-
-    def finalize_generation(self):
-        # Flush remaining buffer
-        self.current_textarea.configure(state="normal")
-        if hasattr(self, 'current_textarea') and self.current_textarea.markdown_buffer:
-            tag = "code_block" if self.current_textarea.is_code else ("bold" if self.current_textarea.is_bold else None)
-            self.current_textarea.insert("end", self.current_textarea.markdown_buffer, tag)
-            if self.current_textarea.is_code:
-                self.current_textarea.code_blocks[self.current_textarea.current_code_idx] += self.current_textarea.markdown_buffer
-            self.current_textarea.markdown_buffer = ""
-        
-        # Auto-close code blocks if left open by model
-        if self.current_textarea.is_code:
-            self.current_textarea.is_code = False
-            
         # Ending timestamp and footer
-        self.current_textarea.insert("end", "\n\u25b6\n", "system")
+        textbox.insert("end", "\n\u25b6\n", "system")
         timestamp = self.get_timestamp()
-        self.current_textarea.insert("end", f"{timestamp}\n\n", "system")
+        textbox.insert("end", f"{timestamp}\n\n", "system")
+        if textbox.pending_reply is not None:
+            transcript = textbox.transcript
+            transcript.update(textbox.pending_reply, content=request.response, time=timestamp)
+            model = transcript.messages[textbox.pending_reply]["model"]
+            textbox.pending_reply = None
+            self.record_message(role, ASSISTANT, request.response, time=timestamp, model=model)
         
-        self.current_textarea.see("end")
-        self.current_textarea.configure(state="disabled")
+        textbox.see("end")
+        textbox.configure(state="disabled")
         
-        self.is_generating = False
-        self.stop_btn.configure(state="disabled")
-        if hasattr(self, 'current_role') and self.current_role in self.chat_history:
-            self.chat_history[self.current_role].append({"role": "user", "content": self.current_user_prompt})
-            self.chat_history[self.current_role].append({"role": "assistant", "content": self.current_ai_response})
-            # Trim history to last 10 turns to save context space
-            if len(self.chat_history[self.current_role]) > 20:
-                self.chat_history[self.current_role] = self.chat_history[self.current_role][-20:]
+        self.scheduler.finish(request)
+        self.last_responses[role] = request.response
+        if not self.scheduler.any_active():
+            self.stop_btn.configure(state="disabled")
+        if role in self.chat_history:
+            self.chat_history[role].append({"role": "user", "content": request.prompt})
+            self.chat_history[role].append({"role": "assistant", "content": request.response})
+            # Keep the last few turns verbatim, queue the rest for the running summary
+            self.compactor.overflow(role, self.chat_history)
+            self.after(IDLE_COMPACT_MS, self.compact_history_when_idle)
+
+    def compact_history_when_idle(self):
+        if self.scheduler.any_active():
+            self.after(IDLE_COMPACT_MS, self.compact_history_when_idle)
+            return
+        roles = self.compactor.needs_compaction()
+        if roles:
+            threading.Thread(target=self._compact_task, args=(roles,), daemon=True).start()
+
+    def _compact_task(self, roles):
+        for role in roles:
+            if self.scheduler.any_active():
+                break
+            self.compactor.compact(role)
 
     def stop_generation(self):
-        self.is_generating = False
+        # Stop the visible tab's reply; with nothing running there, stop everything
+        role = TAB_ROLES.get(self.tabview.get())
+        if role and self.scheduler.is_busy(role):
+            self.scheduler.stop(role)
+        else:
+            self.scheduler.stop()
 
     def toggle_vpn(self):
         if self.vpn_var.get():
@@ -814,33 +1061,78 @@ class RoaApp(ctk.CTk):
             else:
                 self.after(0, lambda: self.vpn_status_lbl.configure(text="Connection: SECURED", text_color="#10B981"))
 
-    def save_session(self, textbox, role):
-        log_dir = os.path.join(self.base_dir, f"{role.lower()}_logs")
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-            
+    def journal_path(self, role):
+        ext = ZSTD_JOURNAL_EXT if COMPRESS_JOURNALS and HAS_ZSTD else JOURNAL_EXT
         date_str = self.get_timestamp("%Y-%m-%d")
-        filename = f"{role.capitalize()}_{date_str}.txt"
-        filepath = os.path.join(log_dir, filename)
-        
+        return os.path.join(self.base_dir, f"{role.lower()}_logs", f"{role.capitalize()}_{date_str}{ext}")
+
+    def journal_at(self, path):
+        with self._journals_lock:
+            journal = self.journals.get(path)
+            if journal is None:
+                journal = self.journals[path] = SessionJournal(path)
+            return journal
+
+    def record_message(self, role, msg_role, content, **fields):
+        """Queues one finished message for today's journal of this role; the UI never waits on disk."""
+        self.journal_writer.submit(self._write_journal, self.journal_path(role), msg_role, content, fields)
+
+    def _write_journal(self, path, msg_role, content, fields):
         try:
-            content = textbox.get("1.0", "end-1c")
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(content)
+            self.journal_at(path).append(msg_role, content, **fields)
+            # Single stat on the writer thread, no folder rescan; the JSON is saved in batches
+            self.log_catalog.update_file(path, save=False)
+            self.after(0, self.on_journal_written)
+        except Exception as e:
+            print(f"[JOURNAL] Could not write {path}: {e}")
+
+    def on_journal_written(self):
+        self.render_memory_list()
+        if not self._catalog_save_job:
+            self._catalog_save_job = self.after(CATALOG_SAVE_MS, self._save_catalog)
+
+    def _save_catalog(self):
+        self._catalog_save_job = None
+        # Queued behind the journal writes, off the Tk thread
+        self.journal_writer.submit(self.log_catalog.save)
+
+    def save_session(self, textbox, role):
+        # Messages are journaled as they finish; the catalog entry is refreshed on the writer
+        # thread behind the queued writes, and the rest runs once that is done
+        filepath = self.journal_path(role)
+        pending = self.journal_writer.submit(self.log_catalog.update_file, filepath)
+        pending.add_done_callback(lambda _: self.after(0, self.finish_save_session, role, filepath))
+
+    def finish_save_session(self, role, filepath):
+        if not os.path.exists(filepath):
+            messagebox.showinfo("Session Saved", f"Nothing to save yet for {role.capitalize()}.")
+            return
+
+        try:
+            threading.Thread(target=self.memory_index.update_file, args=(filepath,), daemon=True).start()
+
+            if self.kv_persist_var.get():
+                history = self.compactor.history_for(role, self.chat_history.get(role))
+                summary = self.compactor.summary_for(role)
+                identity = self.journal_at(filepath).fingerprint()
+                threading.Thread(target=self._save_state_task, args=(filepath, role, history, identity, summary), daemon=True).start()
             
-            # Update sidebar list
-            self.refresh_memory_list()
+            self.render_memory_list()
             
             messagebox.showinfo("Session Saved", f"Saved to {filepath}")
         except Exception as e:
             messagebox.showerror("Save Error", f"Failed to save {role} session: {e}")
 
+    def _save_state_task(self, filepath, role, history, content, summary):
+        res = self.backend.save_session_state(filepath, role, history, content, summary)
+        print(f"[SESSION] {res}")
+
     def copy_to_clipboard(self, content=None):
         if not HAS_PYPERCLIP:
             messagebox.showwarning("Clipboard Error", "pyperclip is not installed. Please try: pip install pyperclip")
             return
         
-        target = content or self.current_ai_response
+        target = content or self.last_responses.get(TAB_ROLES.get(self.tabview.get()))
         if target:
             pyperclip.copy(target)
             # Find the active tab to show a tiny feedback label if we had one, 
@@ -858,5 +1150,7 @@ class RoaApp(ctk.CTk):
                 self.coder_input.insert(0, f"Review: {f.read()[:500]}...")
 
 if __name__ == "__main__":
+    # Needed for process pools inside the compiled EXE
+    multiprocessing.freeze_support()
     app = RoaApp()
     app.mainloop()
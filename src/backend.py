@@ -1,41 +1,140 @@
 ﻿import os
 import sys
-import gc
-from ddgs import DDGS
-from llama_cpp import Llama
+import time
+import threading
+import llama_cpp
+from llama_cpp import Llama, StoppingCriteriaList
+from src.model_pool import ModelPool
+from src import state_store
+from src import calibration
+from src import load_profiles
+from src.context_budget import ContextPlanner, Source
+from src.web_search import WebSearcher, SearchCache, DDGSProvider
+from src.web_fetch import PageFetcher
+from src.summarizer import DocumentSummarizer
+from src.scheduler import PriorityLock, INTERACTIVE, BACKGROUND
+from src.cancel import CancelToken, Cancelled, CANCELLED, run_cancellable
+from src.speculative import build_draft, DRAFT
+
+# Retrieval of log chunks runs on a small dedicated embedding model (not a chat model, so not in MODEL_FILES)
+EMBED_MODEL_FILE = "nomic-embed-text-v1.5.Q4_K_M.gguf"
+
+MODEL_FILES = {
+    "Dark Champion": "L3.2-8X3B-MOE-Dark-Champion-Inst-18.4B-uncen-ablit_D_AU-Q4_k_m.gguf",
+    "Coder Mode": "qwen2.5-coder-7b-instruct-q6_k.gguf"
+}
+
+# Small drafters sharing the target's tokenizer, for speculative decoding
+DRAFT_MODEL_FILES = {
+    "Coder Mode": "qwen2.5-coder-0.5b-instruct-q8_0.gguf"
+}
+
+# Per-model load profiles. q8_0 K/V halves the KV cache against f16 with no visible quality loss,
+# so the same memory holds twice the context; a quantized V cache requires flash attention.
+# rope_scaling ("yarn"/"linear") only kicks in when n_ctx exceeds the model's trained context.
+LOAD_PROFILES = {
+    # ~18.4B MoE, Q4_K_M is roughly 11GB: 15 layers keeps an 8GB card out of OOM
+    "Dark Champion": {"n_gpu_layers": 15, "n_ctx": 4096, "type_k": "q8_0", "type_v": "q8_0", "flash_attn": True},
+    # 7B, fits easily in 8GB
+    "Coder Mode": {"n_gpu_layers": -1, "n_ctx": 8192, "type_k": "q8_0", "type_v": "q8_0", "flash_attn": True, "rope_scaling": "yarn"},
+}
+DEFAULT_PROFILE = {"n_gpu_layers": -1, "n_ctx": 4096}
+# Share of available RAM a CPU-only model (weights + KV cache) may take
+CPU_RAM_SHARE = 0.8
+
+# User specific local paths
+LOCAL_MODEL_PATHS = {
+    "Dark Champion": r"C:\Users\Ritham\.lmstudio\models\DavidAU\Llama-3.2-8X3B-MOE-Dark-Champion-Instruct-uncensored-abliterated-18.4B-GGUF\L3.2-8X3B-MOE-Dark-Champion-Inst-18.4B-uncen-ablit_D_AU-Q4_k_m.gguf",
+    "Coder Mode": r"C:\Users\Ritham\.lmstudio\models\Qwen\Qwen2.5-Coder-7B-Instruct-GGUF\qwen2.5-coder-7b-instruct-q6_k.gguf"
+}
+
+# Upper bound for a single answer; the planner may leave less on small windows
+REPLY_TOKENS = 2048
+
+# Relative weight of each prompt source when the window is tight
+BUDGET_PRIORITIES = {
+    "input": 3.0,
+    "history": 1.0,
+    "memory": 0.8,
+    "recall": 0.8,
+    "web": 0.8,
+}
+
+# Web search results are reused for this long
+SEARCH_CACHE_TTL = 6 * 3600
+SEARCH_CACHE_ENTRIES = 500
+# Result pages fetched in full, and how long we wait for them
+FETCH_TOP_N = 3
+FETCH_BUDGET_S = 2.0
+
+# RAM the model pool may keep resident (32GB machine, leave room for OS/UI)
+MODEL_POOL_BUDGET = 24 * 1024 ** 3
+# VRAM the offloaded layers may take (8GB card, leave room for the desktop and compute spikes)
+MODEL_POOL_VRAM_BUDGET = 7 * 1024 ** 3
+
+
+def app_base_path():
+    # Support for compiled EXE
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    # Project root
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 class AIBackend:
-    def __init__(self):
+    def __init__(self, pool_budget_bytes=MODEL_POOL_BUDGET, search_provider=None, pool_vram_bytes=MODEL_POOL_VRAM_BUDGET):
         self.llm = None
         self.current_model_name = None
+        # Recently used models stay resident; each entry carries its own KV caches
+        self.pool = ModelPool(self.create_llm, budget_bytes=pool_budget_bytes,
+                              vram_budget_bytes=pool_vram_bytes if calibration.gpu_offload_supported() else None)
+        self.entry = None
+        self.last_budget_report = None
+        self.last_speculative_report = None
+        # llama.cpp contexts are not thread-safe: requests take turns, chat turns ahead of summaries
+        self.llm_lock = PriorityLock()
+        # Lazily loaded embedding model for the memory index (False = not available)
+        self.embedder = None
+        self.embed_lock = threading.Lock()
+        # Cached, coalesced web search; pass a LocalSearchProvider to run offline
+        cache_path = os.path.join(app_base_path(), "search_cache", "search_cache.json")
+        self.searcher = WebSearcher(
+            search_provider or DDGSProvider(),
+            SearchCache(cache_path, ttl_seconds=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_ENTRIES)
+        )
+        self.fetcher = PageFetcher()
+        # ctypes callback installed on the context during prefill; kept here so it isn't collected
+        self._abort_cb = None
 
-    def load_model(self, model_choice):
-        """
-        Manages VRAM and RAM for different model sizes. 
-        Targeting RTX 5060 (8GB VRAM) + 32GB RAM.
-        """
-        if self.llm:
-            print(f"[BACKEND] Unloading {self.current_model_name}...")
-            del self.llm
-            self.llm = None
-            gc.collect()
+    # Per-role snapshots and the shared prefix trie belong to the active model
+    @property
+    def role_states(self):
+        return self.entry.role_states if self.entry else None
 
-        # Model Paths - Support for compiled EXE
-        if getattr(sys, 'frozen', False):
-            base_path = os.path.dirname(sys.executable)
-        else:
-            # Look for models in the project root
-            base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    @property
+    def prefix_cache(self):
+        return self.entry.prefix_cache if self.entry else None
 
-        models = {
-            "Dark Champion": "L3.2-8X3B-MOE-Dark-Champion-Inst-18.4B-uncen-ablit_D_AU-Q4_k_m.gguf",
-            "Coder Mode": "qwen2.5-coder-7b-instruct-q6_k.gguf"
-        }
+    @property
+    def active_role(self):
+        return self.entry.active_role if self.entry else None
+
+    @active_role.setter
+    def active_role(self, role):
+        if self.entry:
+            self.entry.active_role = role
 
-        filename = models.get(model_choice)
+    def resolve_model_path(self, model_choice):
+        """Returns (path, error)."""
+        filename = MODEL_FILES.get(model_choice)
         if not filename:
-            return f"Error: Unknown model choice: {model_choice}"
+            return None, f"Error: Unknown model choice: {model_choice}"
+        return self.find_model_file(filename, LOCAL_MODEL_PATHS.get(model_choice), model_choice)
 
+    def find_model_file(self, filename, local_path=None, label=None):
+        """Returns (path, error)."""
+        # Look for models next to the EXE / in the project root
+        base_path = app_base_path()
         # Try multiple potential paths
         search_paths = [
             os.path.join(base_path, "models", filename),
@@ -43,83 +142,267 @@ class AIBackend:
             os.path.join(base_path, filename),
             os.path.join(os.getcwd(), filename)
         ]
+        if local_path:
+            search_paths.append(local_path)
 
-        # User specific local paths
-        if model_choice == "Dark Champion":
-            search_paths.append(r"C:\Users\Ritham\.lmstudio\models\DavidAU\Llama-3.2-8X3B-MOE-Dark-Champion-Instruct-uncensored-abliterated-18.4B-GGUF\L3.2-8X3B-MOE-Dark-Champion-Inst-18.4B-uncen-ablit_D_AU-Q4_k_m.gguf")
-        elif model_choice == "Coder Mode":
-            search_paths.append(r"C:\Users\Ritham\.lmstudio\models\Qwen\Qwen2.5-Coder-7B-Instruct-GGUF\qwen2.5-coder-7b-instruct-q6_k.gguf")
-
-        path = None
         for p in search_paths:
             if os.path.exists(p):
-                path = p
-                break
-
-        if not path:
-            tried_paths = "\n".join(search_paths)
-            return f"Error: Model file not found for {model_choice}. Tried:\n{tried_paths}"
-
-        print(f"[BACKEND] Loading model from: {path}")
-
-        # GPU Tuning (RTX 5060 optimization)
-        # Dark Champion is ~18.4B MoE, Q4_K_M is roughly 11GB. 
-        # Coder is 7B, Q5_K_M is roughly 5.5GB.
-        if model_choice == "Dark Champion":
-            gpu_layers = 15 # Reduced from 20 to prevent VRAM OOM on 8GB cards
-            ctx_size = 2048 # Reduced from 4096 for MoE stability
-        elif model_choice == "Coder Mode":
-            gpu_layers = -1 # Fits easily in 8GB
-            ctx_size = 4096 # Reduced from 8192 for stability
-        else:
-            gpu_layers = -1
-            ctx_size = 4096
+                return p, None
 
+        tried_paths = "\n".join(search_paths)
+        return None, f"Error: Model file not found for {label or filename}. Tried:\n{tried_paths}"
+
+    def create_llm(self, speculative=None, draft_path=None, **load_kwargs):
+        """Pool loader: a Llama, with a drafter attached when speculative decoding is on."""
+        draft = build_draft(speculative, load_kwargs.get("n_gpu_layers", 0), load_kwargs.get("n_ctx", 4096),
+                            draft_path=draft_path, n_threads=load_kwargs.get("n_threads"))
+        if speculative and draft is None:
+            print(f"[SPEC] {speculative} drafting unavailable, decoding normally.")
+        if draft is not None:
+            # llama-cpp-python then keeps logits for every position (n_ctx x n_vocab floats)
+            load_kwargs["draft_model"] = draft
+        return Llama(**load_kwargs)
+
+    @staticmethod
+    def profile_for(model_choice):
+        return load_profiles.normalize(dict(DEFAULT_PROFILE, **LOAD_PROFILES.get(model_choice, {})))
+
+    @staticmethod
+    def model_dims(path):
         try:
-            # Thread optimization to prevent system-wide lag
-            import multiprocessing
-            cpu_count = multiprocessing.cpu_count()
-            # Use most cores but leave some for the OS/UI to prevent freezing
-            threads = max(1, cpu_count // 2) 
-
-            self.llm = Llama(
-                model_path=path,
-                n_gpu_layers=gpu_layers,
-                n_ctx=ctx_size,
-                n_batch=512,
-                n_threads=threads,
-                verbose=True
-            )
-            self.current_model_name = model_choice
+            return load_profiles.model_dims(path)
+        except Exception as e:
+            print(f"[PROFILE] Could not read GGUF header of {os.path.basename(path)}: {e}")
+            return None
+
+    @staticmethod
+    def cpu_only(n_gpu_layers):
+        return n_gpu_layers == 0 or not calibration.gpu_offload_supported()
+
+    def load_kwargs_for(self, model_choice, path=None, speculative=None):
+        # GPU Tuning (RTX 5060 optimization) lives in LOAD_PROFILES
+        load_profile = self.profile_for(model_choice)
+        gpu_layers = load_profile["n_gpu_layers"]
+        ctx_size = load_profile["n_ctx"]
+
+        # Thread optimization to prevent system-wide lag
+        import multiprocessing
+        cpu_count = multiprocessing.cpu_count()
+        # Use most cores but leave some for the OS/UI to prevent freezing
+        threads = max(1, cpu_count // 2) 
+
+        settings = {
+            "n_gpu_layers": gpu_layers,
+            "n_ctx": ctx_size,
+            "n_batch": 512,
+            "n_threads": threads,
+            "verbose": True
+        }
+
+        # A calibrated profile for this host beats the hand-tuned guesses above
+        profile = calibration.load_profile(app_base_path(), path) if path else None
+        if profile:
+            for key in calibration.PROFILE_KEYS:
+                if key in profile:
+                    settings[key] = profile[key]
+
+        # KV quantization, flash attention and RoPE scaling for the final n_ctx
+        dims = self.model_dims(path) if path else None
+        if dims and self.cpu_only(settings["n_gpu_layers"]):
+            # Weights and KV cache both live in RAM: shrink the window before llama.cpp runs out
+            # Total, not currently free, RAM: the result must not change while the model is resident
+            budget = calibration.total_ram_bytes() * CPU_RAM_SHARE
+            n_ctx, kv = load_profiles.fit_context(dims, settings["n_ctx"], load_profile, budget)
+            if n_ctx < settings["n_ctx"]:
+                print(f"[PROFILE] {model_choice}: n_ctx {settings['n_ctx']} does not fit in RAM, using {n_ctx}.")
+                settings["n_ctx"] = n_ctx
+        settings.update(load_profiles.llama_kwargs(load_profile, settings["n_ctx"], dims))
+
+        # Opt-in; part of the settings so the pool reloads when it changes
+        if speculative:
+            settings["speculative"] = speculative
+            if speculative == DRAFT and model_choice in DRAFT_MODEL_FILES:
+                settings["draft_path"], _ = self.find_model_file(DRAFT_MODEL_FILES[model_choice])
+        return settings
+
+    def calibrate_model(self, model_choice, progress=print):
+        """Probes candidate settings for this machine and saves the best profile."""
+        path, error = self.resolve_model_path(model_choice)
+        if error:
+            return error
+        defaults = self.load_kwargs_for(model_choice, path)
+        # Probes run with the profile's KV settings so their peak RSS is the real one
+        fixed = {k: defaults[k] for k in load_profiles.PROFILE_LOAD_KEYS if k in defaults}
+        try:
+            profile = calibration.calibrate(path, defaults, progress=progress, fixed=fixed)
+        except Exception as e:
+            return f"Error: Calibration failed: {e}"
+        if not profile:
+            return "Error: No probe completed successfully."
+        calibration.save_profile(app_base_path(), path, profile)
+        summary = ", ".join(f"{k}={profile[k]}" for k in calibration.PROFILE_KEYS)
+        return f"Success: {model_choice} calibrated ({summary}, {profile['decode_tps']} tok/s decode)."
+
+    def check_load_profiles(self, progress=print):
+        """
+        Startup self-check: reads each model's GGUF header and reports the KV cache its
+        profile will allocate, without loading any weights. Returns {model: estimate}.
+        """
+        report = {}
+        ram = calibration.available_ram_bytes()
+        for model_choice in MODEL_FILES:
+            path, error = self.resolve_model_path(model_choice)
+            dims = self.model_dims(path) if not error else None
+            if not dims:
+                continue
+            settings = self.load_kwargs_for(model_choice, path)
+            load_profile = self.profile_for(model_choice)
+            kv = load_profiles.kv_cache_bytes(dims, settings["n_ctx"], load_profile["type_k"], load_profile["type_v"])
+            in_ram = dims["file_bytes"] + kv if self.cpu_only(settings["n_gpu_layers"]) else kv
+            report[model_choice] = {"n_ctx": settings["n_ctx"], "kv_bytes": kv, "ram_bytes": in_ram}
+            note = "" if not ram or in_ram <= ram else f" -- exceeds the {ram / 1024 ** 3:.1f} GB available"
+            progress(f"[PROFILE] {load_profiles.describe(model_choice, dims, settings['n_ctx'], load_profile)}{note}")
+        return report
+
+    def load_model(self, model_choice, speculative=None):
+        """
+        Manages VRAM and RAM for different model sizes. 
+        Targeting RTX 5060 (8GB VRAM) + 32GB RAM.
+        Models stay resident in the pool, so switching back to a warm one is instant.
+        speculative: None, "lookup" (prompt n-gram drafts) or "draft" (small draft GGUF).
+        """
+        path, error = self.resolve_model_path(model_choice)
+        if error:
+            return error
+
+        try:
+            keep = {self.current_model_name} if self.current_model_name else set()
+            load_kwargs = self.load_kwargs_for(model_choice, path, speculative)
+            # Making VRAM room may evict the current model: wait for requests decoding on it
+            with self.llm_lock:
+                entry = self.pool.acquire(model_choice, path, load_kwargs, keep=keep)
+                self.entry = entry
+                self.llm = entry.llm
+                self.current_model_name = model_choice
+            if getattr(self.llm, "draft_model", None) is not None:
+                return f"Success: {model_choice} loaded with {speculative} speculative decoding."
             return f"Success: {model_choice} loaded."
         except Exception as e:
             return f"Critical Load Error: {str(e)}"
 
+    def prefetch_model(self, model_choice, speculative=None):
+        """Starts loading a model in the background ahead of the swap."""
+        path, error = self.resolve_model_path(model_choice)
+        if error:
+            return False
+        keep = {self.current_model_name} if self.current_model_name else set()
+        return self.pool.prefetch(model_choice, path, self.load_kwargs_for(model_choice, path, speculative), keep=keep)
+
     def unload_model(self):
-        """Cleanly unloads the model and frees memory."""
+        """Cleanly unloads every resident model and frees memory."""
         if self.llm:
             print(f"[BACKEND] Unloading {self.current_model_name}...")
-            # Explicitly call __del__ or just null it
-            del self.llm
             self.llm = None
-            gc.collect()
+            self.entry = None
+            self.current_model_name = None
+            self.pool.clear()
             return True
         return False
 
+    def restore_role_state(self, role):
+        """Swaps the tab's cached KV state back in so only new tokens get evaluated."""
+        if not self.llm or not role or role == self.active_role:
+            return
+        state = self.role_states.get(role)
+        if state is not None:
+            try:
+                self.llm.load_state(state)
+                print(f"[CACHE] Restored {role} state ({state.n_tokens} tokens).")
+            except Exception as e:
+                print(f"[CACHE] Restore failed for {role}: {e}")
+                self.role_states.discard(role)
+        self.active_role = role
+
+    def snapshot_role_state(self, role):
+        if not self.llm or not role or self.entry.speculative:
+            return
+        try:
+            self.role_states.put(role, self.llm.save_state())
+            self.active_role = role
+        except Exception as e:
+            print(f"[CACHE] Snapshot failed for {role}: {e}")
+
+    def discard_role_state(self, role):
+        if not self.entry:
+            return
+        self.role_states.discard(role)
+        if self.active_role == role:
+            self.active_role = None
+
+    def save_session_state(self, log_path, role, history, log_text, summary=None):
+        """Persists the role's KV snapshot next to its saved log for instant resume."""
+        if not self.llm:
+            return "Error: No model active."
+        state = self.role_states.get(role)
+        if state is None:
+            return f"Error: No cached state for {role} yet."
+        path = state_store.state_path_for(log_path)
+        profile = load_profiles.profile_tag(self.entry.load_kwargs)
+        try:
+            state_store.save_state_file(path, state, self.current_model_name, self.llm.n_ctx(), role, history, log_text, summary, profile)
+            print(f"[CACHE] Saved {role} state to {path}")
+            return f"Success: State saved to {path}"
+        except Exception as e:
+            return f"Error: Could not save state: {e}"
+
+    def resume_session_state(self, log_path, log_text=None):
+        """
+        Loads a persisted KV snapshot into its role's cache.
+        Returns (role, history, summary) or None if missing, stale or built for another model or load profile.
+        Decompressing and unpickling take a while: call it from a worker thread.
+        """
+        # A swap may replace self.entry meanwhile; the state then lands in the old, matching entry
+        entry = self.entry
+        if not entry or entry.speculative:
+            return None
+        path = state_store.state_path_for(log_path)
+        profile = load_profiles.profile_tag(entry.load_kwargs)
+        try:
+            state, meta = state_store.load_state_file(path, entry.name, entry.llm.n_ctx(), log_text, profile)
+        except Exception as e:
+            print(f"[CACHE] Could not read {path}: {e}")
+            return None
+        if state is None:
+            if meta != "no snapshot":
+                print(f"[CACHE] Rejected {path}: {meta}")
+            return None
+
+        role = meta["role"]
+        entry.role_states.put(role, state)
+        if entry.active_role == role:
+            # Force the next turn to load the resumed state
+            entry.active_role = None
+        print(f"[CACHE] Resumed {role} from {path} ({state.n_tokens} tokens).")
+        return role, meta.get("history") or [], meta.get("summary")
+
     def web_search_and_scrape(self, query):
         """Performs a web search and returns a condensed context."""
         print(f"[BACKEND] Searching the web for: {query}")
         search_results = ""
         try:
-            with DDGS() as ddgs:
-                # Use a specific region/safesearch if needed, but text() is basic
-                results = list(ddgs.text(query, max_results=5))
-                if not results:
-                    print("[BACKEND] No results found.")
-                    return "No recent information found."
-                
-                for i, r in enumerate(results):
-                    search_results += f"[{i+1}] {r['title']}\nSnippet: {r['body']}\nSource: {r['href']}\n\n"
+            results = self.searcher.search(query, max_results=5)
+            if not results:
+                print("[BACKEND] No results found.")
+                return "No recent information found."
+            
+            # Pull the article text of the top hits in parallel; slow pages are skipped
+            pages = self.fetcher.fetch_and_extract(results, top_n=FETCH_TOP_N, budget_s=FETCH_BUDGET_S)
+
+            for i, r in enumerate(results):
+                search_results += f"[{i+1}] {r['title']}\nSnippet: {r['body']}\nSource: {r['href']}\n"
+                if r.get('href') in pages:
+                    search_results += f"Content:\n{pages[r['href']]}\n"
+                search_results += "\n"
             
             print(f"[BACKEND] Found {len(results)} results.")
             return search_results
@@ -127,25 +410,169 @@ class AIBackend:
             print(f"[BACKEND] Search Error: {e}")
             return f"Web Search Error: {str(e)}"
 
-    def generate_response(self, user_input, system_prompt=None, web_access=False, history=None):
+    def build_messages(self, sys_prompt, user_input, memory=None, history=None, summary=None):
+        """
+        Fixed layout so the stable parts form a reusable token prefix:
+        system (memory block first, then role instructions, then the role's
+        running summary) -> recent history -> new turn.
+        The memory block is identical in every tab, so its KV state is shared.
+        """
+        if memory:
+            system_content = f"REFERENCE CONTEXT FROM PREVIOUS SESSIONS:\n{memory}\n\n{sys_prompt}"
+        else:
+            system_content = sys_prompt
+        if summary:
+            system_content += f"\n\nSUMMARY OF THE EARLIER CONVERSATION:\n{summary}"
+
+        messages = [{"role": "system", "content": system_content}]
+        if history:
+            messages.extend(history)
+        messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def embed_texts(self, texts):
+        """Embeds texts with llama.cpp's embedding mode. Returns [None, ...] if no embedding model is installed."""
+        with self.embed_lock:
+            if self.embedder is None:
+                path, error = self.find_model_file(EMBED_MODEL_FILE, label="the embedding model")
+                if error:
+                    print("[MEMORY] No embedding model found, using keyword search only.")
+                    self.embedder = False
+                else:
+                    try:
+                        self.embedder = Llama(model_path=path, embedding=True, n_ctx=2048, n_batch=2048, n_gpu_layers=0, verbose=False)
+                    except Exception as e:
+                        print(f"[MEMORY] Could not load embedding model: {e}")
+                        self.embedder = False
+            if not self.embedder:
+                return [None] * len(texts)
+            vectors = self.embedder.embed(texts, normalize=True, truncate=True)
+            return [[round(x, 5) for x in v] for v in vectors]
+
+    def count_tokens(self, text):
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=False))
+
+    @staticmethod
+    def format_web_turn(web_results, user_input):
+        return (
+            f"You have access to current real-time data from the web.\n"
+            f"TODAY'S DATE: January 10, 2026\n\n"
+            f"WEB SEARCH RESULTS:\n{web_results}\n"
+            f"INSTRUCTION: Use the search results above to answer the user's request. "
+            f"Ignore your knowledge cutoff if the search results provide newer information.\n\n"
+            f"USER REQUEST: {user_input}"
+        )
+
+    def summarize_history(self, previous_summary, messages):
+        """Folds older chat turns into a short running summary."""
+        if not self.llm or not messages:
+            return None
+
+        transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+        if previous_summary:
+            request = f"EXISTING SUMMARY:\n{previous_summary}\n\nNEW TURNS:\n{transcript}\n\nUpdate the summary with the new turns."
+        else:
+            request = f"CONVERSATION:\n{transcript}\n\nSummarize this conversation."
+
+        messages = [
+            {"role": "system", "content": "You compress chat history. Keep names, facts, decisions, open questions and the user's feelings. Answer with the summary only, under 200 words."},
+            {"role": "user", "content": request}
+        ]
+        with self.llm_lock.hold(BACKGROUND):
+            try:
+                res = self.llm.create_chat_completion(messages=messages, temperature=0.2, max_tokens=320)
+                return res["choices"][0]["message"]["content"].strip()
+            except Exception as e:
+                print(f"[HISTORY] Summary failed: {e}")
+                return None
+            finally:
+                # The KV cache now holds the summary prompt, force a role restore next turn
+                self.active_role = None
+
+    @staticmethod
+    def stop_criteria(should_stop):
+        """Checks should_stop after every sampled token instead of after every streamed chunk."""
+        check = getattr(should_stop, "stopping_criterion", None) or (lambda input_ids, logits: should_stop())
+        return StoppingCriteriaList([check])
+
+    def set_prefill_abort(self, cancel):
+        """
+        Lets llama_decode bail out of a long prefill when cancel fires; None removes the hook.
+        The callback runs between graph nodes, so it is only installed until the first token.
+        """
+        ctx = getattr(getattr(self.llm, "_ctx", None), "ctx", None)
+        if ctx is None or not hasattr(llama_cpp, "llama_set_abort_callback") or not hasattr(llama_cpp, "ggml_abort_callback"):
+            return
+        try:
+            if cancel is None:
+                llama_cpp.llama_set_abort_callback(ctx, llama_cpp.ggml_abort_callback(0), None)
+                self._abort_cb = None
+            else:
+                self._abort_cb = llama_cpp.ggml_abort_callback(lambda _: cancel.cancelled)
+                llama_cpp.llama_set_abort_callback(ctx, self._abort_cb, None)
+        except Exception as e:
+            print(f"[BACKEND] Abort callback unavailable: {e}")
+
+    @staticmethod
+    def format_recall_turn(recall, user_input):
+        return f"RELEVANT NOTES FROM PREVIOUS SESSIONS:\n{recall}\n\nUSER REQUEST: {user_input}"
+
+    def summarize_document(self, text, title, should_stop=lambda: False, priority=BACKGROUND):
+        """Map-reduce summary of a document of any length. Yields (kind, text)."""
+        if not self.llm:
+            yield "progress", "System: No model active."
+            return
+        try:
+            # Every chunk queues separately, so chat turns in other tabs slip in between chunks
+            yield from DocumentSummarizer(self, priority=priority).summarize(text, title, should_stop)
+        except Exception as e:
+            yield "progress", f"\n[ERROR]: {str(e)}"
+
+    def plan_context(self, sys_prompt, user_input, memory=None, history=None, web_results=None, recall=None):
+        """
+        Tokenizes every prompt source with the loaded model and trims each to its
+        priority-weighted share of n_ctx, leaving room for the answer.
+        Returns ({source: trimmed}, max_tokens).
+        """
+        planner = ContextPlanner(self.count_tokens, self.llm.n_ctx(), REPLY_TOKENS)
+        sources = [
+            Source("memory", text=memory, priority=BUDGET_PRIORITIES["memory"], stable=True),
+            Source("history", messages=history, priority=BUDGET_PRIORITIES["history"]),
+            Source("recall", text=recall, priority=BUDGET_PRIORITIES["recall"]),
+            Source("web", text=web_results, priority=BUDGET_PRIORITIES["web"]),
+            Source("input", text=user_input, priority=BUDGET_PRIORITIES["input"]),
+        ]
+        # Scaffolding around memory and web results is paid regardless of their size
+        fixed = sys_prompt
+        if memory:
+            fixed += "REFERENCE CONTEXT FROM PREVIOUS SESSIONS:\n\n\n"
+        if recall:
+            fixed += self.format_recall_turn("", "")
+        if web_results is not None:
+            fixed += self.format_web_turn("", "")
+
+        trimmed, report = planner.plan(fixed, sources)
+        self.last_budget_report = report
+        print(f"[BUDGET] {ContextPlanner.format_report(report)}")
+        return trimmed, report["reply"]
+
+    def generate_response(self, user_input, system_prompt=None, web_access=False, history=None, role=None, memory=None, summary=None, recall=None,
+                          cancel=None, priority=INTERACTIVE):
+        """cancel is a CancelToken; it is honoured while searching, queued, prefilling and decoding."""
         if not self.llm:
             yield "System: No model active."
             return
+        cancel = cancel or CancelToken()
 
         # Handle Web Search
+        web_results = None
         if web_access:
             yield "[SYSTEM]: Searching for latest info...\n"
-            extra_context = self.web_search_and_scrape(user_input)
-            
-            # Combine into a stronger prompt
-            user_input = (
-                f"You have access to current real-time data from the web.\n"
-                f"TODAY'S DATE: January 10, 2026\n\n"
-                f"WEB SEARCH RESULTS:\n{extra_context}\n"
-                f"INSTRUCTION: Use the search results above to answer the user's request. "
-                f"Ignore your knowledge cutoff if the search results provide newer information.\n\n"
-                f"USER REQUEST: {user_input}"
-            )
+            try:
+                web_results = run_cancellable(self.web_search_and_scrape, cancel, user_input)
+            except Cancelled:
+                yield from self._stopped_note(cancel)
+                return
 
         if system_prompt:
             sys_prompt = system_prompt
@@ -159,27 +586,82 @@ class AIBackend:
         # Adjust system prompt if web access is on
         if web_access:
             sys_prompt += " You have access to real-time web search results. If the user asks about current events, use the provided results to answer accurately, even if they contradict your pre-trained knowledge cutoff."
-        
-        messages = [{"role": "system", "content": sys_prompt}]
-        
-        # Add history if provided
-        if history:
-            messages.extend(history)
-            
-        # Add current user input
-        messages.append({"role": "user", "content": user_input})
+
+        # The summary sits in the system block; count it as fixed cost
+        planned_sys = sys_prompt + (f"\n\nSUMMARY OF THE EARLIER CONVERSATION:\n{summary}" if summary else "")
+        trimmed, max_tokens = self.plan_context(
+            planned_sys, user_input, memory=memory, history=history, web_results=web_results, recall=recall
+        )
+        memory, history, user_input = trimmed["memory"], trimmed["history"], trimmed["input"]
+        if trimmed["recall"]:
+            # Retrieved chunks change every turn, so they ride with the new turn, not the cached prefix
+            user_input = self.format_recall_turn(trimmed["recall"], user_input)
+        if web_results is not None:
+            web_results = trimmed["web"]
+            # Combine into a stronger prompt
+            user_input = self.format_web_turn(web_results, user_input)
+
+        messages = self.build_messages(sys_prompt, user_input, memory=memory, history=history, summary=summary)
+
+        if not self.llm_lock.acquire(priority, blocking=False):
+            yield "[SYSTEM]: Waiting for another request on this model...\n"
+            if not self.llm_lock.acquire(priority, should_stop=cancel):
+                yield from self._stopped_note(cancel)
+                return
 
         try:
-            stream = self.llm.create_chat_completion(
-                messages=messages,
-                stream=True,
-                temperature=0.7,
-                max_tokens=2048
-            )
-
-            for chunk in stream:
-                if 'choices' in chunk and len(chunk['choices']) > 0:
-                    if 'delta' in chunk['choices'][0] and 'content' in chunk['choices'][0]['delta']:
-                        yield chunk['choices'][0]['delta']['content']
-        except Exception as e:
-            yield f"\n[ERROR]: {str(e)}"
+            # Bring back this tab's KV cache; llama.cpp then skips the matching token prefix
+            self.restore_role_state(role)
+            self.set_prefill_abort(cancel)
+            drafter = getattr(self.llm, "draft_model", None)
+            if drafter is not None:
+                drafter.reset()
+            started, tokens_before = time.perf_counter(), cancel.tokens
+
+            try:
+                stream = self.llm.create_chat_completion(
+                    messages=messages,
+                    stream=True,
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    stopping_criteria=self.stop_criteria(cancel)
+                )
+
+                prefilled = False
+                for chunk in stream:
+                    if not prefilled:
+                        self.set_prefill_abort(None)
+                        prefilled = True
+                    if cancel.cancelled:
+                        break
+                    if 'choices' in chunk and len(chunk['choices']) > 0:
+                        if 'delta' in chunk['choices'][0] and 'content' in chunk['choices'][0]['delta']:
+                            yield chunk['choices'][0]['delta']['content']
+            except Exception as e:
+                # An aborted prefill surfaces as a failed llama_decode
+                if not cancel.cancelled:
+                    yield f"\n[ERROR]: {str(e)}"
+            finally:
+                self.set_prefill_abort(None)
+                if drafter is not None:
+                    self.report_speculation(drafter, cancel.tokens - tokens_before, time.perf_counter() - started)
+                self.snapshot_role_state(role)
+        finally:
+            self.llm_lock.release()
+        yield from self._stopped_note(cancel)
+
+    def report_speculation(self, drafter, tokens, elapsed):
+        rate = drafter.acceptance_rate()
+        self.last_speculative_report = {
+            "tokens": tokens, "seconds": round(elapsed, 3), "tps": round(tokens / elapsed, 1) if elapsed else 0.0,
+            "drafted": drafter.drafted, "accepted": drafter.accepted, "acceptance": round(rate, 3),
+        }
+        r = self.last_speculative_report
+        print(f"[SPEC] {r['tokens']} tokens in {r['seconds']}s ({r['tps']} tok/s), "
+              f"{r['accepted']}/{r['drafted']} drafted tokens accepted ({rate:.0%}).")
+
+    @staticmethod
+    def _stopped_note(cancel):
+        # Explicit stops are reported by the UI; limits are only known here
+        if cancel.cancelled and cancel.reason != CANCELLED:
+            yield f"\n[SYSTEM]: Stopped at the {cancel.reason}."
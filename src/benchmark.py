@@ -0,0 +1,405 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import platform
+import datetime
+import threading
+import subprocess
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from src import calibration
+from src.cancel import CancelToken
+from src.web_search import WebSearcher, LocalSearchProvider
+
+SCENARIOS = ("cold_load", "model_swap", "first_turn_memory", "tenth_turn_history", "web_turn", "summarize_document")
+
+# Stand-in models for the fake backend and for --gguf runs
+PRIMARY, SECONDARY = "Bench A", "Bench B"
+
+REPLY_WORDS = (
+    "Here is a short answer that walks through the change step by step , then shows the code : "
+    "def parse ( path ) : return json . load ( open ( path ) ) and explains why it works ."
+).split()
+
+LOREM = (
+    "The assistant keeps a diary of every session, summarizes long documents, reviews code and "
+    "searches the web when asked. Each paragraph of this synthetic document adds a few facts, names "
+    "and numbers so summaries have something to keep. "
+)
+
+# Metric name suffixes compare() checks, by which direction is a regression
+LOWER_IS_BETTER = ("_s", "_ms", "_us", "dropped_frames")
+HIGHER_IS_BETTER = ("tps",)
+TABLE_METRICS = ("latency_s", "ttft_s", "prefill_tps", "decode_tps", "tps")
+# How often RssSampler reads the RSS during a scenario
+RSS_SAMPLE_INTERVAL_S = 0.01
+
+SEARCH_DOCUMENTS = [
+    {"title": "llama.cpp release notes", "body": "KV cache quantization, flash attention and speculative decoding landed in recent builds."},
+    {"title": "Python 3.13 changes", "body": "Free-threaded builds, a new REPL and improved error messages."},
+    {"title": "Tk text widget performance", "body": "Batch inserts and avoid per-character tag changes for smooth streaming."},
+]
+
+
+class FakeState:
+    def __init__(self, input_ids):
+        self.input_ids = list(input_ids)
+        self.n_tokens = len(self.input_ids)
+        self.llama_state_size = 64 * self.n_tokens
+
+
+class FakeLlama:
+    """
+    Deterministic llama_cpp.Llama stand-in: same surface the backend uses, with
+    simulated load, prefill and decode costs. Matching token prefixes are not
+    re-prefilled, so KV reuse shows up in the numbers like it does on a real model.
+    """
+
+    def __init__(self, model_path=None, n_ctx=4096, load_s=0.3, prefill_tps=1500.0, decode_tps=40.0, reply_tokens=96, **kwargs):
+        time.sleep(load_s)
+        self.model_path = model_path
+        self._n_ctx = n_ctx
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.reply_tokens = reply_tokens
+        self.input_ids = []
+        self.cache = None
+        self._words = {}  # {token id: word}, for detokenize
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def _token(self, word):
+        token = zlib.crc32(word) % 32000 + 2
+        self._words[token] = word
+        return token
+
+    def tokenize(self, text, add_bos=True, special=False):
+        return ([1] if add_bos else []) + [self._token(w) for w in re.findall(rb"\w+|[^\w\s]", text)]
+
+    def detokenize(self, tokens):
+        return b" ".join(self._words.get(t, b"") for t in tokens)
+
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def save_state(self):
+        return FakeState(self.input_ids)
+
+    def load_state(self, state):
+        self.input_ids = list(state.input_ids)
+
+    def _prefill(self, prompt):
+        prefix = 0
+        for a, b in zip(self.input_ids, prompt):
+            if a != b:
+                break
+            prefix += 1
+        time.sleep((len(prompt) - prefix) / self.prefill_tps)
+        self.input_ids = list(prompt)
+
+    def _decode(self, max_tokens, stopping_criteria):
+        for i in range(min(max_tokens or self.reply_tokens, self.reply_tokens)):
+            time.sleep(1.0 / self.decode_tps)
+            word = REPLY_WORDS[i % len(REPLY_WORDS)]
+            self.input_ids.append(self._token(word.encode()))
+            if stopping_criteria is not None and stopping_criteria(self.input_ids, None):
+                return
+            yield word + " "
+
+    def create_chat_completion(self, messages, stream=False, max_tokens=None, stopping_criteria=None, **kwargs):
+        text = "".join(f"<|{m['role']}|>{m['content']}" for m in messages)
+        self._prefill(self.tokenize(text.encode("utf-8")))
+        tokens = self._decode(max_tokens, stopping_criteria)
+        if stream:
+            return ({"choices": [{"delta": {"content": t}}]} for t in tokens)
+        return {"choices": [{"message": {"content": "".join(tokens)}}]}
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        index = int(self.path.strip("/") or 0) % len(SEARCH_DOCUMENTS)
+        doc = SEARCH_DOCUMENTS[index]
+        body = f"<html><body><article><h1>{doc['title']}</h1>" + f"<p>{doc['body']} {LOREM}</p>" * 6 + "</article></body></html>"
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_search_pages():
+    """
+    Local stand-in for the web: serves one article per SEARCH_DOCUMENTS entry on 127.0.0.1
+    and returns (server, documents with href set), so web turns exercise the real fetch path.
+    """
+    server = HTTPServer(("127.0.0.1", 0), _PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    documents = [dict(doc, href=f"http://127.0.0.1:{port}/{i}") for i, doc in enumerate(SEARCH_DOCUMENTS)]
+    return server, documents
+
+
+def fake_backend(backend, load_s=0.3, prefill_tps=1500.0, decode_tps=40.0, n_ctx=4096):
+    """Puts FakeLlama under a real AIBackend: no GGUF files or llama.cpp work needed."""
+    def loader(speculative=None, draft_path=None, **load_kwargs):
+        load_kwargs["n_ctx"] = n_ctx
+        return FakeLlama(load_s=load_s, prefill_tps=prefill_tps, decode_tps=decode_tps, **load_kwargs)
+
+    backend.pool.loader = loader
+    backend.resolve_model_path = lambda model_choice: (f"{model_choice}.gguf", None)
+    backend.model_dims = lambda path: None
+    return backend
+
+
+def gguf_backend(backend, paths):
+    """Maps the bench models onto GGUF files given on the command line (one file serves both)."""
+    paths = list(paths) * 2
+    mapping = {PRIMARY: paths[0], SECONDARY: paths[1]}
+    backend.resolve_model_path = lambda model_choice: (mapping[model_choice], None)
+    return backend
+
+
+class RssSampler:
+    """
+    Peak RSS of one scenario. ru_maxrss is a process-lifetime maximum, so it can't
+    tell scenarios apart; this polls the current RSS from a thread instead, and
+    misses only spikes shorter than the interval.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL_S):
+        self.interval = interval
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, calibration.current_rss_bytes())
+
+    def __enter__(self):
+        self.start = self.peak = calibration.current_rss_bytes()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, calibration.current_rss_bytes())
+
+    def report(self):
+        mb = 1024 * 1024
+        return {"peak_rss_mb": self.peak // mb, "rss_growth_mb": (self.peak - self.start) // mb}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize_samples(samples):
+    """p50/p95 of every numeric metric across the samples of one scenario."""
+    keys = sorted({k for s in samples for k, v in s.items() if isinstance(v, (int, float))})
+    out = {}
+    for key in keys:
+        values = [s[key] for s in samples if isinstance(s.get(key), (int, float))]
+        out[key] = {"p50": round(percentile(values, 50), 4), "p95": round(percentile(values, 95), 4)}
+    return out
+
+
+def git_commit(cwd):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True, text=True, check=False).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class BenchRunner:
+    """Drives a real AIBackend through scripted scenarios; only the Llama underneath may be fake."""
+
+    def __init__(self, backend, reply_tokens=64, repeat=5, progress=print):
+        self.backend = backend
+        self.reply_tokens = reply_tokens
+        self.repeat = repeat
+        self.progress = progress
+        # Offline search with no cache, so every web turn pays for search and fetch
+        self.pages, documents = serve_search_pages()
+        self.backend.searcher = WebSearcher(LocalSearchProvider(documents))
+
+    # --- measurement ---
+
+    def _load(self, model):
+        t0 = time.perf_counter()
+        res = self.backend.load_model(model)
+        if not res.startswith("Success"):
+            raise RuntimeError(res)
+        return {"latency_s": time.perf_counter() - t0}
+
+    def _turn(self, prompt, role, history=None, memory=None, web_access=False):
+        cancel = CancelToken(token_limit=self.reply_tokens)
+        t0 = time.perf_counter()
+        first = None
+        reply = []
+        for token in self.backend.generate_response(prompt, web_access=web_access, history=history, role=role, memory=memory, cancel=cancel):
+            if first is None and not token.startswith("[SYSTEM]"):
+                first = time.perf_counter()
+            reply.append(token)
+        end = time.perf_counter()
+        first = first or end
+        prompt_tokens = (self.backend.last_budget_report or {}).get("prompt", 0)
+        sample = {
+            "latency_s": end - t0,
+            "ttft_s": first - t0,
+            "tokens": cancel.tokens,
+            "prompt_tokens": prompt_tokens,
+            # Effective rate: tokens llama.cpp could reuse from its KV cache count as free
+            "prefill_tps": prompt_tokens / (first - t0) if first > t0 else 0.0,
+            "decode_tps": (cancel.tokens - 1) / (end - first) if cancel.tokens > 1 and end > first else 0.0,
+        }
+        return sample, "".join(reply)
+
+    # --- scenarios ---
+
+    def cold_load(self):
+        self.backend.unload_model()
+        return self._load(PRIMARY)
+
+    def model_swap(self):
+        # Cold swap to a model that is not resident, then a warm one back through the pool
+        self.backend.unload_model()
+        self._load(PRIMARY)
+        sample = self._load(SECONDARY)
+        sample["warm_latency_s"] = self._load(PRIMARY)["latency_s"]
+        return sample
+
+    def first_turn_memory(self):
+        self._load(PRIMARY)
+        self.backend.discard_role_state("BENCH_MEMORY")
+        memory = "\n".join(f"[Diary] Day {i}: {LOREM}" for i in range(12))
+        sample, _ = self._turn("What did I plan for the weekend?", "BENCH_MEMORY", memory=memory)
+        return sample
+
+    def tenth_turn_history(self):
+        self._load(PRIMARY)
+        role = "BENCH_HISTORY"
+        self.backend.discard_role_state(role)
+        history = []
+        for i in range(9):
+            prompt = f"Turn {i + 1}: explain the next step of the refactor."
+            _, reply = self._turn(prompt, role, history=list(history))
+            history += [{"role": "user", "content": prompt}, {"role": "assistant", "content": reply}]
+        sample, _ = self._turn("Turn 10: summarize everything we changed.", role, history=history)
+        return sample
+
+    def web_turn(self):
+        self._load(PRIMARY)
+        sample, _ = self._turn("What landed in llama.cpp recently?", "BENCH_WEB", web_access=True)
+        return sample
+
+    def summarize_document(self):
+        self._load(PRIMARY)
+        n_ctx = self.backend.llm.n_ctx()
+        # About three windows of text, so the map-reduce path runs
+        words_per_par = len(LOREM.split())
+        paragraphs = [f"Section {i}. {LOREM}" for i in range(max(3, 3 * n_ctx // words_per_par))]
+        # Map and reduce replies run to their own limits
+        cancel = CancelToken()
+        t0 = time.perf_counter()
+        parts = 0
+        for kind, _ in self.backend.summarize_document("\n\n".join(paragraphs), "bench document", should_stop=cancel):
+            parts += kind == "progress"
+        latency = time.perf_counter() - t0
+        return {"latency_s": latency, "tokens": cancel.tokens, "steps": parts, "tps": cancel.tokens / latency if latency else 0.0}
+
+    def run(self, scenarios=SCENARIOS):
+        results = {}
+        try:
+            self._run(scenarios, results)
+        finally:
+            self.pages.shutdown()
+        return results
+
+    def _run(self, scenarios, results):
+        for name in scenarios:
+            samples = []
+            with RssSampler() as rss:
+                for i in range(self.repeat):
+                    sample = getattr(self, name)()
+                    samples.append({k: round(v, 4) if isinstance(v, float) else v for k, v in sample.items()})
+                    self.progress(f"[BENCH] {name} {i + 1}/{self.repeat}: " + ", ".join(f"{k}={v}" for k, v in samples[-1].items()))
+            results[name] = {"samples": samples, "stats": summarize_samples(samples), **rss.report()}
+
+
+def run_benchmark(backend, mode, scenarios=SCENARIOS, repeat=5, reply_tokens=64, base_dir=None, progress=print):
+    runner = BenchRunner(backend, reply_tokens=reply_tokens, repeat=repeat, progress=progress)
+    return {
+        "meta": {
+            "mode": mode,
+            "commit": git_commit(base_dir or os.getcwd()),
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "host": calibration.host_key(),
+            "python": platform.python_version(),
+            "repeat": repeat,
+            "reply_tokens": reply_tokens,
+        },
+        "scenarios": runner.run(scenarios),
+        "process_peak_rss_mb": calibration.peak_rss_bytes() // (1024 * 1024),
+    }
+
+
+def save_results(results, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    meta = results["meta"]
+    stamp = meta["time"].replace(":", "").replace("-", "")
+    path = os.path.join(out_dir, f"bench_{meta['mode']}_{stamp}_{meta['commit'] or 'nogit'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Lines describing p50 changes beyond threshold between two result files.
+    Latencies and dropped frames going up, throughputs going down count as regressions.
+    """
+    lines = []
+    for name, scenario in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for metric, stats in scenario["stats"].items():
+            if not metric.endswith(LOWER_IS_BETTER + HIGHER_IS_BETTER):
+                continue
+            before = old["stats"].get(metric, {}).get("p50")
+            after = stats["p50"]
+            if before is None or after is None or before == after:
+                continue
+            change = (after - before) / before if before else float("inf")
+            if abs(change) < threshold:
+                continue
+            worse = change > 0 if metric.endswith(LOWER_IS_BETTER) else change < 0
+            lines.append(f"{'REGRESSION' if worse else 'improved'}  {name}.{metric}: {before} -> {after} ({change:+.0%})")
+    return lines
+
+
+def print_table(results, metrics=TABLE_METRICS, out=sys.stdout):
+    for name, scenario in results["scenarios"].items():
+        stats = scenario["stats"]
+        cells = [f"{m} p50 {s['p50']} / p95 {s['p95']}" for m, s in stats.items() if m in metrics]
+        if "peak_rss_mb" in scenario:
+            cells.append(f"peak RSS {scenario['peak_rss_mb']} MB (+{scenario['rss_growth_mb']})")
+        out.write(f"{name:<20} {' | '.join(cells)}\n")
+    out.write(f"process peak RSS {results['process_peak_rss_mb']} MB\n")
@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import platform
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+PROFILE_FILE = "hardware_profiles.json"
+PROFILE_KEYS = ("n_gpu_layers", "n_threads", "n_batch", "n_ctx")
+
+# A "typical turn": prompt prefill followed by a short answer
+PREFILL_TOKENS = 512
+DECODE_TOKENS = 48
+TURN_PREFILL = 1500
+TURN_DECODE = 300
+
+PROBE_TEXT = (
+    "The quick brown fox jumps over the lazy dog while the local assistant reviews a diary entry, "
+    "summarizes a document, and writes a short Python function that parses a configuration file. "
+)
+
+
+def profile_path(base_dir):
+    return os.path.join(base_dir, PROFILE_FILE)
+
+
+def host_key():
+    return f"{platform.node()}|{platform.system()}|{platform.machine()}|{os.cpu_count()}"
+
+
+def model_key(model_path):
+    try:
+        size = os.path.getsize(model_path)
+    except OSError:
+        size = 0
+    return f"{os.path.basename(model_path)}|{size}"
+
+
+def total_ram_bytes():
+    if HAS_PSUTIL:
+        return psutil.virtual_memory().total
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def available_ram_bytes():
+    """RAM free for a new model right now; falls back to the total."""
+    if HAS_PSUTIL:
+        return psutil.virtual_memory().available
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return total_ram_bytes()
+
+
+def current_rss_bytes():
+    """Resident set size right now, 0 where it can't be read."""
+    if HAS_PSUTIL:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def peak_rss_bytes():
+    """Highest RSS over the whole process lifetime."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS reports bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    if HAS_PSUTIL:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return 0
+
+
+def load_profile(base_dir, model_path):
+    """Returns the saved settings for this model on this host, or None."""
+    path = profile_path(base_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"[CALIBRATE] Could not read {path}: {e}")
+        return None
+    return data.get(host_key(), {}).get(model_key(model_path))
+
+
+def save_profile(base_dir, model_path, profile):
+    path = profile_path(base_dir)
+    data = {}
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+    data.setdefault(host_key(), {})[model_key(model_path)] = profile
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _probe(model_path, settings):
+    """Runs in a fresh process so every probe gets its own peak RSS and frees its memory."""
+    from llama_cpp import Llama
+
+    t0 = time.perf_counter()
+    llm = Llama(model_path=model_path, verbose=False, **settings)
+    load_s = time.perf_counter() - t0
+
+    tokens = llm.tokenize(PROBE_TEXT.encode("utf-8"))
+    while len(tokens) < PREFILL_TOKENS:
+        tokens = tokens + tokens
+    tokens = tokens[:min(PREFILL_TOKENS, settings["n_ctx"] - DECODE_TOKENS - 8)]
+
+    t0 = time.perf_counter()
+    llm.eval(tokens)
+    prefill_s = time.perf_counter() - t0
+
+    # Everything is already evaluated, generate() only pays for new tokens
+    decoded = 0
+    t0 = time.perf_counter()
+    for _ in llm.generate(tokens, temp=0.0):
+        decoded += 1
+        if decoded >= DECODE_TOKENS:
+            break
+    decode_s = time.perf_counter() - t0
+
+    return {
+        "load_s": load_s,
+        "prefill_tps": len(tokens) / prefill_s if prefill_s else 0.0,
+        "decode_tps": decoded / decode_s if decode_s else 0.0,
+        "peak_rss": peak_rss_bytes(),
+    }
+
+
+def _turn_seconds(result):
+    """Estimated latency of a typical turn; lower is better."""
+    if not result["prefill_tps"] or not result["decode_tps"]:
+        return float("inf")
+    return TURN_PREFILL / result["prefill_tps"] + TURN_DECODE / result["decode_tps"]
+
+
+def gpu_offload_supported():
+    try:
+        import llama_cpp
+        return bool(llama_cpp.llama_supports_gpu_offload())
+    except Exception:
+        return False
+
+
+def thread_candidates():
+    logical = os.cpu_count() or 1
+    physical = psutil.cpu_count(logical=False) if HAS_PSUTIL else None
+    candidates = {max(1, logical // 4), max(1, logical // 2), max(1, logical - 2)}
+    if physical:
+        candidates.add(physical)
+    return sorted(candidates)
+
+
+def calibrate(model_path, defaults, progress=print, ctx_candidates=(2048, 4096, 8192, 16384), fixed=None):
+    """
+    Sweeps GPU layers, threads, batch size and context size in stages with short
+    prefill/decode probes, and returns the fastest profile that fits in RAM.
+    fixed settings (KV cache types, flash attention) go into every probe unchanged.
+    """
+    fixed = fixed or {}
+    ram_limit = total_ram_bytes() * 0.8
+    mp_ctx = multiprocessing.get_context("spawn")
+    best = {k: defaults[k] for k in PROFILE_KEYS}
+    best_result = None
+
+    def run(settings):
+        nonlocal best, best_result
+        label = ", ".join(f"{k}={v}" for k, v in settings.items())
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp_ctx) as pool:
+                result = pool.submit(_probe, model_path, dict(fixed, **settings)).result()
+        except Exception as e:
+            progress(f"[CALIBRATE] {label}: failed ({e})")
+            return None
+        progress(
+            f"[CALIBRATE] {label}: prefill {result['prefill_tps']:.1f} tok/s, "
+            f"decode {result['decode_tps']:.1f} tok/s, peak {result['peak_rss'] // (1024 * 1024)} MB"
+        )
+        if ram_limit and result["peak_rss"] > ram_limit:
+            return result
+        if best_result is None or _turn_seconds(result) < _turn_seconds(best_result):
+            best, best_result = dict(settings), result
+        return result
+
+    gpu_offload = gpu_offload_supported()
+    if not gpu_offload:
+        best["n_gpu_layers"] = 0
+
+    run(best)
+
+    # Stage 1: GPU offload (skipped on CPU-only builds)
+    if gpu_offload:
+        for layers in sorted({0, defaults["n_gpu_layers"], -1}):
+            if layers != best["n_gpu_layers"]:
+                run(dict(best, n_gpu_layers=layers))
+
+    # Stage 2: threads mostly drive decode speed
+    for threads in thread_candidates():
+        if threads != best["n_threads"]:
+            run(dict(best, n_threads=threads))
+
+    # Stage 3: batch size mostly drives prefill speed
+    for batch in (128, 256, 512, 1024):
+        if batch != best["n_batch"]:
+            run(dict(best, n_batch=batch))
+
+    # Stage 4: largest context that still fits and doesn't cost >10% per turn
+    if best_result is not None:
+        base_turn = _turn_seconds(best_result)
+        for n_ctx in sorted(c for c in ctx_candidates if c > best["n_ctx"]):
+            candidate = dict(best, n_ctx=n_ctx)
+            result = run(candidate)
+            if not result or (ram_limit and result["peak_rss"] > ram_limit):
+                break
+            if _turn_seconds(result) <= base_turn * 1.1:
+                best, best_result = candidate, result
+
+    if best_result is None:
+        return None
+
+    profile = dict(best)
+    profile.update({
+        "prefill_tps": round(best_result["prefill_tps"], 2),
+        "decode_tps": round(best_result["decode_tps"], 2),
+        "peak_rss_mb": best_result["peak_rss"] // (1024 * 1024),
+        "calibrated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    })
+    return profile
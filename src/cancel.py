@@ -0,0 +1,77 @@
+import time
+import threading
+
+# Why a token fired; explicit stops are the only kind the UI already reports itself
+CANCELLED = "cancelled"
+DEADLINE = "deadline"
+TOKEN_LIMIT = "token limit"
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """
+    Stop signal for one request: an explicit cancel(), a wall-clock deadline or a budget
+    of generated tokens, whichever comes first. Calling the token returns whether it fired,
+    so it can be passed anywhere a should_stop callable is expected.
+    """
+
+    def __init__(self, timeout_s=None, token_limit=None):
+        self.deadline = time.monotonic() + timeout_s if timeout_s else None
+        self.token_limit = token_limit
+        self.tokens = 0
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason=CANCELLED):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE)
+            return True
+        if self.token_limit is not None and self.tokens >= self.token_limit:
+            self.cancel(TOKEN_LIMIT)
+            return True
+        return False
+
+    def __call__(self):
+        return self.cancelled
+
+    def stopping_criterion(self, input_ids, logits):
+        """llama.cpp stopping criterion: runs once per sampled token, so a stop lands within one decode step."""
+        self.tokens += 1
+        return self.cancelled
+
+
+def run_cancellable(fn, cancel, *args, poll_s=0.05):
+    """
+    Runs fn(*args) on a helper thread and returns its result, or raises Cancelled as soon
+    as the token fires. Blocking network calls can't be interrupted, so an abandoned call
+    finishes in the background (its search results still land in the cache).
+    """
+    box = {}
+    done = threading.Event()
+
+    def target():
+        try:
+            box["result"] = fn(*args)
+        except Exception as e:
+            box["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=target, daemon=True).start()
+    while not done.wait(poll_s):
+        if cancel.cancelled:
+            raise Cancelled(cancel.reason)
+    if "error" in box:
+        raise box["error"]
+    return box["result"]
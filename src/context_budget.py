@@ -0,0 +1,186 @@
+import re
+
+# Chat template tokens around each message (role header, separators)
+MESSAGE_OVERHEAD = 8
+# Tokenizer counts over split sentences drift slightly from the joined text
+SAFETY_MARGIN = 0.03
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class Source:
+    """
+    One block of prompt text competing for the context window.
+    keep="head" trims from the end, keep="tail" trims from the start.
+    stable=True gives the source a fixed share that doesn't depend on the
+    other sources, so its text (and the cached prefix) stays identical across turns.
+    """
+
+    def __init__(self, name, text=None, messages=None, priority=1.0, keep="head", stable=False):
+        self.name = name
+        self.text = text or ""
+        self.messages = messages or []
+        self.priority = priority
+        self.keep = keep
+        self.stable = stable
+        self.needed = 0
+        self.budget = 0
+        self.used = 0
+
+
+class ContextPlanner:
+    """Fits system prompt, memory, history, web results and input into n_ctx."""
+
+    def __init__(self, count_tokens, n_ctx, reply_tokens):
+        self.count_tokens = count_tokens
+        self.n_ctx = n_ctx
+        self.reply_tokens = reply_tokens
+        # Leave room for the answer, but never let it eat the whole window
+        self.reply_reserve = min(reply_tokens, max(256, n_ctx // 4))
+
+    def _split(self, text):
+        return [s for s in SENTENCE_SPLIT.split(text) if s.strip()]
+
+    def _cut(self, text, limit, keep):
+        """Longest head (or tail) of text within limit tokens, preferring a word boundary."""
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            part = text[:mid] if keep == "head" else text[-mid:]
+            if self.count_tokens(part) <= limit:
+                lo = mid
+            else:
+                hi = mid - 1
+        if lo == 0:
+            return ""
+        part = text[:lo] if keep == "head" else text[-lo:]
+        if lo < len(text):
+            # Drop the partial word at the cut unless the whole piece is one word
+            words = part.rsplit(None, 1) if keep == "head" else part.split(None, 1)
+            if len(words) == 2:
+                part = words[0] if keep == "head" else words[1]
+        return part.strip()
+
+    def trim_text(self, text, budget, keep="head"):
+        """Cuts text at sentence boundaries to fit budget tokens, inside a sentence if none fits whole."""
+        if budget <= 0 or not text:
+            return ""
+        if self.count_tokens(text) <= budget:
+            return text
+
+        limit = int(budget * (1 - SAFETY_MARGIN))
+        sentences = self._split(text)
+        if keep == "tail":
+            sentences.reverse()
+
+        kept = []
+        used = 0
+        for sentence in sentences:
+            n = self.count_tokens(sentence) + 1
+            if used + n > limit:
+                break
+            kept.append(sentence)
+            used += n
+
+        # Unpunctuated text or one overlong sentence: cut by tokens instead of returning nothing
+        if not kept and sentences:
+            return self._cut(sentences[0], limit, keep)
+
+        if keep == "tail":
+            kept.reverse()
+        return " ".join(kept)
+
+    def trim_messages(self, messages, budget):
+        """Keeps the newest messages that fit; the oldest kept one may be cut at a sentence."""
+        kept = []
+        used = 0
+        for msg in reversed(messages):
+            n = self.count_tokens(msg["content"]) + MESSAGE_OVERHEAD
+            if used + n <= budget:
+                kept.append(msg)
+                used += n
+                continue
+            room = budget - used - MESSAGE_OVERHEAD
+            partial = self.trim_text(msg["content"], room, keep="tail") if room > 0 else ""
+            if partial:
+                kept.append({"role": msg["role"], "content": partial})
+            break
+        kept.reverse()
+        return kept
+
+    def _measure(self, source):
+        if source.messages:
+            return sum(self.count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in source.messages)
+        return self.count_tokens(source.text) if source.text else 0
+
+    def plan(self, fixed_text, sources):
+        """
+        Allocates the window between sources by priority weight, trims each one
+        to its budget and returns {name: trimmed text or messages} plus a report.
+        """
+        fixed = self.count_tokens(fixed_text) + MESSAGE_OVERHEAD
+        available = max(0, self.n_ctx - self.reply_reserve - fixed - MESSAGE_OVERHEAD)
+
+        for s in sources:
+            s.needed = self._measure(s)
+            s.budget = 0
+
+        # Over every declared source, present or not, so a stable share never moves between turns
+        total_weight = sum(s.priority for s in sources) or 1.0
+        remaining = available
+
+        # Stable sources get a fixed weighted share first
+        for s in sources:
+            if s.stable:
+                s.budget = min(s.needed, int(available * s.priority / total_weight))
+                remaining -= s.budget
+
+        # Water-fill the rest: satisfied sources hand their leftovers to the others
+        hungry = [s for s in sources if not s.stable and s.needed > 0]
+        while hungry and remaining > 0:
+            weight = sum(s.priority for s in hungry)
+            satisfied = []
+            for s in hungry:
+                share = int(remaining * s.priority / weight)
+                if s.needed - s.budget <= share:
+                    satisfied.append(s)
+            if not satisfied:
+                for s in hungry:
+                    s.budget += int(remaining * s.priority / weight)
+                break
+            for s in satisfied:
+                remaining -= s.needed - s.budget
+                s.budget = s.needed
+                hungry.remove(s)
+
+        result = {}
+        for s in sources:
+            if s.messages:
+                trimmed = s.messages if s.needed <= s.budget else self.trim_messages(s.messages, s.budget)
+                s.used = sum(self.count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in trimmed)
+            else:
+                trimmed = s.text if s.needed <= s.budget else self.trim_text(s.text, s.budget, s.keep)
+                s.used = self.count_tokens(trimmed) if trimmed else 0
+            result[s.name] = trimmed
+
+        prompt_tokens = fixed + MESSAGE_OVERHEAD + sum(s.used for s in sources)
+        report = {"system": fixed}
+        for s in sources:
+            report[s.name] = {"used": s.used, "needed": s.needed}
+        report["prompt"] = prompt_tokens
+        # reply_tokens stays an upper bound even when the prompt leaves more room
+        report["reply"] = max(0, min(self.reply_tokens, self.n_ctx - prompt_tokens))
+        report["n_ctx"] = self.n_ctx
+        return result, report
+
+    @staticmethod
+    def format_report(report):
+        parts = [f"system {report['system']}"]
+        for name, value in report.items():
+            if isinstance(value, dict):
+                if value["used"] < value["needed"]:
+                    parts.append(f"{name} {value['used']}/{value['needed']}")
+                else:
+                    parts.append(f"{name} {value['used']}")
+        parts.append(f"reply {report['reply']} (n_ctx {report['n_ctx']})")
+        return " | ".join(parts)
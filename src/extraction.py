@@ -0,0 +1,149 @@
+import os
+import zlib
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Bump when extraction/normalization changes so old cache entries are ignored
+EXTRACTOR_VERSION = 1
+PAGES_PER_TASK = 8
+# Below this many pages the process pool costs more than it saves
+MIN_PARALLEL_PAGES = 16
+
+
+def _build_normalize_table():
+    """Control and invisible format characters that can crash or confuse llama.cpp tokenization."""
+    table = {c: None for c in range(0x00, 0x20) if chr(c) not in "\n\r\t"}
+    table.update({c: None for c in range(0x7F, 0xA0)})
+    for c in (0xAD, 0xFEFF, 0xFFFE, 0xFFFF, 0xFFF9, 0xFFFA, 0xFFFB):
+        table[c] = None
+    for start, end in ((0x200B, 0x200F), (0x202A, 0x202E), (0x2060, 0x2064)):
+        table.update({c: None for c in range(start, end + 1)})
+    table[0xA0] = " "
+    table[0x2028] = "\n"
+    table[0x2029] = "\n"
+    return table
+
+
+NORMALIZE_TABLE = _build_normalize_table()
+
+
+def normalize_text(text):
+    text = text.translate(NORMALIZE_TABLE)
+    # pypdf can hand back lone surrogates; drop them in one pass
+    return text.encode("utf-8", "ignore").decode("utf-8")
+
+
+def _extract_pdf_range(path, start, end):
+    """Runs in a worker process: extracts pages [start, end)."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    pages = []
+    for i in range(start, end):
+        try:
+            pages.append((i, normalize_text(reader.pages[i].extract_text() or "")))
+        except Exception as e:
+            pages.append((i, f"[page {i + 1} could not be read: {e}]"))
+    return pages
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return f"{h.hexdigest()}-v{EXTRACTOR_VERSION}"
+
+
+class DocumentExtractor:
+    """
+    Text extraction for the Context tab.
+    PDF pages are spread over a process pool and reported as they finish;
+    results are cached on disk by content hash so re-summarizing is instant.
+    """
+
+    def __init__(self, cache_dir, workers=None):
+        self.cache_dir = cache_dir
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.txt.z")
+
+    def cached(self, key):
+        path = self._cache_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return zlib.decompress(f.read()).decode("utf-8")
+        except Exception as e:
+            print(f"[EXTRACT] Bad cache entry {path}: {e}")
+            return None
+
+    def store(self, key, text):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._cache_path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(text.encode("utf-8"), 3))
+            os.replace(tmp_path, self._cache_path(key))
+        except Exception as e:
+            print(f"[EXTRACT] Could not cache extraction: {e}")
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def iter_pdf_pages(self, path):
+        """Yields (page_index, page_count, text) in completion order."""
+        from pypdf import PdfReader
+        total = len(PdfReader(path).pages)
+
+        if total < MIN_PARALLEL_PAGES:
+            for i, text in _extract_pdf_range(path, 0, total):
+                yield i, total, text
+            return
+
+        pool = self._get_pool()
+        futures = [pool.submit(_extract_pdf_range, path, s, min(s + PAGES_PER_TASK, total)) for s in range(0, total, PAGES_PER_TASK)]
+        for fut in as_completed(futures):
+            for i, text in fut.result():
+                yield i, total, text
+
+    def extract(self, path, progress=None):
+        """Returns normalized text for a PDF, DOCX or TXT file. progress(done, total) is called per page."""
+        key = file_hash(path)
+        text = self.cached(key)
+        if text is not None:
+            print(f"[EXTRACT] Cache hit for {os.path.basename(path)}")
+            return text
+
+        lower = path.lower()
+        if lower.endswith(".pdf"):
+            pages = {}
+            for i, total, page_text in self.iter_pdf_pages(path):
+                pages[i] = page_text
+                if progress:
+                    progress(len(pages), total)
+            text = "\n".join(pages[i] for i in sorted(pages))
+        elif lower.endswith(".docx"):
+            from docx import Document
+            doc = Document(path)
+            text = normalize_text("\n".join(p.text for p in doc.paragraphs))
+        else:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = normalize_text(f.read())
+
+        self.store(key, text)
+        return text
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
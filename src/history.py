@@ -0,0 +1,88 @@
+import threading
+
+# Messages kept verbatim per role (4 turns)
+KEEP_RECENT = 8
+# Older messages are folded into the summary once this many pile up,
+# so the summary (and the cached prefix it sits in) changes rarely
+FOLD_BATCH = 6
+# Safety net if folding keeps failing (e.g. no model loaded)
+MAX_PENDING = 40
+
+
+class HistoryCompactor:
+    """
+    Folds old chat turns into a running per-role summary instead of dropping them.
+    Recent turns stay verbatim; folded turns are only summarized while the app is idle.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.summaries = {}  # {role: str}
+        self.pending = {}    # {role: [messages waiting to be folded]}
+        self._lock = threading.Lock()
+        self._running = False
+
+    def overflow(self, role, chat_history):
+        """Moves everything older than KEEP_RECENT out of chat_history[role] into the fold queue."""
+        messages = chat_history.get(role, [])
+        if len(messages) <= KEEP_RECENT:
+            return
+        older, chat_history[role] = messages[:-KEEP_RECENT], messages[-KEEP_RECENT:]
+        with self._lock:
+            pending = self.pending.setdefault(role, [])
+            pending.extend(older)
+            if len(pending) > MAX_PENDING and not self._running:
+                del pending[:len(pending) - MAX_PENDING]
+
+    def history_for(self, role, recent):
+        """Unfolded older turns still go to the model until the summary covers them."""
+        with self._lock:
+            return list(self.pending.get(role, [])) + list(recent or [])
+
+    def summary_for(self, role):
+        with self._lock:
+            return self.summaries.get(role)
+
+    def needs_compaction(self):
+        with self._lock:
+            return [r for r, p in self.pending.items() if len(p) >= FOLD_BATCH]
+
+    def compact(self, role):
+        """Summarizes the queued turns for role. Blocking, call from a worker thread."""
+        with self._lock:
+            if self._running:
+                return False
+            queue = self.pending.get(role, [])
+            batch = list(queue)
+            previous = self.summaries.get(role)
+            self._running = True
+
+        try:
+            if not batch:
+                return False
+            summary = self.backend.summarize_history(previous, batch)
+            if not summary:
+                return False
+            with self._lock:
+                if self.pending.get(role) is not queue:
+                    # Chat was cleared or resumed while we were summarizing
+                    return False
+                self.summaries[role] = summary
+                # New turns may have been queued meanwhile, only drop what was folded
+                del queue[:len(batch)]
+            print(f"[HISTORY] Folded {len(batch)} {role} messages into the summary.")
+            return True
+        finally:
+            with self._lock:
+                self._running = False
+
+    def restore(self, role, summary):
+        with self._lock:
+            self.pending[role] = []
+            if summary:
+                self.summaries[role] = summary
+            else:
+                self.summaries.pop(role, None)
+
+    def reset(self, role):
+        self.restore(role, None)
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import threading
+from array import array
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+JOURNAL_EXT = ".jsonl"
+ZSTD_JOURNAL_EXT = ".jsonl.zst"
+INDEX_EXT = ".idx"
+# Everything the memory sidebar and index treat as a saved session
+LOG_EXTENSIONS = (".txt", JOURNAL_EXT, ZSTD_JOURNAL_EXT)
+
+ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+
+def is_journal(path):
+    return path.endswith((JOURNAL_EXT, ZSTD_JOURNAL_EXT))
+
+
+def log_stem(path):
+    """Diary_2026-01-10.jsonl.zst -> Diary_2026-01-10 (plain splitext for anything else)."""
+    for ext in (ZSTD_JOURNAL_EXT, JOURNAL_EXT):
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return os.path.splitext(path)[0]
+
+
+class SessionJournal:
+    """
+    Append-only session log: one JSON record per message, written and fsync'ed as soon as
+    the message is complete. With a .zst path every record is its own zstd frame, so the
+    file stays appendable. A sidecar .idx holds each record's byte offset (uint64) so the
+    tail can be read without scanning the whole file.
+    Only the app's one writer instance may repair files; readonly instances (any other
+    reader) never write, truncate or rebuild the index on disk, so they can't race an append.
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.index_path = path + INDEX_EXT
+        self.compressed = path.endswith(ZSTD_JOURNAL_EXT)
+        if self.compressed and not HAS_ZSTD:
+            raise RuntimeError("zstandard is not installed")
+        self.offsets = array("Q")
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # --- index ---
+
+    def _load_index(self):
+        if not os.path.exists(self.path):
+            self.offsets = array("Q")
+            return
+        try:
+            # The index is written after the record, so an older index means a crash in between
+            if os.path.getmtime(self.index_path) >= os.path.getmtime(self.path):
+                offsets = array("Q")
+                with open(self.index_path, "rb") as f:
+                    offsets.frombytes(f.read())
+                self.offsets = offsets
+                return
+        except (OSError, ValueError):
+            pass
+        if self.readonly:
+            # The writer may be between a record and its index entry: scan, skip any partial tail
+            with open(self.path, "rb") as f:
+                self.offsets, _ = self._scan(f.read())
+            return
+        self._rebuild_index()
+
+    def _scan(self, data):
+        """Offsets of the complete records in data, and where the last one ends."""
+        offsets = array("Q")
+        pos = 0
+        if self.compressed:
+            dctx = zstandard.ZstdDecompressor()
+            while pos < len(data):
+                obj = dctx.decompressobj()
+                try:
+                    obj.decompress(data[pos:])
+                except zstandard.ZstdError:
+                    break
+                if not obj.eof:
+                    break  # frame still being written
+                used = len(data) - pos - len(obj.unused_data)
+                if used <= 0:
+                    break
+                offsets.append(pos)
+                pos += used
+        else:
+            while pos < len(data):
+                end = data.find(b"\n", pos)
+                if end == -1:
+                    break
+                offsets.append(pos)
+                pos = end + 1
+        return offsets, pos
+
+    def _rebuild_index(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        offsets, pos = self._scan(data)
+        if pos < len(data):
+            # Torn record from a crash mid-write; cut it so the next append starts clean
+            with open(self.path, "r+b") as f:
+                f.truncate(pos)
+        self.offsets = offsets
+        with open(self.index_path, "wb") as f:
+            f.write(offsets.tobytes())
+        print(f"[JOURNAL] Rebuilt index for {os.path.basename(self.path)} ({len(offsets)} records).")
+
+    # --- writing ---
+
+    def _encode(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.compressed:
+            return zstandard.ZstdCompressor(level=3).compress(line)
+        return line
+
+    def append(self, role, content, **fields):
+        """Appends one message. Cost depends only on the message, not on the session length."""
+        record = {"role": role, "content": content, "ts": time.time()}
+        record.update(fields)
+        payload = self._encode(record)
+        if self.readonly:
+            raise RuntimeError(f"{os.path.basename(self.path)} was opened read-only")
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, "ab") as f:
+                f.write(array("Q", [offset]).tobytes())
+            self.offsets.append(offset)
+        return record
+
+    # --- reading ---
+
+    def _decode(self, raw):
+        if self.compressed:
+            raw = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+        return json.loads(raw.split(b"\n", 1)[0].decode("utf-8"))
+
+    def records(self, start=0, count=None):
+        """Records [start, start + count); negative start counts from the end."""
+        with self._lock:
+            offsets = self.offsets.tolist()
+        if not offsets:
+            return []
+        if start < 0:
+            start = max(0, len(offsets) + start)
+        end = len(offsets) if count is None else min(len(offsets), start + count)
+        if start >= end:
+            return []
+
+        out = []
+        with open(self.path, "rb") as f:
+            f.seek(offsets[start])
+            blob = f.read((offsets[end] if end < len(offsets) else os.path.getsize(self.path)) - offsets[start])
+        bounds = [o - offsets[start] for o in offsets[start:end]] + [len(blob)]
+        for a, b in zip(bounds, bounds[1:]):
+            try:
+                out.append(self._decode(blob[a:b]))
+            except Exception as e:
+                print(f"[JOURNAL] Skipping unreadable record in {os.path.basename(self.path)}: {e}")
+        return out
+
+    def fingerprint(self):
+        """Cheap identity of the journal's current contents (record count and size)."""
+        with self._lock:
+            count = len(self.offsets)
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return f"{os.path.basename(self.path)}|{count}|{size}"
+
+
+def records_to_text(records):
+    """Role-labelled conversation text for prompts and the memory index (no UI glyphs)."""
+    parts = []
+    for r in records:
+        label = ROLE_LABELS.get(r.get("role"))
+        parts.append(f"{label}: {r.get('content', '')}" if label else r.get("content", ""))
+    return "\n\n".join(parts)
+
+
+def read_log_text(path):
+    """Text of a saved session: journals are rendered from their records, older .txt logs read as-is."""
+    if is_journal(path):
+        # The app's writer may be appending to this very file
+        return records_to_text(SessionJournal(path, readonly=True).records())
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
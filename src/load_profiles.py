@@ -0,0 +1,184 @@
+import os
+import struct
+
+# KV cache element types: name -> (ggml type id, bytes per element incl. block scales)
+KV_TYPES = {
+    "f16": (1, 2.0),
+    "q8_0": (8, 34 / 32),
+    "q4_0": (2, 18 / 32),
+}
+# llama_rope_scaling_type
+ROPE_SCALING = {"linear": 1, "yarn": 2}
+
+# Per-profile settings that reach Llama(); probes and the pool compare them too
+PROFILE_LOAD_KEYS = ("type_k", "type_v", "flash_attn", "rope_scaling_type", "rope_freq_scale", "yarn_orig_ctx")
+
+# Smallest context the fit check will shrink a profile to
+MIN_CTX = 2048
+
+GGUF_MAGIC = b"GGUF"
+# GGUF value types -> struct format (8 = string and 9 = array are handled separately)
+GGUF_SCALARS = {0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i", 6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d"}
+GGUF_STRING, GGUF_ARRAY = 8, 9
+
+_dims_cache = {}  # {(path, size, mtime): dims}
+
+
+def _read(f, fmt):
+    size = struct.calcsize(fmt)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("truncated GGUF header")
+    return struct.unpack(fmt, data)[0]
+
+
+def _read_string(f):
+    return f.read(_read(f, "<Q")).decode("utf-8", errors="replace")
+
+
+def _read_value(f, vtype):
+    if vtype in GGUF_SCALARS:
+        return _read(f, GGUF_SCALARS[vtype])
+    if vtype == GGUF_STRING:
+        return _read_string(f)
+    if vtype == GGUF_ARRAY:
+        item_type = _read(f, "<I")
+        count = _read(f, "<Q")
+        if item_type in GGUF_SCALARS:
+            # Arrays are only needed for their length here; skip the payload
+            f.seek(struct.calcsize(GGUF_SCALARS[item_type]) * count, os.SEEK_CUR)
+        else:
+            for _ in range(count):
+                _read_value(f, item_type)
+        return count
+    raise ValueError(f"unknown GGUF value type {vtype}")
+
+
+def read_gguf_metadata(path):
+    """Key/value header of a GGUF file (arrays come back as their length). Tensor data is never read."""
+    with open(path, "rb") as f:
+        if f.read(4) != GGUF_MAGIC:
+            raise ValueError(f"{os.path.basename(path)} is not a GGUF file")
+        version = _read(f, "<I")
+        count_fmt = "<I" if version == 1 else "<Q"
+        _read(f, count_fmt)  # tensor count
+        kv_count = _read(f, count_fmt)
+        meta = {"gguf.version": version}
+        for _ in range(kv_count):
+            key = _read_string(f)
+            meta[key] = _read_value(f, _read(f, "<I"))
+    return meta
+
+
+def model_dims(path):
+    """Attention shape of a model, from its GGUF header (cached by file identity)."""
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    if key in _dims_cache:
+        return _dims_cache[key]
+
+    meta = read_gguf_metadata(path)
+    arch = meta.get("general.architecture", "llama")
+    n_embd = meta[f"{arch}.embedding_length"]
+    n_head = meta[f"{arch}.attention.head_count"]
+    n_head_kv = meta.get(f"{arch}.attention.head_count_kv", n_head)
+    head_dim = n_embd // n_head
+    dims = {
+        "arch": arch,
+        "n_layer": meta[f"{arch}.block_count"],
+        "n_head_kv": n_head_kv,
+        "head_dim_k": meta.get(f"{arch}.attention.key_length", head_dim),
+        "head_dim_v": meta.get(f"{arch}.attention.value_length", head_dim),
+        "n_ctx_train": meta.get(f"{arch}.context_length", 0),
+        "file_bytes": stat.st_size,
+    }
+    _dims_cache[key] = dims
+    return dims
+
+
+def kv_cache_bytes(dims, n_ctx, type_k="f16", type_v="f16"):
+    per_token = dims["n_head_kv"] * (dims["head_dim_k"] * KV_TYPES[type_k][1] + dims["head_dim_v"] * KV_TYPES[type_v][1])
+    return int(dims["n_layer"] * n_ctx * per_token)
+
+
+def kv_type_name(ggml_type):
+    """KV_TYPES name for a ggml type id, f16 when unknown."""
+    for name, (type_id, _) in KV_TYPES.items():
+        if type_id == ggml_type:
+            return name
+    return "f16"
+
+
+def profile_tag(load_kwargs):
+    """
+    The PROFILE_LOAD_KEYS of a set of Llama() kwargs as a stable string, e.g.
+    "type_k=q8_0,type_v=q8_0,flash_attn=True". A saved KV state only loads back under the same tag.
+    """
+    parts = []
+    for key in PROFILE_LOAD_KEYS:
+        if key not in load_kwargs:
+            continue
+        value = load_kwargs[key]
+        if key in ("type_k", "type_v"):
+            value = kv_type_name(value)
+        parts.append(f"{key}={value}")
+    return ",".join(parts)
+
+
+def normalize(profile):
+    """Fills defaults and drops combinations llama.cpp rejects."""
+    profile = dict(profile)
+    profile.setdefault("type_k", "f16")
+    profile.setdefault("type_v", "f16")
+    profile.setdefault("flash_attn", False)
+    profile.setdefault("rope_scaling", None)
+    for key in ("type_k", "type_v"):
+        if profile[key] not in KV_TYPES:
+            print(f"[PROFILE] Unknown KV type {profile[key]}, using f16.")
+            profile[key] = "f16"
+    if profile["type_v"] != "f16" and not profile["flash_attn"]:
+        # A quantized V cache only works with flash attention
+        print("[PROFILE] Quantized V cache needs flash attention, keeping V in f16.")
+        profile["type_v"] = "f16"
+    return profile
+
+
+def llama_kwargs(profile, n_ctx, dims=None):
+    """Llama() keyword arguments for a normalized profile at n_ctx."""
+    kwargs = {
+        "type_k": KV_TYPES[profile["type_k"]][0],
+        "type_v": KV_TYPES[profile["type_v"]][0],
+        "flash_attn": bool(profile["flash_attn"]),
+    }
+    n_ctx_train = dims["n_ctx_train"] if dims else 0
+    scaling = profile.get("rope_scaling")
+    if scaling in ROPE_SCALING and n_ctx_train and n_ctx > n_ctx_train:
+        # Stretch positions only when the window exceeds what the model was trained on
+        kwargs["rope_scaling_type"] = ROPE_SCALING[scaling]
+        kwargs["rope_freq_scale"] = n_ctx_train / n_ctx
+        if scaling == "yarn":
+            kwargs["yarn_orig_ctx"] = n_ctx_train
+    return kwargs
+
+
+def fit_context(dims, n_ctx, profile, budget_bytes, weights_in_ram=True):
+    """
+    Largest n_ctx (halving down to MIN_CTX) whose KV cache, plus the weights when they
+    live in host RAM, fits budget_bytes. Returns (n_ctx, kv_bytes).
+    """
+    weights = dims["file_bytes"] if weights_in_ram else 0
+    kv = kv_cache_bytes(dims, n_ctx, profile["type_k"], profile["type_v"])
+    while budget_bytes and n_ctx > MIN_CTX and weights + kv > budget_bytes:
+        n_ctx //= 2
+        kv = kv_cache_bytes(dims, n_ctx, profile["type_k"], profile["type_v"])
+    return n_ctx, kv
+
+
+def describe(name, dims, n_ctx, profile):
+    kv = kv_cache_bytes(dims, n_ctx, profile["type_k"], profile["type_v"])
+    f16 = kv_cache_bytes(dims, n_ctx)
+    return (
+        f"{name}: n_ctx {n_ctx} (trained {dims['n_ctx_train']}), KV {profile['type_k']}/{profile['type_v']} "
+        f"{kv / 1024 ** 2:.0f} MB (f16 {f16 / 1024 ** 2:.0f} MB), weights {dims['file_bytes'] / 1024 ** 3:.1f} GB, "
+        f"flash_attn {'on' if profile['flash_attn'] else 'off'}"
+    )
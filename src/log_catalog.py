@@ -0,0 +1,125 @@
+import os
+import json
+import threading
+
+from src.journal import LOG_EXTENSIONS
+
+CATALOG_FILE = "log_catalog.json"
+
+
+class LogCatalog:
+    """
+    Persistent list of saved session logs.
+    Folders are only re-listed when their mtime changes (a file was added,
+    removed or renamed); single files are re-stat'ed through update_file().
+    """
+
+    def __init__(self, base_dir, folders, extensions=LOG_EXTENSIONS):
+        self.base_dir = base_dir
+        self.folders = folders
+        self.extensions = extensions
+        self.path = os.path.join(base_dir, CATALOG_FILE)
+        self.data = {}  # {folder: {"mtime": float, "files": {name: [mtime, size]}}}
+        self._sorted = None
+        self._lock = threading.Lock()
+        # Set by update_file(save=False) until the next save()
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except Exception as e:
+            print(f"[CATALOG] Could not read {self.path}, rescanning: {e}")
+            self.data = {}
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            payload = json.dumps(self.data)
+            self.dirty = False
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[CATALOG] Could not save catalog: {e}")
+
+    def _scan_folder(self, folder, folder_path, mtime):
+        files = {}
+        with os.scandir(folder_path) as it:
+            for de in it:
+                if de.is_file() and de.name.endswith(self.extensions):
+                    st = de.stat()
+                    files[de.name] = [st.st_mtime, st.st_size]
+        self.data[folder] = {"mtime": mtime, "files": files}
+
+    def refresh(self):
+        """Rescans only folders whose mtime changed. Returns True if anything changed."""
+        changed = False
+        with self._lock:
+            for folder in self.folders:
+                folder_path = os.path.join(self.base_dir, folder)
+                try:
+                    mtime = os.stat(folder_path).st_mtime
+                except OSError:
+                    if folder in self.data:
+                        del self.data[folder]
+                        changed = True
+                    continue
+                cached = self.data.get(folder)
+                if cached and cached.get("mtime") == mtime:
+                    continue
+                self._scan_folder(folder, folder_path, mtime)
+                changed = True
+            if changed:
+                self._sorted = None
+        if changed:
+            self.save()
+        return changed
+
+    def update_file(self, path, save=True):
+        """
+        Records a single saved/rewritten log without rescanning its folder.
+        save=False only updates memory and marks the catalog dirty, for callers that batch saves.
+        """
+        folder = os.path.basename(os.path.dirname(path))
+        name = os.path.basename(path)
+        if folder not in self.folders or not name.endswith(self.extensions):
+            return
+        with self._lock:
+            entry = self.data.setdefault(folder, {"mtime": None, "files": {}})
+            try:
+                st = os.stat(path)
+                entry["files"][name] = [st.st_mtime, st.st_size]
+            except OSError:
+                entry["files"].pop(name, None)
+            try:
+                entry["mtime"] = os.stat(os.path.dirname(path)).st_mtime
+            except OSError:
+                pass
+            self._sorted = None
+            self.dirty = True
+        if save:
+            self.save()
+
+    def entries(self, query=""):
+        """[(path, name, size)] in sidebar order, optionally filtered by a substring."""
+        with self._lock:
+            if self._sorted is None:
+                ordered = []
+                for folder in self.folders:
+                    files = self.data.get(folder, {}).get("files", {})
+                    folder_path = os.path.join(self.base_dir, folder)
+                    for name in sorted(files, reverse=True):
+                        ordered.append((os.path.join(folder_path, name), name, files[name][1]))
+                self._sorted = ordered
+            entries = self._sorted
+
+        query = (query or "").strip().lower()
+        if not query:
+            return entries
+        return [e for e in entries if query in e[1].lower()]
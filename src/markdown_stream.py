@@ -0,0 +1,287 @@
+import re
+
+# Longest fence info string ("```python") held back before giving up on it
+MAX_LANG_CHARS = 40
+
+HEADING_RE = re.compile(r"#{1,6} ")
+LIST_RE = re.compile(r"(?:[-*+]|\d{1,3}[.)]) ")
+# Line starts that could still turn into a fence, heading or list item once more text arrives
+PARTIAL_LINE_START_RE = re.compile(r"(?:`{1,2}|'{1,2}|#{1,6}|[-*+]|\d{1,3}[.)]?)")
+
+# Next character that can end a plain run, per parser state
+PLAIN_END_RE = re.compile(r"[\n`*]")
+CODE_END_RE = re.compile(r"[\n`]")
+LINE_END_RE = re.compile(r"\n")
+
+TEXT = "text"
+CODE_START = "code_start"
+CODE_END = "code_end"
+
+
+class MarkdownStream:
+    """
+    Incremental markdown tokenizer for streamed replies.
+    feed() takes any slice of the reply and returns render events:
+      ("text", text, tag)      tag in None, "bold", "italic", "code_inline", "code_block", "heading", "list_bullet"
+      ("code_start", lang, None)
+      ("code_end", None, None)
+    Only a few characters that could still be the start of a marker are held back,
+    so the work per call is proportional to the new text, not to the whole reply.
+    Fences open with ``` or ''' (some models mix them up) and only close with the same kind,
+    at the start of a line. * runs follow CommonMark's flanking rules, except that a run with
+    word characters on both sides never opens emphasis, since its closer can't be seen yet.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pending = ""
+        self.line_start = True
+        self.bold = False
+        self.italic = False
+        self.inline_code = False
+        self.heading = False
+        self.fence = None  # "`" or "'" while inside a fenced block
+        self.lang = None  # info string being collected right after an opening fence
+        self.prev = "\n"  # last consumed character, for the flanking checks
+        self._events = []
+
+    def _tag(self):
+        if self.fence:
+            return "code_block"
+        if self.inline_code:
+            return "code_inline"
+        if self.heading:
+            return "heading"
+        if self.bold:
+            return "bold"
+        if self.italic:
+            return "italic"
+        return None
+
+    def _emit(self, text, tag=None):
+        if not text:
+            return
+        events = self._events
+        # Coalesce so the renderer does one insert per tag run
+        if events and events[-1][0] == TEXT and events[-1][2] == tag:
+            events[-1] = (TEXT, events[-1][1] + text, tag)
+        else:
+            events.append((TEXT, text, tag))
+
+    def feed(self, text, final=False):
+        buf = self.pending + text
+        self.pending = ""
+        i = 0
+        n = len(buf)
+
+        while i < n:
+            if self.lang is not None:
+                j = self._collect_lang(buf, i, final)
+                if j is None:
+                    # The partial info string is already kept in self.lang
+                    return self._take()
+            elif self.line_start:
+                j = self._line_start(buf, i, final)
+            else:
+                j = self._inline(buf, i, final)
+            if j is None:
+                self.pending = buf[i:]
+                return self._take()
+            if j > i:
+                self.prev = buf[j - 1]
+            i = j
+
+        return self._take()
+
+    def close(self):
+        """Flushes held-back text and closes anything the model left open."""
+        self._events = self.feed("", final=True)
+        if self.lang is not None:
+            self._events.append((CODE_START, self.lang.strip() or "Code", None))
+            self.lang = None
+            self.fence = self.fence or "`"
+        if self.fence:
+            self._events.append((CODE_END, None, None))
+        events = self._take()
+        self.reset()
+        return events
+
+    def _take(self):
+        events = self._events
+        self._events = []
+        return events
+
+    def _collect_lang(self, buf, i, final):
+        nl = buf.find("\n", i)
+        end = len(buf) if nl == -1 else nl
+        room = MAX_LANG_CHARS + 1 - len(self.lang)
+        if end - i >= room:
+            # Too long to be a language name: it is code on the fence line
+            head, self.lang = self.lang + buf[i:i + room], None
+            self._events.append((CODE_START, "Code", None))
+            self._emit(head, "code_block")
+            return i + room
+        self.lang += buf[i:end]
+        if nl == -1:
+            if not final:
+                return None
+            return len(buf)
+        lang, self.lang = self.lang.strip() or "Code", None
+        self._events.append((CODE_START, lang, None))
+        self.line_start = True
+        return nl + 1
+
+    def _line_start(self, buf, i, final):
+        """Decides what a new line starts with. Returns the next index, or None to wait for more text."""
+        j = i
+        n = len(buf)
+        while j < n and buf[j] in " \t":
+            j += 1
+        if j == n:
+            if final:
+                self._emit(buf[i:], self._tag())
+                return n
+            return None
+        indent = buf[i:j]
+        rest = buf[j:j + 8]
+
+        if self.fence:
+            marker = self.fence * 3
+            if rest.startswith(marker):
+                self.fence = None
+                self._events.append((CODE_END, None, None))
+                self.line_start = False
+                return j + 3
+            if not final and marker.startswith(rest):
+                return None
+            self.line_start = False
+            return i
+
+        if rest.startswith("```") or rest.startswith("'''"):
+            self._emit(indent, self._tag())
+            self.fence = rest[0]
+            self.lang = ""
+            self.line_start = False
+            return j + 3
+
+        m = HEADING_RE.match(rest)
+        if m:
+            self._emit(indent, None)
+            self.heading = True
+            self.line_start = False
+            return j + m.end()
+
+        m = LIST_RE.match(rest)
+        if m:
+            marker = m.group(0).strip()
+            bullet = "• " if marker in "-*+" else f"{marker} "
+            self._emit(indent, None)
+            self._emit(bullet, "list_bullet")
+            self.line_start = False
+            return j + m.end()
+
+        if not final and j + len(rest) == n and PARTIAL_LINE_START_RE.fullmatch(rest):
+            return None
+
+        self.line_start = False
+        return i
+
+    def _inline(self, buf, i, final):
+        """Emits text up to the next marker and consumes it. Returns the next index, or None to wait."""
+        n = len(buf)
+        if self.fence:
+            # Fences only close at the start of a line
+            pattern = LINE_END_RE
+        elif self.inline_code:
+            pattern = CODE_END_RE
+        else:
+            pattern = PLAIN_END_RE
+
+        m = pattern.search(buf, i)
+        j = m.start() if m else n
+        self._emit(buf[i:j], self._tag())
+        if j == n:
+            return n
+
+        ch = buf[j]
+        if ch == "\n":
+            if self.fence:
+                self._emit("\n", "code_block")
+            else:
+                # Unclosed inline styles don't bleed into the next line
+                self._emit("\n", "code_inline" if self.inline_code else None)
+                self.heading = False
+                self.bold = False
+                self.italic = False
+                self.inline_code = False
+            self.line_start = True
+            return j + 1
+
+        if ch == "*":
+            return self._emphasis(buf, i, j, final)
+
+        # Backtick run: 1 toggles inline code, 3 opens or closes a fence
+        k = j
+        while k < n and buf[k] == "`":
+            k += 1
+        if k == n and not final and k - j < 3:
+            return j if j > i else None
+        run = k - j
+        if run >= 3:
+            self.inline_code = False
+            self.fence = "`"
+            self.lang = ""
+            return j + 3
+        if run == 1:
+            self.inline_code = not self.inline_code
+            return k
+        self._emit(buf[j:k], self._tag())
+        return k
+
+    def _emphasis(self, buf, i, j, final):
+        """Consumes the * run at j: closes, opens or prints it. Returns the next index, or None to wait."""
+        n = len(buf)
+        k = j
+        while k < n and buf[k] == "*":
+            k += 1
+        if k == n and not final:
+            # Whether the run opens, closes or is literal depends on the next character
+            return j if j > i else None
+        prev = buf[j - 1] if j > 0 else self.prev
+        nxt = buf[k] if k < n else ""
+        left = not _space(nxt) and (not _punct(nxt) or _space(prev) or _punct(prev))
+        right = not _space(prev) and (not _punct(prev) or _space(nxt) or _punct(nxt))
+
+        run = k - j
+        if right:
+            if self.bold and self.italic and run >= 3:
+                self.bold = self.italic = False
+                run -= 3
+            elif self.bold and run >= 2:
+                self.bold = False
+                run -= 2
+            elif self.italic:
+                self.italic = False
+                run -= 1
+        elif left:
+            if run >= 3 and not self.bold and not self.italic:
+                self.bold = self.italic = True
+                run -= 3
+            elif run == 2 and not self.bold:
+                self.bold = True
+                run = 0
+            elif run == 1 and not self.italic:
+                self.italic = True
+                run = 0
+        self._emit("*" * run, self._tag())
+        return k
+
+
+def _space(ch):
+    return not ch or ch.isspace()
+
+
+def _punct(ch):
+    return not ch.isalnum() and not ch.isspace()
@@ -0,0 +1,266 @@
+import os
+import re
+import json
+import math
+import hashlib
+import threading
+from collections import Counter
+
+from src.journal import LOG_EXTENSIONS, read_log_text
+
+# One shard per indexed log, so an update rewrites only that log's chunks and embeddings
+SHARD_DIR = "shards"
+
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return [w.lower() for w in WORD_RE.findall(text)]
+
+
+def chunk_text(text, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Splits on paragraph/line boundaries into ~size character chunks with a small overlap."""
+    parts = [p.strip() for p in re.split(r"\n\s*\n|\n", text) if p.strip()]
+    chunks = []
+    current = ""
+    for part in parts:
+        while len(part) > size:
+            # A single huge line, hard split it
+            head, part = part[:size], part[size - overlap:]
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(head)
+        if current and len(current) + len(part) + 1 > size:
+            chunks.append(current)
+            current = current[-overlap:] + "\n" + part if overlap else part
+        else:
+            current = f"{current}\n{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class MemoryIndex:
+    """
+    Chunked retrieval index over the *_logs folders.
+    Ranks chunks with BM25 and (when an embedder is available) llama.cpp
+    embeddings, fused by reciprocal rank. Persisted as one shard per log and updated per file.
+    """
+
+    def __init__(self, index_dir, embedder=None):
+        self.index_dir = index_dir
+        self.shard_dir = os.path.join(index_dir, SHARD_DIR)
+        self.embedder = embedder  # callable(list[str]) -> list[list[float]] or None
+        self.files = {}   # {path: {"mtime", "size", "chunks": [chunk_id]}}
+        self.chunks = {}  # {chunk_id: {"path", "text", "tf", "len", "emb"}}
+        self.df = Counter()
+        self._lock = threading.RLock()
+        self.load()
+
+    # --- persistence ---
+
+    def _shard_path(self, path):
+        return os.path.join(self.shard_dir, hashlib.sha1(path.encode("utf-8")).hexdigest() + ".json")
+
+    def _add_shard(self, data):
+        path = data["path"]
+        self.files[path] = data["file"]
+        self.chunks.update(data["chunks"])
+        for chunk in data["chunks"].values():
+            self.df.update(chunk["tf"].keys())
+
+    def load(self):
+        if not os.path.isdir(self.shard_dir):
+            return
+        with self._lock:
+            for name in os.listdir(self.shard_dir):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.shard_dir, name), "r", encoding="utf-8") as f:
+                        self._add_shard(json.load(f))
+                except Exception as e:
+                    # Its log looks unindexed now and gets reindexed by the next sync
+                    print(f"[MEMORY] Could not read shard {name}, skipping: {e}")
+
+    def save_file(self, path):
+        """Writes (or deletes) the shard of one log; the rest of the index is untouched."""
+        shard_path = self._shard_path(path)
+        with self._lock:
+            entry = self.files.get(path)
+            if entry is not None:
+                data = json.dumps({
+                    "path": path,
+                    "file": entry,
+                    "chunks": {cid: self.chunks[cid] for cid in entry["chunks"] if cid in self.chunks},
+                })
+        if entry is None:
+            if os.path.exists(shard_path):
+                os.remove(shard_path)
+            return
+        os.makedirs(self.shard_dir, exist_ok=True)
+        tmp_path = shard_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, shard_path)
+
+    # --- updates ---
+
+    def _remove_file(self, path):
+        entry = self.files.pop(path, None)
+        if not entry:
+            return
+        for chunk_id in entry["chunks"]:
+            chunk = self.chunks.pop(chunk_id, None)
+            if chunk:
+                self.df.subtract(chunk["tf"].keys())
+        self.df += Counter()  # drop zero counts
+
+    def _embed(self, texts):
+        if not self.embedder or not texts:
+            return [None] * len(texts)
+        try:
+            return self.embedder(texts)
+        except Exception as e:
+            print(f"[MEMORY] Embedding failed, BM25 only: {e}")
+            return [None] * len(texts)
+
+    def update_file(self, path):
+        """(Re)indexes one log if its mtime or size changed. Returns True if anything changed."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                if path not in self.files:
+                    return False
+                self._remove_file(path)
+            self.save_file(path)
+            return True
+
+        with self._lock:
+            known = self.files.get(path)
+            if known and known["mtime"] == stat.st_mtime and known["size"] == stat.st_size:
+                return False
+
+        try:
+            text = read_log_text(path)
+        except Exception as e:
+            print(f"[MEMORY] Could not index {path}: {e}")
+            return False
+
+        pieces = chunk_text(text)
+        # A journal grows by a message per turn: only embed the chunks that changed
+        with self._lock:
+            known = self.files.get(path)
+            previous = {self.chunks[cid]["text"]: self.chunks[cid]["emb"] for cid in (known or {}).get("chunks", []) if cid in self.chunks}
+        fresh = [p for p in pieces if previous.get(p) is None]
+        embedded = dict(zip(fresh, self._embed(fresh)))
+        embeddings = [previous.get(p) if previous.get(p) is not None else embedded.get(p) for p in pieces]
+
+        with self._lock:
+            self._remove_file(path)
+            chunk_ids = []
+            for i, (piece, emb) in enumerate(zip(pieces, embeddings)):
+                chunk_id = hashlib.sha1(f"{path}|{i}".encode("utf-8")).hexdigest()
+                tf = Counter(tokenize(piece))
+                self.chunks[chunk_id] = {
+                    "path": path,
+                    "text": piece,
+                    "tf": dict(tf),
+                    "len": sum(tf.values()),
+                    "emb": emb,
+                }
+                self.df.update(tf.keys())
+                chunk_ids.append(chunk_id)
+            self.files[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "chunks": chunk_ids}
+
+        self.save_file(path)
+        print(f"[MEMORY] Indexed {os.path.basename(path)} ({len(pieces)} chunks).")
+        return True
+
+    def sync(self, folders, extensions=LOG_EXTENSIONS):
+        """Indexes new/changed logs and forgets deleted ones."""
+        seen = set()
+        changed = False
+        for folder in folders:
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.endswith(extensions):
+                    path = os.path.join(folder, name)
+                    seen.add(path)
+                    changed |= self.update_file(path)
+
+        with self._lock:
+            deleted = [p for p in self.files if p not in seen]
+            for path in deleted:
+                self._remove_file(path)
+        for path in deleted:
+            self.save_file(path)
+        return changed or bool(deleted)
+
+    # --- queries ---
+
+    def _bm25(self, query_terms, candidates):
+        n = len(self.chunks) or 1
+        avg_len = sum(c["len"] for c in self.chunks.values()) / n or 1.0
+        scores = {}
+        for chunk_id in candidates:
+            chunk = self.chunks[chunk_id]
+            score = 0.0
+            for term in query_terms:
+                tf = chunk["tf"].get(term)
+                if not tf:
+                    continue
+                df = self.df.get(term, 0)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * chunk["len"] / avg_len))
+            if score > 0:
+                scores[chunk_id] = score
+        return scores
+
+    def search(self, query, k=4, paths=None):
+        """Returns the top-k chunks as [(path, text, score)], optionally limited to some files."""
+        with self._lock:
+            if paths is not None:
+                candidates = [cid for p in paths for cid in self.files.get(p, {}).get("chunks", [])]
+            else:
+                candidates = list(self.chunks.keys())
+            if not candidates:
+                return []
+
+            bm25 = self._bm25(set(tokenize(query)), candidates)
+            fused = {}
+            for rank, chunk_id in enumerate(sorted(bm25, key=bm25.get, reverse=True)):
+                fused[chunk_id] = 1.0 / (RRF_K + rank + 1)
+
+            with_emb = [cid for cid in candidates if self.chunks[cid].get("emb")]
+
+        if with_emb:
+            query_emb = self._embed([query])[0]
+            if query_emb:
+                with self._lock:
+                    sims = {cid: _cosine(query_emb, self.chunks[cid]["emb"]) for cid in with_emb if cid in self.chunks}
+                for rank, chunk_id in enumerate(sorted(sims, key=sims.get, reverse=True)):
+                    fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        top = sorted(fused, key=fused.get, reverse=True)[:k]
+        with self._lock:
+            return [(self.chunks[c]["path"], self.chunks[c]["text"], fused[c]) for c in top if c in self.chunks]
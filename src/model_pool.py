@@ -0,0 +1,254 @@
+import os
+import gc
+import threading
+from collections import OrderedDict
+
+from src import load_profiles
+from src.state_cache import RoleStateCache
+from src.prefix_cache import PrefixStateCache
+
+# CUDA context and compute buffers of a model with offloaded layers
+VRAM_OVERHEAD_BYTES = 512 * 1024 ** 2
+# KV cache assumed for a model whose GGUF header can't be read
+UNKNOWN_KV_BYTES = 2 * 1024 ** 3
+
+
+class PoolEntry:
+    """A resident model plus the KV caches that only make sense for it."""
+
+    def __init__(self, name, llm, path, load_kwargs, size_bytes, vram_bytes=0):
+        self.name = name
+        self.llm = llm
+        self.path = path
+        self.load_kwargs = load_kwargs
+        self.size_bytes = size_bytes
+        self.vram_bytes = vram_bytes
+        self.role_states = RoleStateCache(capacity_bytes=2 * 1024 ** 3)
+        self.prefix_cache = PrefixStateCache(capacity_bytes=2 * 1024 ** 3)
+        self.active_role = None
+        # A drafter forces logits_all, so save_state() would copy the whole n_ctx x n_vocab
+        # scores array (GBs) only for the caps to drop it: speculative entries keep no snapshots
+        self.speculative = getattr(llm, "draft_model", None) is not None
+        if hasattr(llm, "set_cache") and not self.speculative:
+            llm.set_cache(self.prefix_cache)
+
+    def close(self):
+        self.role_states.clear()
+        self.prefix_cache.clear()
+        # A draft GGUF holds its own context; free it with the model it drafts for
+        drafter = getattr(getattr(self.llm, "draft_model", None), "inner", None)
+        if hasattr(drafter, "close"):
+            drafter.close()
+        if hasattr(self.llm, "close"):
+            try:
+                self.llm.close()
+            except Exception:
+                pass
+        self.llm = None
+
+
+class ModelPool:
+    """
+    Keeps recently used models resident (mmapped) within a RAM budget.
+    Least recently used models are evicted first; models can be loaded in the
+    background so a later swap only has to flip a pointer.
+    budget_bytes counts host RAM (weights file + KV cache of the CPU layers). vram_budget_bytes counts the
+    offloaded layers; unlike RAM it is never overcommitted, the current model is evicted first.
+    """
+
+    def __init__(self, loader, budget_bytes=24 * 1024 ** 3, vram_budget_bytes=None):
+        self.loader = loader  # callable(**load_kwargs) -> Llama
+        self.budget_bytes = budget_bytes
+        self.vram_budget_bytes = vram_budget_bytes
+        self._entries = OrderedDict()  # {name: PoolEntry}
+        self._loading = {}             # {name: threading.Event}
+        self._errors = {}              # {name: str}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _footprint(path, load_kwargs):
+        """(file size, offloaded share of the layers, KV cache bytes or None) from the GGUF header."""
+        layers = load_kwargs.get("n_gpu_layers", 0)
+        try:
+            size = os.path.getsize(path)
+            dims = load_profiles.model_dims(path)
+        except Exception:
+            size, dims = 0, None
+        if not dims:
+            # Unknown layer count: any offload is assumed to take the whole model
+            return size, 1.0 if layers else 0.0, None
+        share = 1.0 if layers < 0 else min(1.0, layers / dims["n_layer"])
+        kv = load_profiles.kv_cache_bytes(
+            dims, load_kwargs.get("n_ctx", 4096),
+            load_profiles.kv_type_name(load_kwargs.get("type_k")), load_profiles.kv_type_name(load_kwargs.get("type_v"))
+        )
+        return size, share, kv
+
+    @classmethod
+    def estimate_bytes(cls, path, load_kwargs):
+        """Host RAM of a resident model: the mmapped weights plus the KV cache of the layers left on the CPU."""
+        size, share, kv = cls._footprint(path, load_kwargs)
+        if kv is None:
+            kv = UNKNOWN_KV_BYTES
+        return size + int(kv * (1.0 - share))
+
+    @classmethod
+    def estimate_vram_bytes(cls, path, load_kwargs):
+        """Weights and KV cache of the offloaded layers, from the GGUF header; 0 when nothing is offloaded."""
+        if not load_kwargs.get("n_gpu_layers", 0):
+            return 0
+        size, share, kv = cls._footprint(path, load_kwargs)
+        if kv is None:
+            return size + VRAM_OVERHEAD_BYTES
+        return int((size + kv) * share) + VRAM_OVERHEAD_BYTES
+
+    def resident(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def is_resident(self, name, load_kwargs=None):
+        with self._lock:
+            entry = self._entries.get(name)
+            return entry is not None and (load_kwargs is None or entry.load_kwargs == load_kwargs)
+
+    def _used_bytes(self):
+        return sum(e.size_bytes for e in self._entries.values())
+
+    def _used_vram(self, names=None):
+        return sum(e.vram_bytes for n, e in self._entries.items() if names is None or n in names)
+
+    def _vram_fits(self, needed_vram, names=None):
+        return not self.vram_budget_bytes or self._used_vram(names) + needed_vram <= self.vram_budget_bytes
+
+    def _evict_for(self, needed, needed_vram, keep, evict_kept=True):
+        """
+        Evicts LRU entries until needed RAM and VRAM fit. RAM never evicts entries in keep;
+        VRAM does when evict_kept, since an overcommitted GPU fails the load. Caller holds the lock.
+        """
+        evicted = []
+        for name in list(self._entries.keys()):
+            if self._used_bytes() + needed <= self.budget_bytes and self._vram_fits(needed_vram):
+                break
+            if name in keep:
+                continue
+            evicted.append(self._entries.pop(name))
+        for name in list(self._entries.keys()):
+            if not evict_kept or self._vram_fits(needed_vram):
+                break
+            evicted.append(self._entries.pop(name))
+        return evicted
+
+    def _close_entries(self, entries):
+        for entry in entries:
+            print(f"[POOL] Evicting {entry.name} (LRU).")
+            entry.close()
+        if entries:
+            gc.collect()
+
+    def _load(self, name, path, load_kwargs, keep, evict_kept=True):
+        needed = self.estimate_bytes(path, load_kwargs)
+        needed_vram = self.estimate_vram_bytes(path, load_kwargs)
+        with self._lock:
+            stale = self._entries.pop(name, None)
+            evicted = self._evict_for(needed, needed_vram, keep | {name}, evict_kept)
+            if stale is not None:
+                evicted.append(stale)
+            if self._used_bytes() + needed > self.budget_bytes:
+                print(f"[POOL] {name} exceeds the remaining budget, loading anyway.")
+        self._close_entries(evicted)
+
+        while True:
+            print(f"[POOL] Loading {name} from: {path}")
+            try:
+                llm = self.loader(model_path=path, **load_kwargs)
+                break
+            except Exception as e:
+                # Usually out of memory: free the least recently used model and try again
+                with self._lock:
+                    victims = [n for n in self._entries if n != name and (evict_kept or n not in keep)]
+                    victim = self._entries.pop(victims[0]) if victims else None
+                if victim is None:
+                    raise
+                print(f"[POOL] Loading {name} failed ({e}), retrying without {victim.name}.")
+                self._close_entries([victim])
+        entry = PoolEntry(name, llm, path, load_kwargs, needed, needed_vram)
+        with self._lock:
+            self._entries[name] = entry
+        return entry
+
+    def acquire(self, name, path, load_kwargs, keep=(), evict_kept=True):
+        """
+        Returns a resident entry for name, loading it (or waiting on a prefetch) if needed.
+        evict_kept=False never frees models in keep, not even to make VRAM room.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry.load_kwargs == load_kwargs:
+                    self._entries.move_to_end(name)
+                    print(f"[POOL] {name} already resident.")
+                    return entry
+                pending = self._loading.get(name)
+                if pending is None:
+                    pending = self._loading[name] = threading.Event()
+                    self._errors.pop(name, None)
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                # A background prefetch is already loading it
+                pending.wait()
+                with self._lock:
+                    error = self._errors.pop(name, None)
+                if error:
+                    raise RuntimeError(error)
+                continue
+
+            try:
+                return self._load(name, path, load_kwargs, set(keep), evict_kept)
+            except Exception as e:
+                with self._lock:
+                    self._errors[name] = str(e)
+                raise
+            finally:
+                with self._lock:
+                    self._loading.pop(name, None)
+                pending.set()
+
+    def prefetch(self, name, path, load_kwargs, keep=()):
+        """Loads a model on a background thread so the next swap is instant."""
+        if self.is_resident(name, load_kwargs):
+            return False
+        needed_vram = self.estimate_vram_bytes(path, load_kwargs)
+        with self._lock:
+            if name in self._loading:
+                return False
+            if not self._vram_fits(needed_vram, set(keep)):
+                # Would have to evict the model in use
+                print(f"[POOL] Not prefetching {name}: it does not fit in VRAM next to {', '.join(keep)}.")
+                return False
+
+        def task():
+            try:
+                self.acquire(name, path, load_kwargs, keep=keep, evict_kept=False)
+                print(f"[POOL] Prefetched {name}.")
+            except Exception as e:
+                print(f"[POOL] Prefetch failed for {name}: {e}")
+
+        threading.Thread(target=task, daemon=True).start()
+        return True
+
+    def release(self, name):
+        with self._lock:
+            entry = self._entries.pop(name, None)
+        if entry:
+            self._close_entries([entry])
+            return True
+        return False
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        self._close_entries(entries)
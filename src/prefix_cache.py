@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+
+from llama_cpp.llama_cache import BaseLlamaCache
+
+from src.state_cache import state_nbytes
+
+
+class _Node:
+    __slots__ = ("children", "entry", "count")
+
+    def __init__(self):
+        self.children = {}
+        self.entry = None  # key tuple if a snapshot ends exactly here
+        self.count = 0     # live snapshots at or below this node
+
+
+class PrefixStateCache(BaseLlamaCache):
+    """
+    Token-prefix trie of llama.cpp states, shared by every role.
+    Plugged in with llm.set_cache(); lookups return the snapshot sharing the
+    longest token prefix with the prompt (e.g. system prompt + loaded memory),
+    so another tab only evaluates what comes after that prefix.
+    """
+
+    def __init__(self, capacity_bytes=2 * 1024 ** 3, min_prefix=32):
+        super().__init__(capacity_bytes)
+        self.min_prefix = min_prefix
+        self._root = _Node()
+        self._entries = OrderedDict()  # {key: (state, nbytes)}
+        self._size = 0
+        self._lock = threading.RLock()
+
+    @property
+    def cache_size(self):
+        return self._size
+
+    def _walk(self, key):
+        """Returns (deepest node matching key, matched length)."""
+        node = self._root
+        depth = 0
+        for tok in key:
+            child = node.children.get(tok)
+            if child is None:
+                break
+            node = child
+            depth += 1
+        return node, depth
+
+    def _any_entry(self, node):
+        # Every live node has count > 0, so descending always reaches an entry
+        while node.entry is None:
+            node = next(c for c in node.children.values() if c.count > 0)
+        return node.entry
+
+    def longest_prefix(self, key):
+        with self._lock:
+            _, depth = self._walk(key)
+            return depth
+
+    def __contains__(self, key):
+        with self._lock:
+            _, depth = self._walk(key)
+            return depth >= self.min_prefix and self._root.count > 0
+
+    def __getitem__(self, key):
+        with self._lock:
+            node, depth = self._walk(key)
+            if depth < self.min_prefix or node.count == 0:
+                raise KeyError("Key not found")
+            entry = self._any_entry(node)
+            self._entries.move_to_end(entry)
+            print(f"[CACHE] Prefix hit: {depth}/{len(key)} tokens reusable.")
+            return self._entries[entry][0]
+
+    def __setitem__(self, key, value):
+        key = tuple(key)
+        size = state_nbytes(value)
+        if size > self.capacity_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            node = self._root
+            node.count += 1
+            for tok in key:
+                child = node.children.get(tok)
+                if child is None:
+                    child = node.children[tok] = _Node()
+                child.count += 1
+                node = child
+            node.entry = key
+
+            self._entries[key] = (value, size)
+            self._size += size
+
+            while self._size > self.capacity_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self._size -= size
+
+        node = self._root
+        node.count -= 1
+        for tok in key:
+            child = node.children[tok]
+            child.count -= 1
+            if child.count == 0:
+                # Nothing else lives below, drop the whole branch
+                del node.children[tok]
+                return
+            node = child
+        node.entry = None
+
+    def clear(self):
+        with self._lock:
+            self._root = _Node()
+            self._entries.clear()
+            self._size = 0
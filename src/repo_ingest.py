@@ -0,0 +1,243 @@
+import os
+import re
+import math
+import fnmatch
+import zipfile
+
+import requests
+
+REQUEST_TIMEOUT = 15
+MAX_FILE_BYTES = 200 * 1024
+MAX_FILES = 3000
+
+INCLUDE_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".go", ".rs", ".java", ".kt", ".swift", ".c", ".h",
+    ".cpp", ".hpp", ".cc", ".cs", ".rb", ".php", ".lua", ".sh", ".ps1", ".md", ".rst", ".txt",
+    ".toml", ".yaml", ".yml", ".json", ".cfg", ".ini", ".html", ".css", ".sql",
+}
+INCLUDE_NAMES = {"Makefile", "Dockerfile", "LICENSE", "CMakeLists.txt"}
+EXCLUDE_DIRS = {
+    ".git", ".github", "node_modules", "dist", "build", "vendor", "__pycache__", ".venv", "venv",
+    "env", "target", ".idea", ".vscode", "site-packages", ".mypy_cache", ".pytest_cache", "third_party",
+}
+EXCLUDE_GLOBS = ["*.min.js", "*.min.css", "*.lock", "package-lock.json", "*.map", "*.svg", "*.ipynb"]
+
+ENTRY_POINTS = {
+    "main.py", "__main__.py", "app.py", "cli.py", "manage.py", "setup.py", "pyproject.toml",
+    "index.js", "index.ts", "main.js", "main.ts", "server.js", "package.json",
+    "main.go", "go.mod", "main.rs", "lib.rs", "Cargo.toml", "Main.java", "Program.cs",
+}
+
+GITHUB_RE = re.compile(r"github\.com[/:]([^/\s]+)/([^/\s#?]+?)(?:\.git)?(?:/(?:tree|blob)/([^\s#?]+?))?/?(?:[#?].*)?$")
+
+
+def parse_github_url(url):
+    """
+    Returns (owner, repo, rest or None), or None if this isn't a GitHub repo link.
+    rest is everything after /tree/ or /blob/: the ref followed by an optional path.
+    Refs may contain "/" too, so splitting it takes the API (see RepoIngester.resolve_ref_path).
+    """
+    match = GITHUB_RE.search(url.strip())
+    if not match:
+        return None
+    return match.group(1), match.group(2), match.group(3)
+
+
+def in_subdir(rel_path, subdir):
+    """True if rel_path is subdir itself (a single file) or lies below it."""
+    return not subdir or rel_path == subdir or rel_path.startswith(subdir + "/")
+
+
+def is_included(rel_path, size):
+    parts = rel_path.replace("\\", "/").split("/")
+    if any(p in EXCLUDE_DIRS for p in parts[:-1]):
+        return False
+    name = parts[-1]
+    if any(fnmatch.fnmatch(name, g) for g in EXCLUDE_GLOBS):
+        return False
+    if size > MAX_FILE_BYTES:
+        return False
+    return name in INCLUDE_NAMES or os.path.splitext(name)[1].lower() in INCLUDE_EXTENSIONS
+
+
+def rank_file(rel_path, size):
+    """Higher is more informative: README, entry points, then big modules near the root."""
+    parts = rel_path.split("/")
+    name = parts[-1]
+    depth = len(parts) - 1
+    lower = name.lower()
+    score = 0.0
+    if lower.startswith("readme"):
+        score += 100 if depth == 0 else 40
+    elif name in ENTRY_POINTS:
+        score += 80
+    elif lower.endswith((".md", ".rst")):
+        score += 25
+    else:
+        score += 10 + math.log2(max(size, 1))
+    if any(p in ("test", "tests", "spec", "examples", "docs") for p in parts[:-1]) or lower.startswith("test_"):
+        score -= 15
+    return score - 3 * depth
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class RepoIngester:
+    """
+    Turns a GitHub link (or a local clone path) into a ranked, token-budgeted digest.
+    Archives are downloaded once per commit and cached on disk.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "Roa.ai/2.0"
+
+    def lookup_commit(self, owner, repo, ref):
+        """Commit SHA of ref, or None if GitHub doesn't know it."""
+        url = f"https://api.github.com/repos/{owner}/{repo}/commits/{ref or 'HEAD'}"
+        try:
+            resp = self.session.get(url, headers={"Accept": "application/vnd.github.sha"}, timeout=REQUEST_TIMEOUT)
+            if resp.status_code == 200 and re.fullmatch(r"[0-9a-f]{40}", resp.text.strip()):
+                return resp.text.strip()
+            print(f"[REPO] Could not resolve {ref or 'HEAD'} (HTTP {resp.status_code}).")
+        except requests.RequestException as e:
+            print(f"[REPO] Could not resolve commit: {e}")
+        return None
+
+    def resolve_commit(self, owner, repo, ref):
+        commit = self.lookup_commit(owner, repo, ref)
+        if commit is None:
+            print(f"[REPO] Caching {ref or 'HEAD'} by ref name.")
+        return commit or ref or "HEAD"
+
+    def resolve_ref_path(self, owner, repo, rest):
+        """
+        Splits "<ref>/<path>" from a /tree/ or /blob/ link into (ref, commit, path).
+        Git forbids a ref that is a prefix of another ("a" next to "a/b"), so the
+        shortest prefix that resolves is the ref and the remainder is the path.
+        """
+        if not rest:
+            return None, self.resolve_commit(owner, repo, None), ""
+        segments = rest.strip("/").split("/")
+        for i in range(1, len(segments) + 1):
+            ref = "/".join(segments[:i])
+            commit = self.lookup_commit(owner, repo, ref)
+            if commit:
+                return ref, commit, "/".join(segments[i:])
+        # Offline or rate limited: assume a plain ref and cache by its name
+        print(f"[REPO] Caching {segments[0]} by ref name.")
+        return segments[0], segments[0], "/".join(segments[1:])
+
+    def fetch_archive(self, owner, repo, commit):
+        """Returns the path of the cached zip for this commit, downloading it if needed."""
+        path = os.path.join(self.cache_dir, f"{owner}__{repo}__{commit.replace('/', '_')}.zip")
+        if os.path.exists(path):
+            print(f"[REPO] Using cached archive {os.path.basename(path)}")
+            return path
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        url = f"https://codeload.github.com/{owner}/{repo}/zip/{commit}"
+        print(f"[REPO] Downloading {url}")
+        tmp_path = path + ".tmp"
+        with self.session.get(url, stream=True, timeout=REQUEST_TIMEOUT) as resp:
+            resp.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for block in resp.iter_content(chunk_size=1024 * 1024):
+                    f.write(block)
+        os.replace(tmp_path, path)
+        return path
+
+    def list_zip(self, zf, subdir=""):
+        """
+        (rel_path, size, read) for the best-ranked included files, with rel_path relative to subdir.
+        Only names and sizes from the central directory are looked at; read() decompresses on demand.
+        """
+        files = []
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            # Drop the archive's top folder
+            rel = info.filename.split("/", 1)[1] if "/" in info.filename else info.filename
+            if not in_subdir(rel, subdir):
+                continue
+            if subdir and rel != subdir:
+                rel = rel[len(subdir) + 1:]
+            if not is_included(rel, info.file_size):
+                continue
+            files.append((rel, info.file_size, lambda info=info: zf.read(info)))
+        files.sort(key=lambda f: rank_file(f[0], f[1]), reverse=True)
+        return files[:MAX_FILES]
+
+    def list_local(self, root):
+        """(rel_path, size, read) for the best-ranked included files under root."""
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in EXCLUDE_DIRS)
+            for name in sorted(filenames):
+                full = os.path.join(dirpath, name)
+                rel = os.path.relpath(full, root).replace("\\", "/")
+                try:
+                    size = os.path.getsize(full)
+                except OSError:
+                    continue
+                if not is_included(rel, size):
+                    continue
+                files.append((rel, size, lambda full=full: read_file(full)))
+        files.sort(key=lambda f: rank_file(f[0], f[1]), reverse=True)
+        return files[:MAX_FILES]
+
+    def build_digest(self, title, files, budget_tokens, count_tokens):
+        """
+        Tree listing first, then file contents in rank order until the budget is spent.
+        files holds (rel_path, size, read); only the files that make it into the digest are read.
+        """
+        files = sorted(files, key=lambda f: rank_file(f[0], f[1]), reverse=True)
+        tree = "\n".join(sorted(f[0] for f in files)[:400])
+        parts = [f"REPOSITORY: {title}\n\nFILE TREE:\n{tree}\n"]
+        used = count_tokens(parts[0])
+        # No single file may take more than a third of the budget
+        per_file_cap = max(256, budget_tokens // 3)
+
+        for rel, size, read in files:
+            if used >= budget_tokens:
+                break
+            text = read().decode("utf-8", errors="replace")
+            block = f"\n### {rel}\n{text}\n"
+            n = count_tokens(block)
+            room = min(per_file_cap, budget_tokens - used)
+            if n > room:
+                # Keep the top of the file, it usually holds imports, docs and the main API
+                ratio = room / n
+                block = block[:int(len(block) * ratio * 0.95)] + "\n[...truncated]\n"
+                n = count_tokens(block)
+            parts.append(block)
+            used += n
+
+        return "".join(parts)
+
+    def ingest(self, link, budget_tokens, count_tokens):
+        """Returns (title, digest) for a GitHub URL or a local directory."""
+        if os.path.isdir(link):
+            title = os.path.basename(os.path.abspath(link))
+            return title, self.digest_files(title, self.list_local(link), "", budget_tokens, count_tokens)
+
+        parsed = parse_github_url(link)
+        if not parsed:
+            raise ValueError(f"Not a GitHub repository link or local folder: {link}")
+        owner, repo, rest = parsed
+        _, commit, subdir = self.resolve_ref_path(owner, repo, rest)
+        zip_path = self.fetch_archive(owner, repo, commit)
+        title = f"{owner}/{repo}@{commit[:12]}" + (f"/{subdir}" if subdir else "")
+        # The archive stays open while the digest reads the files it keeps
+        with zipfile.ZipFile(zip_path) as zf:
+            return title, self.digest_files(title, self.list_zip(zf, subdir), subdir, budget_tokens, count_tokens)
+
+    def digest_files(self, title, files, subdir, budget_tokens, count_tokens):
+        if not files:
+            raise ValueError(f"No readable source files found{' under ' + subdir if subdir else ''}.")
+        print(f"[REPO] {title}: {len(files)} files after filters.")
+        return self.build_digest(title, files, budget_tokens, count_tokens)
@@ -0,0 +1,160 @@
+import heapq
+import itertools
+import threading
+import collections
+from contextlib import contextmanager
+
+# Lower runs first: chat turns go ahead of queued summarization work
+INTERACTIVE = 0
+BACKGROUND = 10
+
+
+class PriorityLock:
+    """
+    Mutex whose waiters are served by priority, then in arrival order.
+    A llama.cpp context decodes one sequence at a time, so every request on a model
+    takes turns through this lock; `with lock:` acquires at INTERACTIVE priority.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._held = False
+        self._waiters = []  # heap of (priority, seq, threading.Event)
+        self._seq = itertools.count()
+
+    def acquire(self, priority=INTERACTIVE, blocking=True, should_stop=None):
+        """Returns True once held; False if not blocking and busy, or if should_stop() fired while queued."""
+        with self._mutex:
+            if not self._held and not self._waiters:
+                self._held = True
+                return True
+            if not blocking:
+                return False
+            entry = (priority, next(self._seq), threading.Event())
+            heapq.heappush(self._waiters, entry)
+
+        event = entry[2]
+        while not event.wait(0.1):
+            if should_stop and should_stop():
+                with self._mutex:
+                    if not event.is_set():
+                        self._waiters.remove(entry)
+                        heapq.heapify(self._waiters)
+                        return False
+                # Handed over just as we gave up: pass it on
+                self.release()
+                return False
+        return True
+
+    def release(self):
+        with self._mutex:
+            if self._waiters:
+                # Ownership moves straight to the next waiter, nobody can barge in between
+                heapq.heappop(self._waiters)[2].set()
+            else:
+                self._held = False
+
+    def waiting(self):
+        with self._mutex:
+            return len(self._waiters)
+
+    @contextmanager
+    def hold(self, priority=INTERACTIVE):
+        self.acquire(priority)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class GenerationRequest:
+    """
+    One reply being produced for one tab. Decode threads push tokens,
+    the UI drains them into request.textbox on its own frame clock.
+    timeout_s and token_limit travel with the request and are enforced by the backend.
+    """
+
+    def __init__(self, role, textbox, prompt, priority=INTERACTIVE, timeout_s=None, token_limit=None):
+        self.role = role
+        self.textbox = textbox
+        self.prompt = prompt
+        self.priority = priority
+        self.timeout_s = timeout_s
+        self.token_limit = token_limit
+        self.response = ""
+        self.tokens = collections.deque()
+        self._stop = threading.Event()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def stop(self):
+        self._stop.set()
+
+    def limits(self):
+        limits = {"timeout_s": self.timeout_s, "token_limit": self.token_limit}
+        return {k: v for k, v in limits.items() if v is not None}
+
+    def push(self, token):
+        """Safe to call from any thread."""
+        self.tokens.append(token)
+
+    def drain(self):
+        batch = []
+        while self.tokens:
+            batch.append(self.tokens.popleft())
+        return "".join(batch)
+
+
+class GenerationScheduler:
+    """
+    Tracks the in-flight request of every tab. Each tab can have one reply running;
+    different tabs run side by side and queue on the backend's PriorityLock.
+    """
+
+    def __init__(self):
+        self._active = {}  # {role: GenerationRequest}
+        self._lock = threading.Lock()
+
+    def submit(self, request, target, *args):
+        """Runs target(request, *args) on a thread. Returns False if the tab is already busy."""
+        with self._lock:
+            if request.role in self._active:
+                return False
+            self._active[request.role] = request
+        threading.Thread(target=target, args=(request,) + args, daemon=True).start()
+        return True
+
+    def finish(self, request):
+        with self._lock:
+            if self._active.get(request.role) is request:
+                del self._active[request.role]
+
+    def get(self, role):
+        with self._lock:
+            return self._active.get(role)
+
+    def is_busy(self, role):
+        return self.get(role) is not None
+
+    def active(self):
+        with self._lock:
+            return list(self._active.values())
+
+    def any_active(self):
+        with self._lock:
+            return bool(self._active)
+
+    def stop(self, role=None):
+        """Stops one tab's request, or all of them."""
+        for request in self.active():
+            if role is None or request.role == role:
+                request.stop()
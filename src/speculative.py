@@ -0,0 +1,122 @@
+import numpy as np
+
+try:
+    from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+    HAS_SPECULATIVE = True
+except ImportError:
+    LlamaDraftModel = object
+    HAS_SPECULATIVE = False
+
+# Values of the "speculative" load setting
+LOOKUP = "lookup"
+DRAFT = "draft"
+
+# Tokens proposed per step. Verification is one batched forward pass, so on a GPU a long
+# guess costs little; a CPU pays for every drafted token
+LOOKUP_TOKENS_GPU = 10
+LOOKUP_TOKENS_CPU = 2
+DRAFT_TOKENS = 6
+LOOKUP_MAX_NGRAM = 3
+
+
+class DraftModel(LlamaDraftModel):
+    """
+    Greedy drafts from a small GGUF that shares the target's tokenizer
+    (e.g. Qwen2.5-Coder-0.5B for the 7B). Keeps its own context and only
+    evaluates the tokens that changed since the previous call.
+    """
+
+    def __init__(self, model_path, n_ctx, num_pred_tokens=DRAFT_TOKENS, n_gpu_layers=-1, n_threads=None):
+        from llama_cpp import Llama
+        self.num_pred_tokens = num_pred_tokens
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_gpu_layers=n_gpu_layers, n_threads=n_threads, verbose=False)
+
+    def _sync(self, input_ids):
+        """Brings the draft context to input_ids, reusing the common prefix."""
+        llm = self.llm
+        cached = llm.input_ids[:llm.n_tokens]
+        n = min(len(cached), len(input_ids) - 1)  # always re-evaluate the last token for fresh logits
+        prefix = 0
+        while prefix < n and cached[prefix] == input_ids[prefix]:
+            prefix += 1
+        llm.n_tokens = prefix
+        llm.eval(input_ids[prefix:].tolist())
+
+    def _greedy(self):
+        # Logits of the last evaluated token straight from the context; llama-cpp-python
+        # only mirrors them into .scores when logits_all is set
+        logits = np.ctypeslib.as_array(self.llm._ctx.get_logits(), shape=(self.llm.n_vocab(),))
+        return int(np.argmax(logits))
+
+    def __call__(self, input_ids, /, **kwargs):
+        room = self.llm.n_ctx() - len(input_ids) - 1
+        if room <= 0:
+            return np.array([], dtype=np.intc)
+        self._sync(input_ids)
+        draft = []
+        for _ in range(min(self.num_pred_tokens, room)):
+            token = self._greedy()
+            if token == self.llm.token_eos():
+                break
+            draft.append(token)
+            self.llm.eval([token])
+        return np.array(draft, dtype=np.intc)
+
+    def close(self):
+        if hasattr(self.llm, "close"):
+            self.llm.close()
+
+
+class AcceptanceCounter(LlamaDraftModel):
+    """
+    Wraps a draft model and measures how many drafted tokens the target kept:
+    at each call, the tokens generated since the previous call are compared with
+    what was drafted for those positions.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.drafted = 0
+        self.accepted = 0
+        self._pending = None  # (position, drafted tokens)
+
+    def _score_pending(self, input_ids):
+        if self._pending is None:
+            return
+        start, draft = self._pending
+        self._pending = None
+        actual = input_ids[start:start + len(draft)]
+        for guess, token in zip(draft, actual):
+            if guess != token:
+                break
+            self.accepted += 1
+
+    def __call__(self, input_ids, /, **kwargs):
+        self._score_pending(input_ids)
+        draft = self.inner(input_ids, **kwargs)
+        if len(draft):
+            self.drafted += len(draft)
+            self._pending = (len(input_ids), [int(t) for t in draft])
+        return draft
+
+    def reset(self):
+        """Starts a new reply; the last draft of the previous one can't be scored anymore."""
+        self._pending = None
+        self.drafted = self.accepted = 0
+
+    def acceptance_rate(self):
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+
+def build_draft(mode, n_gpu_layers, n_ctx, draft_path=None, n_threads=None):
+    """Returns an AcceptanceCounter around the requested drafter, or None when unavailable."""
+    if not HAS_SPECULATIVE or not mode:
+        return None
+    if mode == LOOKUP:
+        n_pred = LOOKUP_TOKENS_GPU if n_gpu_layers else LOOKUP_TOKENS_CPU
+        inner = LlamaPromptLookupDecoding(max_ngram_size=LOOKUP_MAX_NGRAM, num_pred_tokens=n_pred)
+    elif mode == DRAFT and draft_path:
+        inner = DraftModel(draft_path, n_ctx, n_gpu_layers=-1 if n_gpu_layers else 0, n_threads=n_threads)
+    else:
+        return None
+    return AcceptanceCounter(inner)
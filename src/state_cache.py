@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+
+def state_nbytes(state):
+    """Rough RAM footprint of a LlamaState snapshot."""
+    size = getattr(state, "llama_state_size", 0) or 0
+    for field in ("input_ids", "scores"):
+        arr = getattr(state, field, None)
+        if arr is not None:
+            size += getattr(arr, "nbytes", 0)
+    return size
+
+
+class RoleStateCache:
+    """
+    Keeps one llama.cpp state snapshot per chat role (RANDOM, PERSONAL, ...).
+    Bounded by capacity_bytes, least recently used role is evicted first.
+    """
+
+    def __init__(self, capacity_bytes=3 * 1024 ** 3):
+        self.capacity_bytes = capacity_bytes
+        self._states = OrderedDict()  # {role: LlamaState}
+        self._lock = threading.Lock()
+
+    def __contains__(self, role):
+        with self._lock:
+            return role in self._states
+
+    def __len__(self):
+        with self._lock:
+            return len(self._states)
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(state_nbytes(s) for s in self._states.values())
+
+    def get(self, role):
+        with self._lock:
+            state = self._states.get(role)
+            if state is not None:
+                self._states.move_to_end(role)
+            return state
+
+    def put(self, role, state):
+        size = state_nbytes(state)
+        if size > self.capacity_bytes:
+            print(f"[CACHE] {role} state ({size // (1024 * 1024)} MB) exceeds cache capacity, skipping.")
+            return False
+
+        with self._lock:
+            self._states.pop(role, None)
+            self._states[role] = state
+            total = sum(state_nbytes(s) for s in self._states.values())
+            while total > self.capacity_bytes and len(self._states) > 1:
+                old_role, old_state = self._states.popitem(last=False)
+                total -= state_nbytes(old_state)
+                print(f"[CACHE] Evicted {old_role} state (LRU).")
+        return True
+
+    def discard(self, role):
+        with self._lock:
+            return self._states.pop(role, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
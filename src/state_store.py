@@ -0,0 +1,114 @@
+import os
+import json
+import zlib
+import pickle
+import hashlib
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+from src.journal import log_stem
+
+MAGIC = b"ROAKV1\n"
+STATE_EXT = ".kvstate"
+
+
+def state_path_for(log_path):
+    """Sidecar path for a saved session log (Diary_2026-01-10.jsonl -> Diary_2026-01-10.kvstate)."""
+    return log_stem(log_path) + STATE_EXT
+
+
+def prompt_hash(state):
+    """Hash of the token ids that were evaluated into the snapshot."""
+    tokens = state.input_ids[:state.n_tokens]
+    return hashlib.sha256(tokens.tobytes()).hexdigest()
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def state_key(model_name, n_ctx, p_hash, profile=""):
+    # profile is load_profiles.profile_tag(): a state saved with a q8_0 cache can't load into f16
+    return hashlib.sha256(f"{model_name}|{n_ctx}|{profile}|{p_hash}".encode("utf-8")).hexdigest()
+
+
+def _compress(data):
+    if HAS_ZSTD:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(data)
+    return "zlib", zlib.compress(data, 1)
+
+
+def _decompress(codec, data):
+    if codec == "zstd":
+        if not HAS_ZSTD:
+            raise RuntimeError("zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def save_state_file(path, state, model_name, n_ctx, role, history, log_text, summary=None, profile=""):
+    """Writes a compressed KV snapshot next to a session log."""
+    p_hash = prompt_hash(state)
+    codec, payload = _compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    meta = {
+        "key": state_key(model_name, n_ctx, p_hash, profile),
+        "model": model_name,
+        "n_ctx": n_ctx,
+        "profile": profile,
+        "prompt_hash": p_hash,
+        "log_hash": text_hash(log_text),
+        "role": role,
+        "history": history,
+        "summary": summary,
+        "codec": codec,
+    }
+    header = json.dumps(meta).encode("utf-8")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(4, "little"))
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return meta
+
+
+def read_state_meta(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        size = int.from_bytes(f.read(4), "little")
+        return json.loads(f.read(size).decode("utf-8"))
+
+
+def load_state_file(path, model_name, n_ctx, log_text=None, profile=""):
+    """
+    Returns (state, meta) if the snapshot matches the loaded model, context size and
+    KV load profile, otherwise (None, reason).
+    """
+    if not os.path.exists(path):
+        return None, "no snapshot"
+
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None, "not a KV snapshot"
+        size = int.from_bytes(f.read(4), "little")
+        meta = json.loads(f.read(size).decode("utf-8"))
+        if meta.get("model") != model_name or meta.get("n_ctx") != n_ctx:
+            return None, f"built for {meta.get('model')} @ n_ctx={meta.get('n_ctx')}"
+        if meta.get("profile", "") != profile:
+            return None, f"built with load profile {meta.get('profile') or 'unknown'}"
+        if log_text is not None and meta.get("log_hash") != text_hash(log_text):
+            return None, "log changed since snapshot was taken"
+        payload = f.read()
+
+    state = pickle.loads(_decompress(meta.get("codec", "zlib"), payload))
+    p_hash = prompt_hash(state)
+    if state_key(model_name, n_ctx, p_hash, profile) != meta.get("key"):
+        return None, "snapshot key mismatch"
+    return state, meta
@@ -0,0 +1,144 @@
+import re
+
+from src.scheduler import BACKGROUND
+
+# Same system prompt for every call so llama.cpp keeps reusing its KV prefix
+SUMMARY_SYSTEM = (
+    "You are a context analysis assistant. Summarize provided documents accurately. "
+    "Keep key facts, names, numbers, decisions and conclusions. Do not invent anything."
+)
+MAP_REPLY_TOKENS = 320
+REDUCE_REPLY_TOKENS = 700
+# Room for the system prompt, the instruction line and template tokens
+PROMPT_OVERHEAD = 160
+
+
+class DocumentSummarizer:
+    """
+    Map-reduce summarization for documents far larger than n_ctx.
+    Map: every token-sized chunk is summarized in order (streamed as progress).
+    Reduce: partial summaries are merged in groups that fit the window, level by level,
+    until one final summary is left.
+    Yields (kind, text) with kind in "progress", "token", "final".
+    """
+
+    def __init__(self, backend, priority=BACKGROUND):
+        self.backend = backend
+        self.priority = priority
+
+    def _chunk_budget(self, reply_tokens):
+        return max(256, self.backend.llm.n_ctx() - reply_tokens - PROMPT_OVERHEAD)
+
+    def split_chunks(self, text, max_tokens):
+        """Packs paragraphs into chunks of at most max_tokens, hard-splitting huge paragraphs."""
+        count = self.backend.count_tokens
+        chunks = []
+        current = []
+        current_tokens = 0
+
+        for para in re.split(r"\n\s*\n", text):
+            para = para.strip()
+            if not para:
+                continue
+            n = count(para)
+            if n > max_tokens:
+                if current:
+                    chunks.append("\n\n".join(current))
+                    current, current_tokens = [], 0
+                tokens = self.backend.llm.tokenize(para.encode("utf-8"), add_bos=False)
+                for i in range(0, len(tokens), max_tokens):
+                    piece = self.backend.llm.detokenize(tokens[i:i + max_tokens]).decode("utf-8", errors="ignore")
+                    chunks.append(piece)
+                continue
+            if current and current_tokens + n > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(para)
+            current_tokens += n + 2
+
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
+
+    def _run(self, user_content, max_tokens, should_stop, collect):
+        """One streamed completion; yields tokens and appends them to collect."""
+        messages = [
+            {"role": "system", "content": SUMMARY_SYSTEM},
+            {"role": "user", "content": user_content},
+        ]
+        with self.backend.llm_lock.hold(self.priority):
+            # Chunk prompts replace whatever tab state was loaded
+            self.backend.active_role = None
+            stream = self.backend.llm.create_chat_completion(
+                messages=messages, stream=True, temperature=0.2, max_tokens=max_tokens,
+                stopping_criteria=self.backend.stop_criteria(should_stop)
+            )
+            for chunk in stream:
+                if should_stop():
+                    return
+                delta = chunk["choices"][0].get("delta", {}) if chunk.get("choices") else {}
+                token = delta.get("content")
+                if token:
+                    collect.append(token)
+                    yield token
+
+    def summarize(self, text, title, should_stop=lambda: False):
+        chunks = self.split_chunks(text, self._chunk_budget(MAP_REPLY_TOKENS))
+        total = len(chunks)
+        if not total:
+            yield "progress", "[SYSTEM]: Nothing to summarize.\n"
+            return
+
+        if total == 1:
+            # Fits in one window, no need for map-reduce
+            yield "progress", f"[SYSTEM]: {title} fits in one pass.\n"
+            out = []
+            prompt = f"Summarize the content of the document: {title}\n\nContent:\n{chunks[0]}"
+            for token in self._run(prompt, REDUCE_REPLY_TOKENS, should_stop, out):
+                yield "token", token
+            yield "final", "".join(out)
+            return
+
+        # MAP
+        partials = []
+        for i, chunk in enumerate(chunks):
+            if should_stop():
+                return
+            yield "progress", f"\n[SYSTEM]: Part {i + 1}/{total}\n"
+            out = []
+            prompt = f"Document: {title} (part {i + 1} of {total})\n\n{chunk}\n\nSummarize this part in a few bullet points."
+            for token in self._run(prompt, MAP_REPLY_TOKENS, should_stop, out):
+                yield "token", token
+            partials.append("".join(out).strip())
+
+        # REDUCE, hierarchically until one group fits the window
+        level = 1
+        group_budget = self._chunk_budget(REDUCE_REPLY_TOKENS)
+        while True:
+            if should_stop():
+                return
+            groups = self.split_chunks("\n\n".join(partials), group_budget)
+            if len(groups) == 1:
+                break
+            yield "progress", f"\n[SYSTEM]: Merging {len(partials)} partial summaries (level {level}, {len(groups)} groups)...\n"
+            merged = []
+            for group in groups:
+                out = []
+                prompt = f"Partial summaries of {title}:\n\n{group}\n\nMerge these into one concise summary."
+                for _ in self._run(prompt, MAP_REPLY_TOKENS, should_stop, out):
+                    if should_stop():
+                        return
+                merged.append("".join(out).strip())
+            if len(merged) >= len(partials):
+                # Not shrinking any more, stop merging
+                partials = merged
+                break
+            partials = merged
+            level += 1
+
+        yield "progress", "\n[SYSTEM]: Final summary\n"
+        out = []
+        prompt = f"Partial summaries of {title}, in document order:\n\n" + "\n\n".join(partials) + "\n\nWrite the final, well structured summary of the whole document."
+        for token in self._run(prompt, REDUCE_REPLY_TOKENS, should_stop, out):
+            yield "token", token
+        yield "final", "".join(out)
@@ -0,0 +1,42 @@
+USER = "user"
+ASSISTANT = "assistant"
+SYSTEM = "system"
+
+
+class Transcript:
+    """
+    Structured conversation for one chat tab.
+    Messages are dicts {"role", "content", "time", "model"}; the textbox only renders
+    the newest `window` of them, and older ones are paged back in on demand.
+    """
+
+    def __init__(self, window=60):
+        self.window = window
+        self.messages = []
+        self.first_rendered = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def append(self, role, content="", time="", model=None):
+        self.messages.append({"role": role, "content": content, "time": time, "model": model})
+        return len(self.messages) - 1
+
+    def update(self, index, **fields):
+        self.messages[index].update(fields)
+
+    def clear(self):
+        self.messages = []
+        self.first_rendered = 0
+
+    def trim(self):
+        """Returns (old_first, new_first): messages in that range should leave the widget."""
+        old_first = self.first_rendered
+        self.first_rendered = max(old_first, len(self.messages) - self.window)
+        return old_first, self.first_rendered
+
+    def page_back(self, count):
+        """Returns (start, end) of the older messages to render above the current window."""
+        end = self.first_rendered
+        self.first_rendered = max(0, end - count)
+        return self.first_rendered, end
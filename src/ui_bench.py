@@ -0,0 +1,335 @@
+import os
+import re
+import sys
+import json
+import time
+import types
+import atexit
+import random
+import shutil
+import datetime
+import platform
+import subprocess
+
+from src import calibration
+from src.benchmark import percentile, summarize_samples, git_commit
+
+STREAMS = ("markdown", "code", "long")
+ROLE = "BENCH"
+
+# Size of the synthetic replies, in tokens
+MARKDOWN_TOKENS = 1500
+CODE_TOKENS = 4000
+LONG_TOKENS = 10000
+
+# Event-loop heartbeat; how late it fires is the lag every other callback sees
+PROBE_MS = 10
+
+# Roughly what a tokenizer emits: word pieces with their leading space, punctuation runs, whitespace runs
+TOKEN_RE = re.compile(r" ?[A-Za-z]{1,6}| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+")
+
+WORDS = (
+    "model cache token prefix window context thread render frame widget stream reply layout buffer "
+    "summary journal memory index search result budget latency queue decode prefill tab session"
+).split()
+LANGS = ("python", "javascript", "rust", "bash", "")
+
+
+def split_tokens(text):
+    return TOKEN_RE.findall(text)
+
+
+def _sentence(rng, inline=True):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    if inline and rng.random() < 0.4:
+        i = rng.randrange(len(words))
+        words[i] = f"**{words[i]}**"
+    if inline and rng.random() < 0.3:
+        i = rng.randrange(len(words))
+        words[i] = f"`{words[i]}()`"
+    return " ".join(words).capitalize() + "."
+
+
+def _markdown_section(rng):
+    parts = [f"{'#' * rng.randint(1, 3)} {_sentence(rng, inline=False)[:-1]}\n\n"]
+    parts.append(" ".join(_sentence(rng) for _ in range(rng.randint(2, 4))) + "\n\n")
+    for i in range(rng.randint(3, 6)):
+        bullet = f"{i + 1}." if rng.random() < 0.5 else "-"
+        parts.append(f"{bullet} {_sentence(rng)}\n")
+    return "".join(parts) + "\n"
+
+
+def _code_block(rng, lines):
+    lang = rng.choice(LANGS)
+    # Some models fence with ''' instead of ```
+    fence = "'''" if rng.random() < 0.15 else "```"
+    body = []
+    depth = 0
+    for _ in range(lines):
+        a, b = rng.choice(WORDS), rng.choice(WORDS)
+        if depth < 3 and rng.random() < 0.2:
+            body.append(f"{'    ' * depth}def {a}_{b}(self, {a}, {b}=None):")
+            depth += 1
+        elif depth and rng.random() < 0.15:
+            depth -= 1
+            body.append(f"{'    ' * depth}return {a}")
+        else:
+            body.append(f"{'    ' * depth}{a} = self.{b}[{rng.randint(0, 999)}] * ({a} + {rng.randint(1, 64)})  # {b}")
+    return f"{fence}{lang}\n" + "\n".join(body) + f"\n{fence}\n\n"
+
+
+def synthetic_reply(kind, n_tokens, seed=0):
+    """Deterministic reply of about n_tokens tokens: markdown-heavy, code-heavy or a long mix of both."""
+    rng = random.Random(f"{kind}:{seed}")
+    parts, count = [], 0
+    while count < n_tokens:
+        if kind == "markdown":
+            part = _markdown_section(rng)
+        elif kind == "code":
+            part = _sentence(rng) + "\n\n" + _code_block(rng, rng.randint(60, 160))
+        else:
+            part = _markdown_section(rng) if rng.random() < 0.6 else _code_block(rng, rng.randint(20, 80))
+        parts.append(part)
+        count += len(split_tokens(part))
+    return "".join(parts)
+
+
+def load_stream(path):
+    """
+    A recorded stream: a JSON list of tokens, JSONL with one token (or {"token": ...}) per line,
+    or plain text that gets split like a tokenizer would.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = f.read()
+    if path.endswith(".json"):
+        return [str(t) for t in json.loads(data)]
+    if path.endswith(".jsonl"):
+        tokens = []
+        for line in data.splitlines():
+            if line.strip():
+                item = json.loads(line)
+                tokens.append(item["token"] if isinstance(item, dict) else str(item))
+        return tokens
+    return split_tokens(data)
+
+
+def default_streams(long_tokens=LONG_TOKENS):
+    sizes = {"markdown": MARKDOWN_TOKENS, "code": CODE_TOKENS, "long": long_tokens}
+    return {kind: split_tokens(synthetic_reply(kind, sizes[kind])) for kind in STREAMS}
+
+
+def ensure_display(use_xvfb=True):
+    """
+    Makes sure Tk has a display. On Linux without $DISPLAY an Xvfb server is started for
+    the lifetime of the process, so the benchmark runs on headless CI machines.
+    """
+    if sys.platform != "linux" or os.environ.get("DISPLAY"):
+        return None
+    if not use_xvfb:
+        raise RuntimeError("No $DISPLAY set and Xvfb disabled.")
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        raise RuntimeError("No $DISPLAY and Xvfb is not installed (apt install xvfb), or run under xvfb-run.")
+    # -displayfd lets the server pick a free display number and report it back
+    read_fd, write_fd = os.pipe()
+    proc = subprocess.Popen([xvfb, "-displayfd", str(write_fd), "-screen", "0", "1920x1080x24", "-nolisten", "tcp"],
+                            pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        display = f.readline().strip()
+    if not display:
+        proc.kill()
+        raise RuntimeError("Xvfb did not start.")
+    os.environ["DISPLAY"] = f":{display}"
+    atexit.register(proc.terminate)
+    print(f"[UIBENCH] Started Xvfb on :{display}")
+    return proc
+
+
+def stream_stats(frames, gaps, lags, tokens, interval_ms):
+    """Per-run numbers from frame costs (tokens, seconds), flush gaps and heartbeat lags (seconds)."""
+    ms = lambda values, p: round(1000 * (percentile(values, p) or 0.0), 3)
+    costs = [cost for _, cost in frames]
+    rendered = sum(n for n, _ in frames)
+    # A flush gap spanning several render intervals means the frames in between never happened
+    dropped = sum(max(0, int(gap * 1000 // interval_ms) - 1) for gap in gaps)
+    return {
+        "tokens": tokens,
+        "frames": len(frames),
+        "token_render_us": round(1e6 * sum(costs) / rendered, 2) if rendered else 0.0,
+        "frame_p50_ms": ms(costs, 50),
+        "frame_p95_ms": ms(costs, 95),
+        "frame_max_ms": round(1000 * max(costs, default=0.0), 3),
+        "lag_p50_ms": ms(lags, 50),
+        "lag_p95_ms": ms(lags, 95),
+        "lag_max_ms": round(1000 * max(lags, default=0.0), 3),
+        "dropped_frames": dropped,
+    }
+
+
+def build_app():
+    """
+    The real RoaApp rendering code on a single chat textbox. Imported lazily: it needs
+    customtkinter and a display.
+    """
+    import customtkinter as ctk
+    from main import RoaApp, RENDER_INTERVAL_MS, MAIN_FONT, BG_COLOR
+    from src.scheduler import GenerationScheduler, GenerationRequest
+
+    class RenderBenchApp(RoaApp):
+        """
+        Replays token streams through prepare_generation, flush_render_queue, append_token,
+        create_code_header and finalize_generation, timing every frame on the way.
+        No model, worker process or journal: only what runs on the Tk thread.
+        """
+
+        def __init__(self, cases, progress=print):
+            ctk.CTk.__init__(self)
+            self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            self.backend = types.SimpleNamespace(current_model_name="Replay")
+            self.configure(fg_color=BG_COLOR)
+            self.scheduler = GenerationScheduler()
+            self.last_responses = {}
+            self.chat_history = {}
+            self.title("Roa.ai // Render Benchmark")
+            self.geometry("1200x800")
+            self.grid_columnconfigure(0, weight=1)
+            self.grid_rowconfigure(0, weight=1)
+
+            # Same widget and tags as the chat tabs
+            self.display = ctk.CTkTextbox(self, font=(MAIN_FONT, 13), spacing1=8, spacing3=8, fg_color="#111214", border_width=1, border_color="#2A2D30", corner_radius=12)
+            self.display.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+            self.configure_textbox_tags(self.display)
+            self.display.configure(state="disabled")
+            self.stop_btn = ctk.CTkButton(self, text="STOP GENERATION", font=(MAIN_FONT, 12, "bold"), fg_color="#EF4444", hover_color="#DC2626")
+            self.stop_btn.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="ew")
+            self.stop_btn.configure(state="disabled")
+
+            self.cases = list(cases)  # [(name, tokens, rate)]
+            self.progress = progress
+            self.results = []
+            self._measure = False
+            self._case = None
+            self.after(RENDER_INTERVAL_MS, self.flush_render_queue)
+            self.after(500, self.next_case)
+
+        def record_message(self, role, msg_role, content, **fields):
+            # Journaling happens on a writer thread, not on the render path
+            pass
+
+        # --- instrumentation ---
+
+        def flush_render_queue(self):
+            if not self._measure:
+                return super().flush_render_queue()
+            start = time.perf_counter()
+            if self._last_flush is not None:
+                self.gaps.append(start - self._last_flush)
+            self._last_flush = start
+            queued = sum(len(request.tokens) for request in self.scheduler.active())
+            super().flush_render_queue()
+            if queued:
+                # Tk lays out and redraws at idle right after this callback; count that work for the frame
+                self.update_idletasks()
+                self.frames.append((queued, time.perf_counter() - start))
+
+        def probe(self, expected):
+            if not self._measure:
+                return
+            now = time.perf_counter()
+            self.lags.append(max(0.0, now - expected))
+            self.after(PROBE_MS, self.probe, now + PROBE_MS / 1000)
+
+        def finalize_generation(self, request):
+            start = time.perf_counter()
+            super().finalize_generation(request)
+            self.update_idletasks()
+            end = time.perf_counter()
+            self.finalize_s = end - start
+            self.duration_s = end - self.started
+            # Time the UI needed after the last token was produced
+            self.tail_s = end - self.produced_at
+            self.after(50, self.finish_case)
+
+        # --- replay ---
+
+        def replay(self, request, tokens, rate):
+            """Producer thread: pushes tokens at rate tokens/s (0 = as fast as possible), like generate_task."""
+            start = time.perf_counter()
+            for i, token in enumerate(tokens):
+                if request.stopped:
+                    break
+                if rate:
+                    delay = start + i / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                request.push(token)
+                request.response += token
+            self.produced_at = time.perf_counter()
+            self.after(0, self.finalize_generation, request)
+
+        def next_case(self):
+            if not self.cases:
+                self.quit()
+                return
+            name, tokens, rate = self._case = self.cases.pop(0)
+            self.clear_chat(self.display)
+            self.update_idletasks()
+            self.frames, self.gaps, self.lags = [], [], []
+            self._last_flush = None
+            self._measure = True
+            self.started = time.perf_counter()
+            self.after(PROBE_MS, self.probe, time.perf_counter() + PROBE_MS / 1000)
+
+            request = GenerationRequest(ROLE, self.display, f"Replay the {name} stream.")
+            self.prepare_generation(request)
+            self.scheduler.submit(request, self.replay, tokens, rate)
+
+        def finish_case(self):
+            self._measure = False
+            name, tokens, rate = self._case
+            sample = stream_stats(self.frames, self.gaps, self.lags, len(tokens), RENDER_INTERVAL_MS)
+            sample["finalize_ms"] = round(1000 * self.finalize_s, 3)
+            sample["duration_s"] = round(self.duration_s, 3)
+            sample["tail_s"] = round(self.tail_s, 3)
+            self.results.append((name, rate, sample))
+            self.progress(f"[UIBENCH] {name} @ {rate or 'max'} tok/s: " + ", ".join(f"{k}={v}" for k, v in sample.items()))
+            self.after(200, self.next_case)
+
+    return RenderBenchApp
+
+
+def run_ui_benchmark(streams, rates=(150,), repeat=3, progress=print, base_dir=None, use_xvfb=True):
+    """
+    streams: {name: [token, ...]}. Every stream is replayed at every rate, repeat times.
+    Returns results in the benchmark JSON layout, one scenario per stream and rate.
+    """
+    ensure_display(use_xvfb)
+    app_class = build_app()
+    cases = [(name, tokens, rate) for name, tokens in streams.items() for rate in rates for _ in range(repeat)]
+    app = app_class(cases, progress=progress)
+    app.mainloop()
+    app.destroy()
+
+    scenarios = {}
+    for name, rate, sample in app.results:
+        key = f"{name}@{rate or 'max'}"
+        scenarios.setdefault(key, {"samples": []})["samples"].append(sample)
+    for scenario in scenarios.values():
+        scenario["stats"] = summarize_samples(scenario["samples"])
+
+    return {
+        "meta": {
+            "mode": "ui",
+            "commit": git_commit(base_dir or os.getcwd()),
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "host": calibration.host_key(),
+            "python": platform.python_version(),
+            "repeat": repeat,
+            "rates": list(rates),
+            "display": os.environ.get("DISPLAY"),
+        },
+        "scenarios": scenarios,
+        # All streams share one Tk session, so only the process-wide peak is meaningful
+        "process_peak_rss_mb": calibration.peak_rss_bytes() // (1024 * 1024),
+    }
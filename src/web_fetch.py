@@ -0,0 +1,207 @@
+import re
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Roa.ai/2.0"
+MAX_PAGE_BYTES = 1_500_000
+MAX_CONNECTIONS = 8
+# Part of a fetch_and_extract budget spent waiting on the network; the rest is left for parsing
+FETCH_SHARE = 0.75
+
+# Page chrome that never holds the article
+NOISE_TAGS = ["script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "iframe"]
+MIN_PASSAGE_CHARS = 40
+
+
+def extract_main_text(html, max_chars=4000):
+    """Pulls readable article text out of a page, skipping navigation and boilerplate."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(NOISE_TAGS):
+        tag.decompose()
+
+    root = soup.find("article") or soup.find("main") or soup.body or soup
+    passages = []
+    for node in root.find_all(["h1", "h2", "h3", "p", "li", "pre", "blockquote"]):
+        text = " ".join(node.get_text(" ", strip=True).split())
+        if len(text) >= MIN_PASSAGE_CHARS or node.name in ("h1", "h2", "h3"):
+            passages.append(text)
+
+    if not passages:
+        passages = [" ".join(root.get_text(" ", strip=True).split())]
+
+    out = []
+    total = 0
+    for p in passages:
+        if total + len(p) > max_chars:
+            break
+        out.append(p)
+        total += len(p) + 1
+    return "\n".join(out)
+
+
+def _shingles(text, size=5):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe_passages(passages, threshold=0.8):
+    """Drops passages that are near-copies (Jaccard over word shingles) of one already kept."""
+    kept = []
+    kept_shingles = []
+    for passage in passages:
+        sh = _shingles(passage)
+        if not sh:
+            continue
+        duplicate = False
+        for other in kept_shingles:
+            union = len(sh | other)
+            if union and len(sh & other) / union >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(passage)
+            kept_shingles.append(sh)
+    return kept
+
+
+class PageFetcher:
+    """
+    Fetches several pages in parallel through one pooled HTTP client and returns
+    whatever finished inside the latency budget. Uses aiohttp on a background
+    event loop when installed, otherwise a pooled requests.Session on threads.
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._loop = None
+        self._session = None
+        self._http = None
+        self._pool = None
+
+    # --- aiohttp path ---
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        return self._loop
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT})
+        return self._session
+
+    async def _fetch_one_async(self, url):
+        session = await self._get_session()
+        async with session.get(url, allow_redirects=True) as resp:
+            if resp.status != 200 or "html" not in resp.headers.get("Content-Type", "html"):
+                return url, None
+            body = await resp.content.read(MAX_PAGE_BYTES)
+            return url, body.decode(resp.charset or "utf-8", errors="replace")
+
+    async def _fetch_all_async(self, urls, budget_s):
+        tasks = [asyncio.ensure_future(self._fetch_one_async(u)) for u in urls]
+        done, pending = await asyncio.wait(tasks, timeout=budget_s)
+        for task in pending:
+            task.cancel()
+        pages = {}
+        for task in done:
+            if not task.cancelled() and task.exception() is None:
+                url, html = task.result()
+                if html:
+                    pages[url] = html
+        return pages
+
+    # --- threaded fallback ---
+
+    def _fetch_one_sync(self, url, budget_s):
+        resp = self._http.get(url, timeout=budget_s, stream=True)
+        try:
+            if resp.status_code != 200 or "html" not in resp.headers.get("Content-Type", "html"):
+                return url, None
+            body = resp.raw.read(MAX_PAGE_BYTES, decode_content=True)
+            return url, body.decode(resp.encoding or "utf-8", errors="replace")
+        finally:
+            resp.close()
+
+    def _fetch_all_sync(self, urls, budget_s):
+        with self._lock:
+            if self._http is None:
+                self._http = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.max_connections, pool_maxsize=self.max_connections)
+                self._http.mount("http://", adapter)
+                self._http.mount("https://", adapter)
+                self._http.headers["User-Agent"] = USER_AGENT
+                self._pool = ThreadPoolExecutor(max_workers=self.max_connections)
+        futures = [self._pool.submit(self._fetch_one_sync, u, budget_s) for u in urls]
+        done, _ = wait(futures, timeout=budget_s)
+        pages = {}
+        for fut in done:
+            if fut.exception() is None:
+                url, html = fut.result()
+                if html:
+                    pages[url] = html
+        return pages
+
+    def fetch_all(self, urls, budget_s=2.0):
+        """Returns {url: html} for the pages that arrived within budget_s seconds."""
+        if not urls:
+            return {}
+        if HAS_AIOHTTP:
+            loop = self._ensure_loop()
+            future = asyncio.run_coroutine_threadsafe(self._fetch_all_async(urls, budget_s), loop)
+            try:
+                return future.result(budget_s + 0.5)
+            except Exception as e:
+                print(f"[FETCH] Fetch failed: {e}")
+                return {}
+        return self._fetch_all_sync(urls, budget_s)
+
+    def fetch_and_extract(self, results, top_n=3, budget_s=2.0, max_chars=4000):
+        """
+        Fetches the top_n result pages in parallel and returns {href: article text},
+        with passages repeated across pages removed. budget_s covers the parsing too:
+        pages still unparsed at the deadline are dropped.
+        """
+        deadline = time.monotonic() + budget_s
+        urls = [r["href"] for r in results[:top_n] if r.get("href")]
+        pages = self.fetch_all(urls, budget_s * FETCH_SHARE)
+
+        extracted = {}
+        seen = []
+        for url in urls:  # keep search ranking order for dedupe priority
+            html = pages.get(url)
+            if not html:
+                continue
+            if time.monotonic() >= deadline:
+                print(f"[FETCH] Out of time, skipping the remaining pages from {url}.")
+                break
+            try:
+                text = extract_main_text(html, max_chars=max_chars)
+            except Exception as e:
+                print(f"[FETCH] Could not parse {url}: {e}")
+                continue
+            # seen is already deduped, so everything past it is new to this page
+            passages = dedupe_passages(seen + text.split("\n"))[len(seen):]
+            if passages:
+                extracted[url] = "\n".join(passages)
+                seen.extend(passages)
+        print(f"[FETCH] Extracted {len(extracted)}/{len(urls)} pages within {budget_s}s.")
+        return extracted
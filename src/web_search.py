@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import time
+import threading
+
+# Words LocalSearchProvider ignores when scoring overlap
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on", "at", "to", "for",
+    "and", "or", "what", "whats", "who", "whos", "how", "when", "where", "which", "why",
+    "do", "does", "did", "can", "could", "please", "tell", "me", "about", "i", "you", "s",
+}
+
+
+def normalize_query(query):
+    """
+    Cache key that survives case, punctuation and spacing changes. Word order and
+    question words stay: "who won X" and "when was X won" are different searches.
+    """
+    words = re.findall(r"\w+", query.lower().replace("'", ""))
+    return " ".join(words) or query.strip().lower()
+
+
+class DDGSProvider:
+    """Live DuckDuckGo search."""
+
+    def search(self, query, max_results=5):
+        from ddgs import DDGS
+        with DDGS() as ddgs:
+            return list(ddgs.text(query, max_results=max_results))
+
+
+class LocalSearchProvider:
+    """
+    Offline stand-in: ranks a fixed list of {"title", "body", "href"} documents
+    (or a JSON file holding one) by word overlap with the query.
+    """
+
+    def __init__(self, documents=None, path=None):
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                documents = json.load(f)
+        self.documents = documents or []
+        self.calls = 0
+
+    def search(self, query, max_results=5):
+        self.calls += 1
+        terms = set(normalize_query(query).split()) - STOP_WORDS
+        scored = []
+        for doc in self.documents:
+            words = set(re.findall(r"\w+", f"{doc.get('title', '')} {doc.get('body', '')}".lower()))
+            score = len(terms & words)
+            if score:
+                scored.append((score, doc))
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return [doc for _, doc in scored[:max_results]]
+
+
+class SearchCache:
+    """On-disk search results keyed by normalized query, with a TTL and an LRU size cap."""
+
+    def __init__(self, path, ttl_seconds=6 * 3600, max_entries=500):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = {}  # {key: {"t": stored_at, "a": last_access, "results": [...]}}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            print(f"[SEARCH] Could not read cache, starting empty: {e}")
+            self.entries = {}
+
+    def save(self):
+        with self._lock:
+            payload = json.dumps(self.entries)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[SEARCH] Could not save cache: {e}")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if now - entry["t"] > self.ttl_seconds:
+                del self.entries[key]
+                return None
+            entry["a"] = now
+            return entry["results"]
+
+    def put(self, key, results):
+        now = time.time()
+        with self._lock:
+            self.entries[key] = {"t": now, "a": now, "results": results}
+            # Expired first, then least recently used
+            for k in [k for k, e in self.entries.items() if now - e["t"] > self.ttl_seconds]:
+                del self.entries[k]
+            if len(self.entries) > self.max_entries:
+                by_access = sorted(self.entries, key=lambda k: self.entries[k]["a"])
+                for k in by_access[:len(self.entries) - self.max_entries]:
+                    del self.entries[k]
+        self.save()
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+        self.save()
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class WebSearcher:
+    """Cached search; identical queries already running are coalesced into one provider call."""
+
+    def __init__(self, provider, cache=None):
+        self.provider = provider
+        self.cache = cache
+        self._inflight = {}  # {key: _InFlight}
+        self._lock = threading.Lock()
+
+    def search(self, query, max_results=5):
+        key = f"{normalize_query(query)}|{max_results}"
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                print(f"[SEARCH] Cache hit for: {query}")
+                return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight()
+
+        if not leader:
+            print(f"[SEARCH] Joining in-flight search for: {query}")
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.results
+
+        try:
+            results = self.provider.search(query, max_results=max_results)
+            flight.results = results
+            if self.cache and results:
+                self.cache.put(key, results)
+            return results
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
@@ -0,0 +1,326 @@
+import time
+import queue
+import itertools
+import threading
+import multiprocessing
+
+from src.cancel import CancelToken, CANCELLED
+
+# Frames on the pipe are (req_id, kind, payload) tuples.
+# Client -> worker: "call" (method, args, kwargs), "stream" (method, args, kwargs), "cancel" None, "shutdown" None
+# Stream kwargs may carry timeout_s / token_limit; the worker turns them into the request's CancelToken
+# Worker -> client: "result" value, "item" value, "end" None, "error" message, "state" {"model": name}
+CALL, STREAM, CANCEL, SHUTDOWN = "call", "stream", "cancel", "shutdown"
+RESULT, ITEM, END, ERROR, STATE = "result", "item", "end", "error", "state"
+
+# Methods the GUI may run in the worker; anything else is rejected
+CALL_METHODS = {
+    "load_model", "prefetch_model", "unload_model", "calibrate_model", "count_tokens", "embed_texts",
+    "discard_role_state", "save_session_state", "resume_session_state", "summarize_history",
+}
+STREAM_METHODS = {"generate_response", "summarize_document"}
+
+# Crash loop guard: past this many restarts in RESTART_WINDOW_S the last model is not reloaded
+MAX_RESTARTS = 3
+RESTART_WINDOW_S = 60
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+def worker_main(conn, backend_kwargs):
+    """Entry point of the inference process: owns the AIBackend and serves requests over conn."""
+    # llama.cpp is only ever imported here, never in the GUI process
+    from src.backend import AIBackend
+    backend = AIBackend(**backend_kwargs)
+    # Startup self-check: KV memory per load profile, from GGUF headers only
+    threading.Thread(target=backend.check_load_profiles, daemon=True).start()
+    send_lock = threading.Lock()
+    tokens = {}  # {req_id: CancelToken} for running streams
+    tokens_lock = threading.Lock()
+
+    def send(frame):
+        with send_lock:
+            conn.send(frame)
+
+    def send_state():
+        send((None, STATE, {"model": backend.current_model_name}))
+
+    def run(req_id, kind, method, args, kwargs):
+        try:
+            fn = getattr(backend, method)
+            if kind == CALL:
+                value = fn(*args, **kwargs)
+                # State first, so the client sees the new model by the time the call returns
+                send_state()
+                send((req_id, RESULT, value))
+            else:
+                with tokens_lock:
+                    cancel = tokens[req_id]
+                kwargs["cancel" if method == "generate_response" else "should_stop"] = cancel
+                gen = fn(*args, **kwargs)
+                try:
+                    for item in gen:
+                        if cancel.cancelled and cancel.reason == CANCELLED:
+                            break
+                        send((req_id, ITEM, item))
+                finally:
+                    gen.close()
+                send_state()
+                send((req_id, END, None))
+        except Exception as e:
+            send_state()
+            send((req_id, ERROR, f"{type(e).__name__}: {e}"))
+        finally:
+            with tokens_lock:
+                tokens.pop(req_id, None)
+
+    while True:
+        try:
+            req_id, kind, payload = conn.recv()
+        except (EOFError, OSError):
+            break
+        if kind == SHUTDOWN:
+            break
+        if kind == CANCEL:
+            with tokens_lock:
+                cancel = tokens.get(req_id)
+            if cancel:
+                cancel.cancel()
+            continue
+        method, args, kwargs = payload
+        allowed = CALL_METHODS if kind == CALL else STREAM_METHODS
+        if method not in allowed:
+            send((req_id, ERROR, f"Unknown method: {method}"))
+            continue
+        if kind == STREAM:
+            # Registered before the thread starts, so an early cancel frame always finds it
+            with tokens_lock:
+                tokens[req_id] = CancelToken(kwargs.pop("timeout_s", None), kwargs.pop("token_limit", None))
+        threading.Thread(target=run, args=(req_id, kind, method, args, kwargs), daemon=True).start()
+
+    with tokens_lock:
+        for cancel in tokens.values():
+            cancel.cancel()
+    try:
+        backend.unload_model()
+    except Exception:
+        pass
+
+
+class InferenceClient:
+    """
+    GUI-side stand-in for AIBackend. Every model call runs in a separate process, so loads,
+    gc and token handling never hold the GUI's GIL and a llama.cpp crash only costs a restart.
+    Streams come back as generators with the same shape as the backend's.
+    """
+
+    def __init__(self, **backend_kwargs):
+        self.backend_kwargs = backend_kwargs
+        self.current_model_name = None
+        self._last_model = None
+        self._ids = itertools.count(1)
+        self._pending = {}  # {req_id: queue.Queue of (kind, payload)}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._restarts = []
+        self._closing = False
+        self._start()
+
+    # --- process management ---
+
+    def _start(self):
+        ctx = multiprocessing.get_context("spawn")
+        parent, child = ctx.Pipe(duplex=True)
+        # Not a daemon: calibration starts its own probe processes from inside the worker
+        self.process = ctx.Process(target=worker_main, args=(child, self.backend_kwargs), name="roa-inference", daemon=False)
+        self.process.start()
+        child.close()
+        self.conn = parent
+        threading.Thread(target=self._read_loop, args=(parent,), daemon=True).start()
+        print(f"[WORKER] Inference process started (pid {self.process.pid}).")
+
+    def _read_loop(self, conn):
+        while True:
+            try:
+                req_id, kind, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            if kind == STATE:
+                self.current_model_name = payload["model"]
+                continue
+            with self._lock:
+                q = self._pending.get(req_id)
+            if q is not None:
+                q.put((kind, payload))
+        if conn is self.conn and not self._closing:
+            self._on_crash()
+
+    def _on_crash(self):
+        self.process.join(timeout=5)
+        code = self.process.exitcode
+        print(f"[WORKER] Inference process died (exit code {code}), restarting.")
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for q in pending.values():
+            q.put((ERROR, "Inference worker crashed and is restarting."))
+
+        self.current_model_name = None
+        now = time.time()
+        self._restarts = [t for t in self._restarts if now - t < RESTART_WINDOW_S] + [now]
+        self._start()
+        if self._last_model and len(self._restarts) <= MAX_RESTARTS:
+            threading.Thread(target=self.load_model, args=self._last_model, daemon=True).start()
+        elif self._last_model:
+            print(f"[WORKER] {len(self._restarts)} crashes in {RESTART_WINDOW_S}s, not reloading {self._last_model[0]}.")
+
+    def close(self):
+        self._closing = True
+        try:
+            with self._send_lock:
+                self.conn.send((None, SHUTDOWN, None))
+            self.process.join(timeout=10)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+
+    # --- protocol ---
+
+    def _send(self, frame):
+        try:
+            with self._send_lock:
+                self.conn.send(frame)
+        except (OSError, ValueError) as e:
+            raise WorkerCrashed(f"Inference worker unavailable: {e}")
+
+    def _open(self, kind, method, args, kwargs):
+        req_id = next(self._ids)
+        q = queue.Queue()
+        with self._lock:
+            self._pending[req_id] = q
+        try:
+            self._send((req_id, kind, (method, args, kwargs)))
+        except Exception:
+            self._close_request(req_id)
+            raise
+        return req_id, q
+
+    def _close_request(self, req_id):
+        with self._lock:
+            self._pending.pop(req_id, None)
+
+    def _call(self, method, *args, **kwargs):
+        req_id, q = self._open(CALL, method, args, kwargs)
+        try:
+            kind, payload = q.get()
+        finally:
+            self._close_request(req_id)
+        if kind == ERROR:
+            raise WorkerCrashed(payload)
+        return payload
+
+    def _stream(self, method, args, kwargs, should_stop=None):
+        req_id, q = self._open(STREAM, method, args, kwargs)
+        finished = False
+        try:
+            while True:
+                try:
+                    kind, payload = q.get(timeout=0.05)
+                except queue.Empty:
+                    if should_stop and should_stop():
+                        return
+                    continue
+                if kind == ITEM:
+                    if should_stop and should_stop():
+                        return
+                    yield payload
+                elif kind == END:
+                    finished = True
+                    return
+                else:
+                    finished = True
+                    raise WorkerCrashed(payload)
+        finally:
+            if not finished:
+                # The consumer stopped early; tell the worker to stop decoding
+                try:
+                    self._send((req_id, CANCEL, None))
+                except WorkerCrashed:
+                    pass
+            self._close_request(req_id)
+
+    # --- AIBackend interface ---
+
+    def load_model(self, model_choice, speculative=None):
+        try:
+            res = self._call("load_model", model_choice, speculative)
+        except WorkerCrashed as e:
+            return f"Critical Load Error: {e}"
+        if res.startswith("Success"):
+            self._last_model = (model_choice, speculative)
+        return res
+
+    def prefetch_model(self, model_choice, speculative=None):
+        try:
+            return self._call("prefetch_model", model_choice, speculative)
+        except WorkerCrashed:
+            return False
+
+    def unload_model(self):
+        self._last_model = None
+        try:
+            return self._call("unload_model")
+        except WorkerCrashed:
+            return False
+
+    def calibrate_model(self, model_choice):
+        try:
+            return self._call("calibrate_model", model_choice)
+        except WorkerCrashed as e:
+            return f"Error: Calibration failed: {e}"
+
+    def count_tokens(self, text):
+        return self._call("count_tokens", text)
+
+    def embed_texts(self, texts):
+        return self._call("embed_texts", texts)
+
+    def discard_role_state(self, role):
+        try:
+            self._call("discard_role_state", role)
+        except WorkerCrashed:
+            pass  # a restarted worker has no cached states anyway
+
+    def save_session_state(self, log_path, role, history, log_text, summary=None):
+        try:
+            return self._call("save_session_state", log_path, role, history, log_text, summary)
+        except WorkerCrashed as e:
+            return f"Error: Could not save state: {e}"
+
+    def resume_session_state(self, log_path, log_text=None):
+        try:
+            return self._call("resume_session_state", log_path, log_text)
+        except WorkerCrashed as e:
+            print(f"[CACHE] Could not resume: {e}")
+            return None
+
+    def summarize_history(self, previous_summary, messages):
+        try:
+            return self._call("summarize_history", previous_summary, messages)
+        except WorkerCrashed as e:
+            print(f"[HISTORY] Summary failed: {e}")
+            return None
+
+    def generate_response(self, user_input, should_stop=lambda: False, **kwargs):
+        try:
+            yield from self._stream("generate_response", (user_input,), kwargs, should_stop=should_stop)
+        except WorkerCrashed as e:
+            yield f"\n[ERROR]: {e}"
+
+    def summarize_document(self, text, title, should_stop=lambda: False, **kwargs):
+        try:
+            yield from self._stream("summarize_document", (text, title), kwargs, should_stop=should_stop)
+        except WorkerCrashed as e:
+            yield "progress", f"\n[ERROR]: {e}"
@@ -0,0 +1,27 @@
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("bs4")
+
+from src import calibration
+from src.benchmark import RssSampler
+
+
+def test_rss_sampler_measures_one_scenario():
+    if not calibration.current_rss_bytes():
+        pytest.skip("RSS is not readable on this platform")
+    block = bytearray(64 * 1024 * 1024)
+    del block
+    # The freed block still counts toward the process peak, but not toward the next scenario
+    with RssSampler(interval=0.005) as rss:
+        time.sleep(0.05)
+    assert rss.report()["rss_growth_mb"] < 32
+    assert rss.report()["peak_rss_mb"] * 1024 * 1024 < calibration.peak_rss_bytes()
+
+    with RssSampler(interval=0.005) as rss:
+        block = bytearray(64 * 1024 * 1024)
+        time.sleep(0.05)
+        del block
+    assert rss.report()["rss_growth_mb"] >= 48
@@ -0,0 +1,55 @@
+from src.context_budget import ContextPlanner, Source
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def plan_turn(planner, memory_text, history=None, recall=None, web=None):
+    sources = [
+        Source("memory", text=memory_text, priority=1.0, stable=True),
+        Source("history", messages=history, priority=2.0),
+        Source("recall", text=recall, priority=1.0),
+        Source("web", text=web, priority=1.0),
+        Source("input", text="hello there", priority=1.0),
+    ]
+    trimmed, report = planner.plan("system", sources)
+    return trimmed, report
+
+
+def test_stable_share_does_not_depend_on_other_sources():
+    planner = ContextPlanner(count_words, n_ctx=4096, reply_tokens=2048)
+    memory_text = " ".join(f"Fact {i} was noted." for i in range(1000))
+    first, _ = plan_turn(planner, memory_text)
+    history = [{"role": "user", "content": "word " * 400}, {"role": "assistant", "content": "word " * 400}]
+    second, _ = plan_turn(planner, memory_text, history=history, recall="some recalled text", web="web " * 300)
+    # Same memory text on both turns, so the shared KV prefix stays reusable
+    assert first["memory"] and first["memory"] == second["memory"]
+
+
+def test_reply_tokens_stay_an_upper_bound():
+    planner = ContextPlanner(count_words, n_ctx=8192, reply_tokens=2048)
+    _, report = plan_turn(planner, "short memory")
+    assert report["reply"] == 2048
+
+
+def test_trim_text_cuts_unpunctuated_text():
+    planner = ContextPlanner(count_words, n_ctx=2000, reply_tokens=256)
+    text = " ".join(f"w{i}" for i in range(500))
+    head = planner.trim_text(text, 90)
+    tail = planner.trim_text(text, 90, keep="tail")
+    assert head and text.startswith(head) and count_words(head) <= 100
+    assert tail and text.endswith(tail) and count_words(tail) <= 100
+
+
+def test_trim_text_cuts_a_single_word_by_characters():
+    planner = ContextPlanner(len, n_ctx=2000, reply_tokens=256)
+    text = "x" * 300
+    assert planner.trim_text(text, 100) == "x" * 97
+
+
+def test_trim_text_keeps_whole_sentences_when_they_fit():
+    planner = ContextPlanner(count_words, n_ctx=2000, reply_tokens=256)
+    text = "One two three. Four five six. Seven eight nine. Ten eleven twelve."
+    assert planner.trim_text(text, 9) == "One two three. Four five six."
+    assert planner.trim_text(text, 9, keep="tail") == "Seven eight nine. Ten eleven twelve."
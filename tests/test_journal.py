@@ -0,0 +1,78 @@
+import os
+import threading
+from array import array
+
+from src.journal import SessionJournal, read_log_text, INDEX_EXT
+
+
+def test_append_and_read_back(tmp_path):
+    path = str(tmp_path / "Diary_2026-01-10.jsonl")
+    journal = SessionJournal(path)
+    journal.append("user", "hello")
+    journal.append("assistant", "hi there", model="Coder Mode")
+
+    records = SessionJournal(path, readonly=True).records()
+    assert [r["content"] for r in records] == ["hello", "hi there"]
+    assert records[1]["model"] == "Coder Mode"
+
+
+def test_readonly_never_writes(tmp_path):
+    path = str(tmp_path / "Random_2026-01-10.jsonl")
+    journal = SessionJournal(path)
+    journal.append("user", "one")
+    # A record whose index entry hasn't been written yet, plus a torn tail
+    with open(path, "ab") as f:
+        f.write(b'{"role": "assistant", "content": "two"}\n{"role": "us')
+    stat = os.stat(path)
+    os.utime(path + INDEX_EXT, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10 ** 9))
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + INDEX_EXT, "rb") as f:
+        index = f.read()
+
+    reader = SessionJournal(path, readonly=True)
+    assert [r["content"] for r in reader.records()] == ["one", "two"]
+    with open(path, "rb") as f:
+        assert f.read() == data
+    with open(path + INDEX_EXT, "rb") as f:
+        assert f.read() == index
+
+
+def test_concurrent_writer_and_readers(tmp_path):
+    path = str(tmp_path / "Coder_2026-01-10.jsonl")
+    writer = SessionJournal(path)
+    total = 300
+    done = threading.Event()
+    errors = []
+
+    def write():
+        for i in range(total):
+            writer.append("user" if i % 2 == 0 else "assistant", f"message {i}")
+        done.set()
+
+    def read():
+        while not done.is_set():
+            try:
+                records = SessionJournal(path, readonly=True).records()
+                assert [r["content"] for r in records] == [f"message {i}" for i in range(len(records))]
+                read_log_text(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for t in readers:
+        t.start()
+    write()
+    for t in readers:
+        t.join()
+
+    assert not errors
+    offsets = array("Q")
+    with open(path + INDEX_EXT, "rb") as f:
+        offsets.frombytes(f.read())
+    scanned, end = SessionJournal(path, readonly=True)._scan(open(path, "rb").read())
+    assert list(offsets) == list(scanned) and len(offsets) == total
+    assert len(SessionJournal(path).records()) == total
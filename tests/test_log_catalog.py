@@ -0,0 +1,23 @@
+import os
+
+from src.log_catalog import LogCatalog, CATALOG_FILE
+
+
+def test_batched_updates_save_once(tmp_path):
+    logs = tmp_path / "diary_logs"
+    logs.mkdir()
+    catalog = LogCatalog(str(tmp_path), ["diary_logs"])
+    catalog.refresh()
+    saved = os.stat(tmp_path / CATALOG_FILE).st_mtime_ns
+
+    path = logs / "session.txt"
+    for i in range(5):
+        path.write_text("line\n" * (i + 1), encoding="utf-8")
+        catalog.update_file(str(path), save=False)
+    assert catalog.dirty
+    assert os.stat(tmp_path / CATALOG_FILE).st_mtime_ns == saved
+    assert catalog.entries() == [(str(path), "session.txt", 25)]
+
+    catalog.save()
+    assert not catalog.dirty
+    assert LogCatalog(str(tmp_path), ["diary_logs"]).entries() == [(str(path), "session.txt", 25)]
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from src.markdown_stream import MarkdownStream, TEXT, CODE_START, CODE_END
+
+SAMPLES = [
+    "# Title\n\nSome **bold** text with `inline code` and a list:\n- one\n- two\n1. first\n2) second\n",
+    "```python\ndef f(x):\n    return x * 2\n```\nAfter the block.\n",
+    "'''js\nconsole.log('mixed fences')\n'''\n``` unterminated\ncode until the end",
+    "Stars * alone ** and ``double`` ticks, `unclosed inline\n## Heading with **bold**\n",
+    "Line\n```\n``` immediately closed\n#not a heading\n-not a list\n10. ten\n",
+]
+
+PIECES = ["#", "## ", "- ", "1. ", "**", "*", "`", "``", "```", "'''", "python", "\n", " ", "word", "x = 1", "\n\n"]
+
+
+def parse(chunks):
+    md = MarkdownStream()
+    events = []
+    for chunk in chunks:
+        events += md.feed(chunk)
+    return normalize(events + md.close())
+
+
+def normalize(events):
+    """Merges adjacent text runs with the same tag; chunking may split them differently."""
+    out = []
+    for kind, text, tag in events:
+        if kind == TEXT and out and out[-1][0] == TEXT and out[-1][2] == tag:
+            out[-1] = (TEXT, out[-1][1] + text, tag)
+        elif kind != TEXT or text:
+            out.append((kind, text, tag))
+    return out
+
+
+def random_splits(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 12)))) if len(text) > 1 else []
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+def random_text(rng):
+    return "".join(rng.choice(PIECES) for _ in range(rng.randint(1, 40)))
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_per_character_matches_whole_text(text):
+    assert parse(list(text)) == parse([text])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_splits_match_whole_text(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        text = rng.choice(SAMPLES) if rng.random() < 0.3 else random_text(rng)
+        expected = parse([text])
+        assert parse(random_splits(text, rng)) == expected, text
+        assert parse(list(text)) == expected, text
+
+
+def tagged(text):
+    """Whole-text parse as [(tag, text)] runs, with fences shown as ("start", lang) and ("end", None)."""
+    out = []
+    for kind, value, tag in parse([text]):
+        if kind == CODE_START:
+            out.append(("start", value))
+        elif kind == CODE_END:
+            out.append(("end", None))
+        else:
+            out.append((tag, value))
+    return out
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("a **b** c", [(None, "a "), ("bold", "b"), (None, " c")]),
+    ("a *b* c", [(None, "a "), ("italic", "b"), (None, " c")]),
+    ("***both*** x", [("bold", "both"), (None, " x")]),
+    ("**Note:** done", [("bold", "Note:"), (None, " done")]),
+    ("use `x = 1` here", [(None, "use "), ("code_inline", "x = 1"), (None, " here")]),
+    ("# Title **b**\nbody", [("heading", "Title b"), (None, "\nbody")]),
+    ("- one\n2) two", [("list_bullet", "\u2022 "), (None, "one\n"), ("list_bullet", "2) "), (None, "two")]),
+    ("```py\nx = 1\n```\nafter", [("start", "py"), ("code_block", "x = 1\n"), ("end", None), (None, "\nafter")]),
+    ("'''\nuse ``` here\n'''", [("start", "Code"), ("code_block", "use ``` here\n"), ("end", None)]),
+    # Literal stars: no flanking opener, intraword runs and lone stars
+    ("5*3**2", [(None, "5*3**2")]),
+    ("a * b ** c", [(None, "a * b ** c")]),
+    ("snake_case*ptr", [(None, "snake_case*ptr")]),
+    # Unclosed styles end with the line
+    ("**open\nplain", [("bold", "open"), (None, "\nplain")]),
+])
+def test_expected_tags(text, expected):
+    assert tagged(text) == expected
+
+
+def test_backticks_mid_line_stay_inside_a_fence():
+    text = "```\nprint('``` not a fence')\n```\n"
+    assert tagged(text) == [("start", "Code"), ("code_block", "print('``` not a fence')\n"), ("end", None), (None, "\n")]
+    # Per-character streaming agrees
+    assert parse(list(text)) == parse([text])
@@ -0,0 +1,52 @@
+import os
+import json
+
+from src.memory_index import MemoryIndex
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_update_rewrites_only_its_shard(tmp_path):
+    logs = tmp_path / "diary_logs"
+    logs.mkdir()
+    a, b = str(logs / "a.txt"), str(logs / "b.txt")
+    write(a, "The trip to Lisbon is planned for May.")
+    write(b, "Refactor the parser before the release.")
+    index = MemoryIndex(str(tmp_path / "memory_index"))
+    index.sync([str(logs)])
+    shard_a, shard_b = index._shard_path(a), index._shard_path(b)
+    before = os.stat(shard_b).st_mtime_ns
+
+    write(a, "The trip to Lisbon moved to June.")
+    index.update_file(a)
+    assert os.stat(shard_b).st_mtime_ns == before
+    assert "June" in json.load(open(shard_a, encoding="utf-8"))["chunks"].popitem()[1]["text"]
+
+    reloaded = MemoryIndex(str(tmp_path / "memory_index"))
+    assert reloaded.search("Lisbon trip", k=1)[0][0] == a
+
+    os.remove(b)
+    reloaded.sync([str(logs)])
+    assert not os.path.exists(shard_b)
+
+
+def test_unchanged_chunks_are_not_embedded_again(tmp_path):
+    calls = []
+
+    def embedder(texts):
+        calls.append(list(texts))
+        return [[1.0, float(len(t))] for t in texts]
+
+    path = str(tmp_path / "log.txt")
+    write(path, "first message")
+    index = MemoryIndex(str(tmp_path / "idx"), embedder=embedder)
+    index.update_file(path)
+    write(path, "first message\n" + "x" * 1500)
+    index.update_file(path)
+    assert len(calls) == 2
+    assert "first message" not in calls[1]
+    assert all(chunk["emb"] for chunk in index.chunks.values())
+
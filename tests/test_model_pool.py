@@ -0,0 +1,82 @@
+import pytest
+
+pytest.importorskip("llama_cpp")
+
+from src.model_pool import ModelPool
+
+GB = 1024 ** 3
+
+
+class StubLlama:
+    def __init__(self, model_path, **kwargs):
+        self.model_path = model_path
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(vram_gb, vram_by_path, fail=()):
+    failures = list(fail)
+
+    def loader(model_path, **kwargs):
+        if failures and failures[0] == model_path:
+            failures.pop(0)
+            raise RuntimeError("failed to allocate buffer")
+        return StubLlama(model_path, **kwargs)
+
+    pool = ModelPool(loader, budget_bytes=100 * GB, vram_budget_bytes=vram_gb * GB)
+    pool.estimate_vram_bytes = lambda path, load_kwargs: vram_by_path[path] * GB
+    return pool
+
+
+def test_vram_evicts_the_kept_model():
+    pool = make_pool(7, {"coder.gguf": 6, "dc.gguf": 4})
+    coder = pool.acquire("Coder Mode", "coder.gguf", {"n_gpu_layers": -1})
+    pool.acquire("Dark Champion", "dc.gguf", {"n_gpu_layers": 15}, keep={"Coder Mode"})
+    assert pool.resident() == ["Dark Champion"]
+    assert coder.llm is None
+
+
+def test_ram_only_models_stay_resident():
+    pool = make_pool(7, {"coder.gguf": 6, "cpu.gguf": 0})
+    pool.acquire("Coder Mode", "coder.gguf", {"n_gpu_layers": -1})
+    pool.acquire("CPU", "cpu.gguf", {"n_gpu_layers": 0}, keep={"Coder Mode"})
+    assert set(pool.resident()) == {"Coder Mode", "CPU"}
+
+
+def test_prefetch_never_evicts_the_model_in_use():
+    pool = make_pool(7, {"coder.gguf": 6, "dc.gguf": 4})
+    pool.acquire("Coder Mode", "coder.gguf", {"n_gpu_layers": -1})
+    assert not pool.prefetch("Dark Champion", "dc.gguf", {"n_gpu_layers": 15}, keep={"Coder Mode"})
+    assert pool.resident() == ["Coder Mode"]
+
+
+def test_failed_load_evicts_lru_and_retries():
+    pool = make_pool(100, {"a.gguf": 1, "b.gguf": 1, "c.gguf": 1}, fail=["c.gguf"])
+    pool.acquire("A", "a.gguf", {})
+    pool.acquire("B", "b.gguf", {})
+    entry = pool.acquire("C", "c.gguf", {})
+    assert entry.llm.model_path == "c.gguf"
+    assert pool.resident() == ["B", "C"]
+
+
+def test_failed_load_without_anything_to_evict_raises():
+    pool = make_pool(100, {"a.gguf": 1}, fail=["a.gguf"])
+    with pytest.raises(RuntimeError):
+        pool.acquire("A", "a.gguf", {})
+
+
+def test_ram_estimate_uses_the_gguf_kv_size(tmp_path, monkeypatch):
+    from src import load_profiles
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"\0" * 1024)
+    dims = {"n_layer": 40, "n_head_kv": 8, "head_dim_k": 128, "head_dim_v": 128, "n_ctx_train": 32768, "file_bytes": 1024}
+    monkeypatch.setattr(load_profiles, "model_dims", lambda p: dims)
+    kv = load_profiles.kv_cache_bytes(dims, 8192, "q8_0", "q8_0")
+    kwargs = {"n_ctx": 8192, "type_k": 8, "type_v": 8}
+
+    assert ModelPool.estimate_bytes(str(path), dict(kwargs, n_gpu_layers=0)) == 1024 + kv
+    # Offloaded layers keep their KV cache in VRAM
+    assert ModelPool.estimate_bytes(str(path), dict(kwargs, n_gpu_layers=20)) == 1024 + kv // 2
+    assert ModelPool.estimate_bytes(str(path), dict(kwargs, n_gpu_layers=-1)) == 1024
@@ -0,0 +1,59 @@
+import io
+import zipfile
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src import repo_ingest
+from src.repo_ingest import RepoIngester, parse_github_url
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://github.com/a/b", ("a", "b", None)),
+    ("git@github.com:a/b.git", ("a", "b", None)),
+    ("https://github.com/a/b/tree/main", ("a", "b", "main")),
+    ("https://github.com/a/b/tree/main/src/pkg/", ("a", "b", "main/src/pkg")),
+    ("https://github.com/a/b/tree/feature/x/src?tab=readme", ("a", "b", "feature/x/src")),
+    ("https://github.com/a/b/blob/v1.0/README.md#L3", ("a", "b", "v1.0/README.md")),
+])
+def test_parse_github_url(url, expected):
+    assert parse_github_url(url) == expected
+
+
+def test_resolve_ref_path_splits_slash_refs(tmp_path, monkeypatch):
+    ingester = RepoIngester(str(tmp_path))
+    refs = {"feature/x": "f" * 40, "main": "a" * 40}
+    monkeypatch.setattr(ingester, "lookup_commit", lambda owner, repo, ref: refs.get(ref))
+    assert ingester.resolve_ref_path("a", "b", "feature/x/src/pkg") == ("feature/x", "f" * 40, "src/pkg")
+    assert ingester.resolve_ref_path("a", "b", "main/src") == ("main", "a" * 40, "src")
+    assert ingester.resolve_ref_path("a", "b", "main") == ("main", "a" * 40, "")
+
+
+def make_zip(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, text in files.items():
+            zf.writestr("b-main/" + name, text)
+    buf.seek(0)
+    return zipfile.ZipFile(buf)
+
+
+def test_list_zip_filters_on_subdir():
+    zf = make_zip({"README.md": "top", "src/pkg/a.py": "a = 1", "src/pkg/README.md": "pkg", "src/other.py": "x"})
+    files = RepoIngester.__new__(RepoIngester).list_zip(zf, "src/pkg")
+    assert [f[0] for f in files] == ["README.md", "a.py"]
+    assert files[0][2]() == b"pkg"
+
+
+def test_digest_reads_only_the_files_it_keeps(monkeypatch):
+    zf = make_zip({"README.md": "readme " * 50, **{f"mod{i}.py": "code " * 400 for i in range(50)}})
+    reads = []
+    real_read = zf.read
+    monkeypatch.setattr(zf, "read", lambda info: reads.append(info.filename) or real_read(info))
+    ingester = RepoIngester.__new__(RepoIngester)
+    files = ingester.list_zip(zf)
+    assert reads == []
+    digest = ingester.build_digest("a/b", files, budget_tokens=1500, count_tokens=lambda t: len(t.split()))
+    assert "### README.md" in digest
+    assert 0 < len(reads) < 10
@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("llama_cpp")
+
+from src.model_pool import PoolEntry
+from src.backend import AIBackend
+
+
+class StubLlama:
+    def __init__(self, draft_model=None):
+        self.draft_model = draft_model
+        self.cache = None
+        self.saved = 0
+
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def save_state(self):
+        self.saved += 1
+        return object()
+
+
+def backend_with(llm):
+    backend = AIBackend.__new__(AIBackend)
+    backend.entry = PoolEntry("Coder Mode", llm, "coder.gguf", {}, 0)
+    backend.llm = llm
+    return backend
+
+
+def test_speculative_entry_keeps_no_snapshots():
+    llm = StubLlama(draft_model=object())
+    backend = backend_with(llm)
+    backend.snapshot_role_state("CODER")
+    assert llm.saved == 0
+    assert llm.cache is None
+    assert backend.role_states.get("CODER") is None
+
+
+def test_plain_entry_snapshots():
+    llm = StubLlama()
+    backend = backend_with(llm)
+    backend.snapshot_role_state("CODER")
+    assert llm.saved == 1
+    assert llm.cache is backend.prefix_cache
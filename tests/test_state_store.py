@@ -0,0 +1,23 @@
+from array import array
+
+from src import load_profiles, state_store
+
+
+class FakeState:
+    def __init__(self, tokens):
+        self.input_ids = array("i", tokens)
+        self.n_tokens = len(tokens)
+
+
+def test_snapshot_only_loads_under_its_load_profile(tmp_path):
+    path = str(tmp_path / "Diary.kvstate")
+    q8 = load_profiles.profile_tag(load_profiles.llama_kwargs(load_profiles.normalize({"type_k": "q8_0", "type_v": "q8_0", "flash_attn": True}), 4096))
+    f16 = load_profiles.profile_tag(load_profiles.llama_kwargs(load_profiles.normalize({"type_k": "f16", "type_v": "f16", "flash_attn": False}), 4096))
+    assert q8 == "type_k=q8_0,type_v=q8_0,flash_attn=True"
+
+    state_store.save_state_file(path, FakeState([1, 2, 3]), "Bench A", 4096, "diary", [], "log", profile=q8)
+    state, meta = state_store.load_state_file(path, "Bench A", 4096, "log", profile=q8)
+    assert state.n_tokens == 3 and meta["profile"] == q8
+
+    state, reason = state_store.load_state_file(path, "Bench A", 4096, "log", profile=f16)
+    assert state is None and "load profile" in reason
@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("bs4")
+
+from src import web_fetch
+from src.web_fetch import PageFetcher
+
+
+def test_extraction_counts_against_the_budget(monkeypatch):
+    fetcher = PageFetcher()
+    budgets = []
+
+    def fetch_all(urls, budget_s):
+        budgets.append(budget_s)
+        return {u: "<p>page</p>" for u in urls}
+
+    def slow_extract(html, max_chars=4000):
+        time.sleep(0.2)
+        return "a passage with enough words in it to be kept"
+
+    monkeypatch.setattr(fetcher, "fetch_all", fetch_all)
+    monkeypatch.setattr(web_fetch, "extract_main_text", slow_extract)
+    monkeypatch.setattr(web_fetch, "dedupe_passages", lambda passages: passages)
+    results = [{"href": f"https://example.com/{i}"} for i in range(5)]
+
+    started = time.monotonic()
+    pages = fetcher.fetch_and_extract(results, top_n=5, budget_s=0.5)
+    assert time.monotonic() - started < 0.5 + 0.2 + 0.1
+    assert budgets[0] < 0.5
+    assert 1 <= len(pages) < 5
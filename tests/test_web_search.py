@@ -0,0 +1,10 @@
+from src.web_search import normalize_query
+
+
+def test_normalize_query_ignores_case_punctuation_and_spacing():
+    assert normalize_query("  Who won   the World Cup?") == normalize_query("who won the world cup")
+
+
+def test_normalize_query_keeps_order_and_question_words():
+    assert normalize_query("dog bites man") != normalize_query("man bites dog")
+    assert normalize_query("who won the cup") != normalize_query("when was the cup won")